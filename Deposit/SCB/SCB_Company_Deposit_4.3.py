@@ -1,19 +1,35 @@
 import os 
+import sys
 import json
 import time
 import random
 import ctypes
 import atexit
-import hashlib
 import logging
 import requests
 import subprocess
 from pathlib import Path
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from collections import deque
 from datetime import datetime
 from dotenv import load_dotenv
 from logging.handlers import RotatingFileHandler
 from datetime import datetime, timezone, timedelta
 from playwright.sync_api import sync_playwright, expect
+from deposit_store import DepositStore
+from deposit_outbox import DepositOutbox
+
+# ================= Shared Modules =================
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..")))
+from common.eric_client import ERIC
+from common.resource_blocker import ResourceBlocker
+from common.wait_engine import WaitEngine
+from common.chrome_manager import ChromeManager
+from common.session_state import SessionState
+
+# Page state races instead of sequential popup probes
+WAIT = WaitEngine("scb_company_deposit")
 
 # ================= Load .env Credentials =========
 
@@ -60,137 +76,632 @@ scb_web = {
     "chrome_path": os.getenv("chrome_path")
 }
 
+# Chrome of the deposit bot (profile / path of the .env, CDP port of WorkerSettings, reused after a bot restart)
+CHROME = ChromeManager(
+    "scb_company_deposit",
+    profile=scb_web["chrome_profile"],
+    exe=scb_web["chrome_path"],
+    # args=["--headless=new", "--window-size=1920,1080", "--force-device-scale-factor=1"],    # headless mode needs the window size (small screen otherwise)
+)
+
 # Chrome 
 class Automation:
 
-    # Chrome CDP 
-    chrome_proc = None
+    # Resource blocker profile of the bank portal (common/resource_blocker.py)
+    RESOURCE_PROFILE = "scb"
+
+    # Block images / fonts / media / trackers of a new page, bytes and time saved are logged per page load
+    @classmethod
+    def block_resources(cls, page):
+        return ResourceBlocker(cls.RESOURCE_PROFILE).attach(page)
+
+    # Chrome CDP (attach to the running Chrome of the profile, else launch it, common/chrome_manager.py)
     @classmethod
     def chrome_CDP(cls):
+        if CHROME.ensure():
+            print("Chrome launched.....\n\n")
+
+    # Close Chrome CDP (only a Chrome launched by this bot)
+    @classmethod
+    def cleanup(cls):
+        print("Gracefully terminating Chrome...")
+        CHROME.stop()
+
+# Transaction XHR Capture
+class TxResponseCapture:
+
+    """
+    Listen to the XHR/fetch responses of the SCB "Latest Transactions" widget
+    and turn the transaction JSON into the same records the DOM extraction returns.
+    If no matching response is seen, the caller falls back to DOM scraping.
+    The JSON field names are guesses, so the records are only used once they were
+    checked against one DOM extraction of the same page (verify(): same signatures).
+    On a mismatch the capture is off for the session (DOM only), on a match the
+    capture is pinned to the path of that response (the real endpoint).
+    """
+
+    # Response URL path must contain one of these words (lowercase), override with SCB_TX_API_PATTERN=a,b,c
+    URL_PATTERNS = [x.strip().lower() for x in os.getenv("SCB_TX_API_PATTERN", "transaction,statement").split(",") if x.strip()]
+
+    # Possible JSON field names for each transaction value
+    DATETIME_KEYS = ["transactionDateTime", "txnDateTime", "transactionDatetime", "postingDateTime", "dateTime", "transactionDate", "txnDate", "postingDate", "date"]
+    TIME_KEYS = ["transactionTime", "txnTime", "postingTime", "time"]
+    CODE_KEYS = ["transactionCode", "txnCode", "transactionType", "code"]
+    NOTE_KEYS = ["description", "transactionDescription", "txnDescription", "remark", "note", "narrative", "details"]
+    AMOUNT_KEYS = ["amount", "txnAmount", "transactionAmount", "creditAmount"]
+    CURRENCY_KEYS = ["currency", "currencyCode", "ccy"]
+
+    # Possible paging parameter names (query string or JSON body) of the transaction request
+    PAGE_SIZE_KEYS = ["pageSize", "size", "limit", "rowsPerPage", "perPage", "recordsPerPage"]
+    PAGE_NO_KEYS = ["pageNumber", "pageNo", "page", "pageIndex", "currentPage"]
+    OFFSET_KEYS = ["offset", "startIndex", "skip"]
+
+    def __init__(self, page):
+        self.page = page
+        self.latest = None          # newest → oldest transaction records
+        self.received_at = 0        # time.time() of the last matching response
+        self.expected_since = 0     # time.time() of the last reload / next page
+        self.last_request = None    # last transaction request, replayed by refetch()
+        self.latest_path = None     # URL path of the response of self.latest
+        self.endpoint = None        # URL path of the verified transaction endpoint
+        self.verified = None        # None = not checked yet, True = same as the DOM, False = off
+        page.on("response", self._on_response)
+
+    # Call before page.reload() / next page, so old data is not reused
+    def expect_refresh(self):
+        self.expected_since = time.time()
+
+    # Return captured transactions newer than the last refresh, or None (use DOM)
+    def transactions(self, timeout=3000):
+
+        # Never seen a matching response on this page (or turned off), don't wait for it
+        if self.latest is None or self.verified is False:
+            return None
+
+        deadline = time.time() + timeout / 1000
+        while self.received_at < self.expected_since:
+            if time.time() >= deadline:
+                return None
+            # let Playwright dispatch the pending response events
+            self.page.wait_for_timeout(50)
+        return self.latest
+
+    # Handle every response, keep only transaction JSON
+    def _on_response(self, response):
+        try:
+            if response.request.resource_type not in ("xhr", "fetch"):
+                return
+            path = urlsplit(response.url).path.lower()
+            if self.verified is False:
+                return
+            if self.endpoint is not None and path != self.endpoint:
+                return
+            if not any(p in path for p in self.URL_PATTERNS):
+                return
+            if "json" not in (response.headers.get("content-type") or ""):
+                return
+
+            items = self.find_tx_list(response.json())
+            if items is None:
+                return
+
+            # Remember the request, so the widget can be refreshed without page reload
+            request = response.request
+            self.last_request = {
+                "url": request.url,
+                "method": request.method,
+                "headers": {k: v for k, v in request.all_headers().items() if not k.startswith(":") and k != "content-length"},
+                "post_data": request.post_data,
+            }
+
+            self.store(items, response.url)
+
+        except Exception as e:
+            logger.debug("Transaction response ignored (%s): %s", response.url, e)
+
+    # Replay the last transaction request (refresh only the widget data, no page reload, verified capture only)
+    def refetch(self):
+        if not self.last_request or not self.verified:
+            return False
+
+        req = self.last_request
+        self.expect_refresh()
 
-        # User Profile
-        USER_DATA_DIR = rf"{scb_web['chrome_profile']}"
-
-        # Step 1: Start Chrome normally
-        cls.chrome_proc = subprocess.Popen([
-            rf"{scb_web['chrome_path']}",
-            "--remote-debugging-port=9222",
-            "--disable-session-crashed-bubble",
-            "--hide-crash-restore-bubble",
-            "--no-first-run",
-            "--no-default-browser-check",
-            f"--user-data-dir={USER_DATA_DIR}",  # User Profile
-            # "--headless=new",                    # ------> if want to use headless mode, use --windows-size together, due to headless mode small screen size
-            # "--window-size=1920,1080",           # ✅ simulate full HD
-            # "--force-device-scale-factor=1",     # ✅ ensure no zoom scalin
-        ],
-        stdout=subprocess.DEVNULL,  # ✅ hide chrome cdp logs
-        stderr=subprocess.DEVNULL   # ✅ hide chrome cdp logs
+        response = self.page.request.fetch(
+            req["url"],
+            method=req["method"],
+            headers=req["headers"],
+            data=req["post_data"],
+            timeout=10000,
         )
-        print("Chrome launched.....\n\n")
-    
-        # wait for Chrome CDP launch...
-        cls.wait_for_cdp_ready()
+        if not response.ok:
+            logger.debug("Transaction refetch failed: HTTP %s", response.status)
+            return False
+
+        items = self.find_tx_list(response.json())
+        if items is None:
+            return False
 
-        atexit.register(cls.cleanup)
+        self.store(items, req["url"])
+        return True
+
+    # Normalize and keep the newest transaction list
+    def store(self, items, url):
+        records = self.normalize_list(items)
+        self.latest = records
+        self.latest_path = urlsplit(url).path.lower()
+        self.received_at = time.time()
+        logger.debug("Captured %s transactions from %s", len(records), url)
+
+    # Check the captured records against one DOM extraction of the same page:
+    # every DOM row must have the same signature in the records (None = nothing to compare yet)
+    def verify(self, records, dom_records):
+        if not dom_records:
+            return None
+        signatures = {tx["signature"] for tx in records}
+        missing = [tx["signature"] for tx in dom_records if tx["signature"] not in signatures]
+        if missing:
+            self.verified = False
+            self.latest = None
+            self.last_request = None
+            logger.warning(
+                "Transaction XHR records differ from the page (%s of %s rows, e.g. %r), XHR capture off for this session",
+                len(missing), len(dom_records), missing[0],
+            )
+        else:
+            self.verified = True
+            self.endpoint = self.latest_path
+            logger.info("Transaction XHR records match the page (%s rows), endpoint %s", len(dom_records), self.endpoint)
+        return self.verified
 
-    # Close Chrome CDP
+    # Normalize a JSON transaction list, newest → oldest (same order as the page)
     @classmethod
-    def cleanup(cls):
+    def normalize_list(cls, items):
+        records = []
+        for item in items:
+            tx = cls.normalize(item)
+            if tx:
+                records.append(tx)
+        records.sort(key=lambda x: x["dt"] or datetime.min, reverse=True)
+        return records
+
+    # Parameters of a transaction request: (params, True if JSON body / False if query string)
+    @staticmethod
+    def request_params(request):
+        if request["post_data"]:
+            try:
+                body = json.loads(request["post_data"])
+                if isinstance(body, dict):
+                    return body, True
+            except ValueError:
+                pass
+        return dict(parse_qsl(urlsplit(request["url"]).query)), False
+
+    # Copy of a transaction request with the paging changed (None if it has no paging parameter)
+    @classmethod
+    def paged_request(cls, request, page_index, page_size):
+        params, is_json = cls.request_params(request)
+        page_key = next((k for k in cls.PAGE_NO_KEYS if k in params), None)
+        offset_key = next((k for k in cls.OFFSET_KEYS if k in params), None)
+        size_key = next((k for k in cls.PAGE_SIZE_KEYS if k in params), None)
+        if not page_key and not offset_key:
+            return None
+
         try:
-            print("Gracefully terminating Chrome...")
-            cls.chrome_proc.terminate()
-        except Exception as e:
-            print(f"Error terminating Chrome: {e}")
-    
-    # Wait for Chrome CDP to be ready
+            if size_key:
+                params[size_key] = page_size
+            else:
+                page_size = 20
+            if page_key:
+                # keep the portal's numbering (0 or 1 based) from the captured first page
+                params[page_key] = request.get("page_base", 0) + page_index
+            else:
+                params[offset_key] = page_index * page_size
+        except ValueError:
+            return None
+
+        if is_json:
+            return dict(request, post_data=json.dumps(params))
+        parts = urlsplit(request["url"])
+        return dict(request, url=urlunsplit(parts._replace(query=urlencode(params))))
+
+    # Page through the transaction API (newest → oldest) until a row is older than `since`
+    # Returns (records, pages) or None when the request cannot be paged (use DOM paging)
+    def fetch_pages(self, since, page_size=100, max_pages=200):
+        if not self.last_request or not self.verified:
+            return None
+
+        # Freeze the captured first page request, remember its page number base
+        request = dict(self.last_request)
+        params, _ = self.request_params(request)
+        page_key = next((k for k in self.PAGE_NO_KEYS if k in params), None)
+        try:
+            request["page_base"] = int(params[page_key]) if page_key else 0
+        except (ValueError, TypeError):
+            return None
+        if self.paged_request(request, 0, page_size) is None:
+            return None
+
+        records = {}
+        previous_first = None
+        pages = 0
+        for page_index in range(max_pages):
+            req = self.paged_request(request, page_index, page_size)
+            response = self.page.request.fetch(
+                req["url"],
+                method=req["method"],
+                headers=req["headers"],
+                data=req["post_data"],
+                timeout=15000,
+            )
+            if not response.ok:
+                logger.debug("Transaction API paging failed: HTTP %s", response.status)
+                return None
+
+            items = self.find_tx_list(response.json())
+            if items is None:
+                return None
+            pages += 1
+            if not items:
+                break
+
+            page_records = self.normalize_list(items)
+
+            # Same first row as the last page = the paging parameter is ignored by the portal
+            first_signature = page_records[0]["signature"] if page_records else None
+            if first_signature is not None and first_signature == previous_first:
+                logger.debug("Transaction API ignores the paging parameter, fallback to DOM paging")
+                return None
+            previous_first = first_signature
+
+            for tx in page_records:
+                records.setdefault(tx["signature"], tx)
+
+            # Stop as soon as the oldest row is before the window, or the last page was short
+            dts = [tx["dt"] for tx in page_records if tx["dt"]]
+            if (dts and min(dts) < since) or len(items) < page_size:
+                break
+
+        return sorted(records.values(), key=lambda x: x["dt"] or datetime.min, reverse=True), pages
+
+    # Find the first list of dicts that looks like transactions
+    @classmethod
+    def find_tx_list(cls, data):
+        if isinstance(data, list):
+            if data and all(isinstance(x, dict) for x in data) and cls.pick(data[0], cls.AMOUNT_KEYS) is not None:
+                return data
+            for x in data:
+                found = cls.find_tx_list(x)
+                if found is not None:
+                    return found
+        elif isinstance(data, dict):
+            for value in data.values():
+                found = cls.find_tx_list(value)
+                if found is not None:
+                    return found
+        return None
+
+    # First non empty value from a list of keys
+    @staticmethod
+    def pick(item, keys):
+        for key in keys:
+            value = item.get(key)
+            if value not in (None, ""):
+                return value
+        return None
+
+    # Parse ISO string / epoch ms / dd/mm/yyyy into datetime (GMT+7 local time)
     @staticmethod
-    def wait_for_cdp_ready(timeout=10):
-        """Wait until Chrome CDP is ready at http://localhost:9222/json"""
-        for _ in range(timeout):
+    def parse_datetime(value):
+        if isinstance(value, (int, float)):
+            return datetime.fromtimestamp(value / 1000, tz=timezone(timedelta(hours=7))).replace(tzinfo=None)
+        text = str(value).strip()
+        if text.isdigit():
+            return datetime.fromtimestamp(int(text) / 1000, tz=timezone(timedelta(hours=7))).replace(tzinfo=None)
+        try:
+            dt = datetime.fromisoformat(text.replace("Z", "+00:00"))
+            if dt.tzinfo:
+                dt = dt.astimezone(timezone(timedelta(hours=7))).replace(tzinfo=None)
+            return dt
+        except ValueError:
+            pass
+        for fmt in ("%d/%m/%Y %H:%M:%S", "%d/%m/%Y %H:%M", "%d/%m/%Y", "%Y-%m-%d"):
             try:
-                res = requests.get("http://localhost:9222/json")
-                if res.status_code == 200:
-                    return True
-            except:
+                return datetime.strptime(text, fmt)
+            except ValueError:
+                continue
+        return None
+
+    # Convert one JSON transaction into the DOM record format (same signature)
+    @classmethod
+    def normalize(cls, item):
+        dt = None
+        raw_dt = cls.pick(item, cls.DATETIME_KEYS)
+        if raw_dt is not None:
+            dt = cls.parse_datetime(raw_dt)
+
+        # Date and time in separated fields
+        raw_time = cls.pick(item, cls.TIME_KEYS)
+        if dt is not None and raw_time is not None and dt.hour == 0 and dt.minute == 0:
+            try:
+                hh, mm = str(raw_time).split(":")[:2]
+                dt = dt.replace(hour=int(hh), minute=int(mm))
+            except ValueError:
                 pass
-            time.sleep(1)
-        raise RuntimeError("Chrome CDP is not ready after waiting.")
+
+        raw_amount = cls.pick(item, cls.AMOUNT_KEYS)
+        if dt is None or raw_amount is None:
+            return None
+
+        try:
+            amount_value = float(str(raw_amount).replace(",", ""))
+        except ValueError:
+            return None
+        currency = cls.pick(item, cls.CURRENCY_KEYS) or "THB"
+
+        code = str(cls.pick(item, cls.CODE_KEYS) or "").strip()
+        note = str(cls.pick(item, cls.NOTE_KEYS) or "").strip()
+
+        # Ignore FE, X2, or any other codes you list
+        if code in ["FE", "X2"]:
+            return None
+
+        return Bank_Bot.build_tx_record(
+            dt.strftime("%d/%m/%Y"),
+            dt.strftime("%H:%M"),
+            code,
+            note,
+            f"{amount_value:,.2f} {currency}",
+        )
+
+# Adaptive Poll Scheduler
+class PollScheduler:
+
+    """
+    Decide how long to wait before the next transaction refresh.
+    More deposits in the last BUSY_WINDOW seconds = shorter interval,
+    no deposits (or night time) = longer interval.
+    Also keeps the detection latency of the recent deposits for reporting.
+    """
+
+    MIN_INTERVAL = float(os.getenv("POLL_MIN_SECONDS", "5"))        # busy hours
+    MAX_INTERVAL = float(os.getenv("POLL_MAX_SECONDS", "30"))       # quiet day time
+    NIGHT_INTERVAL = float(os.getenv("POLL_NIGHT_SECONDS", "60"))   # quiet night time
+    NIGHT_HOURS = range(1, 7)                                       # 01:00 - 06:59
+    BUSY_WINDOW = 15 * 60                                           # count deposits of last 15 minutes
+    FULL_RELOAD_EVERY = 10 * 60                                     # still do a full page reload every 10 minutes
+
+    def __init__(self):
+        self.deposits = deque()             # time.time() of each detected deposit
+        self.latencies = deque(maxlen=200)  # seconds, from transaction to detection
+        self.last_poll_at = time.time()
+        self.last_full_reload = time.time()
+
+    # Record the deposits found by this poll
+    def record(self, tx_datetimes):
+        now = time.time()
+        for dt in tx_datetimes:
+            self.deposits.append(now)
+            if dt is None:
+                continue
+            # transaction time only has minute resolution, so also cap it by the time since last poll
+            latency = min(now - dt.timestamp(), now - self.last_poll_at)
+            self.latencies.append(max(0.0, latency))
+        self.last_poll_at = now
+
+    # Seconds to wait before the next refresh
+    def next_interval(self):
+        now = time.time()
+        while self.deposits and now - self.deposits[0] > self.BUSY_WINDOW:
+            self.deposits.popleft()
+
+        recent = len(self.deposits)
+        if recent == 0:
+            return self.NIGHT_INTERVAL if datetime.now().hour in self.NIGHT_HOURS else self.MAX_INTERVAL
+
+        return max(self.MIN_INTERVAL, self.MAX_INTERVAL / (1 + recent))
+
+    # True when the periodic full page reload is due
+    def full_reload_due(self):
+        return time.time() - self.last_full_reload >= self.FULL_RELOAD_EVERY
+
+    def full_reload_done(self):
+        self.last_full_reload = time.time()
+
+    # Make the next refresh a full page reload
+    def force_full_reload(self):
+        self.last_full_reload = 0
+
+    # Detection latency summary
+    def report(self):
+        if not self.latencies:
+            return f"Detection latency: no deposits yet | next interval {self.next_interval():.0f}s"
+        values = sorted(self.latencies)
+        avg = sum(values) / len(values)
+        p95 = values[min(len(values) - 1, int(len(values) * 0.95))]
+        return (
+            f"Detection latency ({len(values)} deposits): avg {avg:.1f}s, p95 {p95:.1f}s, "
+            f"max {values[-1]:.1f}s | recent deposits {len(self.deposits)} | next interval {self.next_interval():.0f}s"
+        )
+
+# Account Session
+class AccountSession:
+
+    """
+    One monitored SCB account inside the shared Chrome:
+    its browser context / page, XHR capture, poll scheduler, deposit history
+    and the time of its next poll. The first account uses the default Chrome
+    context (profile cookies), the others get their own context (own login).
+    The login of every account is saved encrypted (SESSION_STATE_KEY) and
+    restored when the account is opened again.
+    """
+
+    def __init__(self, account, history_db, legacy_file=None, own_context=False):
+        self.account = account
+        self.name = str(account.get("toAccount"))
+        self.history_db = history_db
+        self.legacy_file = legacy_file
+        self.own_context = own_context
+        self.context = None
+        self.page = None
+        self.tx_capture = None
+        self.blocker = None
+        self.scheduler = PollScheduler()
+        self.store = None
+        self.range_scan_done = False
+        self.needs_refresh = False
+        self.next_poll_at = 0
+        self.counter = 1
+        self.failures = 0           # failed opens in a row (reopen backoff)
+        self.errors = 0             # minor poll errors in a row
+        self.saved_login = SessionState(f"scb_company_deposit_{self.name}")
+
+    # Close the page (and the own context), the session is opened again on its next turn
+    def close(self):
+        try:
+            if self.own_context and self.context is not None:
+                self.context.close()
+            elif self.page is not None:
+                self.page.close()
+        except Exception:
+            pass
+        self.context = None
+        self.page = None
+        self.tx_capture = None
+        self.blocker = None
 
 # Bank Bot
 class Bank_Bot(Automation):
 
-    # Load Last seen file 
+    # Deposit history (SQLite WAL), old last_seen.txt is imported on first start
+    # (single .env account; with accounts.json every account has deposit_history_<toAccount>.db)
+    HISTORY_DB = Path(__file__).parent / "deposit_history.db"
     LAST_SEEN_FILE = Path(__file__).parent / "last_seen.txt"
 
-    # Time Range for start time and end time
-    TIME_RANGE = None  # (start_time, end_time) as datetime.time objects
+    # Accounts to monitor in one Chrome: accounts.json (list of scb_web like dicts), else the .env account
+    ACCOUNTS_FILE = Path(os.getenv("SCB_ACCOUNTS_FILE", str(Path(__file__).parent / "accounts.json")))
+    ACCOUNTS = []
 
-    # if False, then perform Historical Backfill scan (Old Transaction based on time range scan)
-    RANGE_SCAN_DONE = False
+    # Account being polled (activate() switches them, Playwright sync runs in one thread)
+    SESSION = None
+    ACCOUNT = scb_web
 
-    # Load Last Seen
-    @classmethod
-    def load_last_seen_list(cls):
-        """
-        Load up to 20 stored transactions from last_seen.txt
-        newest → oldest
-        """
+    # Seconds between the first poll of each account, retry delay cap of a failing account
+    STAGGER_SECONDS = float(os.getenv("POLL_STAGGER_SECONDS", "2"))
+    REOPEN_BACKOFF_MAX = 300
 
-        # Read last_seen.txt 
-        file_path = cls.LAST_SEEN_FILE
+    # Eric callbacks outbox (SQLite), delivered by a background sender thread
+    OUTBOX_DB = Path(__file__).parent / "deposit_outbox.db"
+    OUTBOX = None
 
-        # if the .txt file is not exist, then return empty
-        if not file_path.exists():
-            return []
+    # Keep history forever unless DEPOSIT_HISTORY_KEEP_DAYS is set
+    HISTORY_KEEP_DAYS = int(os.getenv("DEPOSIT_HISTORY_KEEP_DAYS", "0")) or None
+
+    # Time Range for start time and end time
+    TIME_RANGE = None  # (start_datetime, end_datetime), may cross midnight
+
+    # Backfill paging: rows per API page, safety cap of pages
+    BACKFILL_PAGE_SIZE = int(os.getenv("BACKFILL_PAGE_SIZE", "100"))
+    BACKFILL_MAX_PAGES = int(os.getenv("BACKFILL_MAX_PAGES", "200"))
 
-        # open the last_seen.txt file as clean and non empty one
-        with file_path.open("r", encoding="utf-8") as f:
-            lines = [x.strip() for x in f.readlines() if x.strip()]
+    # Max transactions read from one page of the table (raised when "Rows per page" is raised)
+    ROWS_PER_PAGE = 20
 
-        return lines[:20]
+    # Transaction XHR capture of the current account page (None = DOM scraping only)
+    TX_CAPTURE = None
 
-    # Save Last Seen
+    # Adaptive poll interval + detection latency report of the current account
+    SCHEDULER = None
+
+    # Load the accounts to monitor
     @classmethod
-    def save_last_seen(cls, new_tx):
-        """
-        Insert a new transaction at the top and keep newest 20 only.
-        """
-        max_items = 20
-        file_path = cls.LAST_SEEN_FILE
+    def load_accounts(cls):
+        if cls.ACCOUNTS_FILE.exists():
+            with cls.ACCOUNTS_FILE.open("r", encoding="utf-8") as f:
+                entries = json.load(f)
+
+            # Missing keys (deviceID, merchant_code ...) are taken from .env
+            cls.ACCOUNTS = [
+                AccountSession(
+                    dict(scb_web, **entry),
+                    Path(__file__).parent / f"deposit_history_{entry['toAccount']}.db",
+                    own_context=index > 0,
+                )
+                for index, entry in enumerate(entries)
+            ]
+        else:
+            cls.ACCOUNTS = [AccountSession(scb_web, cls.HISTORY_DB, legacy_file=cls.LAST_SEEN_FILE)]
 
-        items = cls.load_last_seen_list()
+        print(f"Monitoring {len(cls.ACCOUNTS)} account(s): {', '.join(s.name for s in cls.ACCOUNTS)}")
+        return cls.ACCOUNTS
 
-        if new_tx not in items:
-            items.insert(0, new_tx)
+    # Switch every per-account class attribute to this session
+    @classmethod
+    def activate(cls, session):
+        cls.SESSION = session
+        cls.ACCOUNT = session.account
+        cls.TX_CAPTURE = session.tx_capture
+        cls.SCHEDULER = session.scheduler
 
-        items = items[:max_items]
+    # Open Deposit History Store of the current account
+    @classmethod
+    def history(cls):
+        session = cls.SESSION
+        if session.store is None:
+            session.store = DepositStore(session.history_db, legacy_file=session.legacy_file)
+            session.store.compact(cls.HISTORY_KEEP_DAYS)
+        return session.store
+
+    # Open Eric Outbox and start the sender thread
+    @classmethod
+    def outbox(cls):
+        if cls.OUTBOX is None:
+            cls.OUTBOX = DepositOutbox(cls.OUTBOX_DB, client=ERIC)
+            cls.OUTBOX.start()
+        return cls.OUTBOX
 
-        with file_path.open("w", encoding="utf-8") as f:
-            f.write("\n".join(items))
+    # Save Last Seen (one atomic write)
+    @classmethod
+    def save_last_seen(cls, new_tx):
+        cls.history().mark_sent(new_tx)
 
-    # use to validate the start time and end time inputs (HH:MM), if invalid return none
+    # use to validate the start time and end time inputs ("dd/mm/yyyy HH:MM" or "HH:MM" = today), if invalid return none
     @staticmethod
     def parse_time_input(value):
+        for fmt in ("%d/%m/%Y %H:%M", "%Y-%m-%d %H:%M"):
+            try:
+                return datetime.strptime(value, fmt)
+            except Exception:
+                continue
         try:
-            return datetime.strptime(value, "%H:%M").time()
+            t = datetime.strptime(value, "%H:%M").time()
+            return datetime.combine(datetime.now().date(), t)
         except Exception:
             return None
-    
-    # Max keep 20 transactions data, if more than that, remove the old one
+
+    # Start/End input text → (start_datetime, end_datetime), raise ValueError with the reason
     @classmethod
-    def replace_last_seen(cls, items):
-        max_items = 20
-        file_path = cls.LAST_SEEN_FILE
-        items = items[:max_items]
-        with file_path.open("w", encoding="utf-8") as f:
-            f.write("\n".join(items))
+    def parse_time_range(cls, start_text, end_text):
+        start_dt = cls.parse_time_input(start_text)
+        end_dt = cls.parse_time_input(end_text)
+        if not start_dt or not end_dt:
+            raise ValueError("Invalid time format. Use HH:MM or dd/mm/yyyy HH:MM.")
+
+        # "23:00" - "01:00" (time only) crosses midnight, start is yesterday
+        if start_dt > end_dt and ":" in start_text and "/" not in start_text and "-" not in start_text:
+            start_dt -= timedelta(days=1)
 
+        if start_dt > end_dt:
+            raise ValueError("Start time is later than end time.")
+
+        # End minute is inclusive (transactions only have minute resolution)
+        return start_dt, end_dt.replace(second=59)
+    
     @classmethod
     def seed_last_seen_from_page(cls, page):
         tx_list = cls.extract_page_transactions(page)  # newest -> oldest
         if tx_list:
-            cls.replace_last_seen(tx_list)
+            cls.history().mark_many(tx_list)
     
     # ---------- Detection helpers ----------
     # detect the first transaction, because different laptop or chrome have different website element 
@@ -214,7 +725,74 @@ class Bank_Bot(Automation):
                 continue
         print("⚠️ Transaction start index not detected, using fallback 45")
         return 45
-    
+
+    # True = read the whole transaction table with one page.evaluate (fast), False = read cell by cell (old way)
+    FAST_EXTRACT = True
+
+    # Runs inside the browser: collect every MuiTypography-body1 text, detect the first transaction
+    # block (date/time pair between index 35-55) and cut it into 12-row transactions, all in one round trip
+    EXTRACT_TX_JS = """
+        (maxTx = 20) => {
+            const texts = Array.from(
+                document.querySelectorAll("p[class*='MuiTypography-body1']"),
+                el => (el.innerText || "").trim()
+            );
+            const isDate = t => /^\\d{1,2}\\/\\d{1,2}\\/\\d{4}$/.test(t);
+            const isTime = t => /^\\d{1,2}:\\d{2}$/.test(t);
+
+            let start = -1;
+            for (let offset = 35; offset < 56; offset++) {
+                if (texts.length - offset < 12) continue;
+                if (isDate(texts[offset]) && isTime(texts[offset + 1])) {
+                    start = offset;
+                    break;
+                }
+            }
+            const detected = start !== -1;
+            if (!detected) start = 45;
+
+            const usable = texts.length - start;
+            const txCount = usable > 0 ? Math.min(maxTx, Math.floor(usable / 12)) : 0;
+
+            const transactions = [];
+            for (let n = 0; n < txCount; n++) {
+                const block = texts.slice(start + n * 12, start + (n + 1) * 12);
+                transactions.push({
+                    date: block[0],
+                    time: block[1],
+                    code: block[2],
+                    note: block[3],
+                    amount: block[4]
+                });
+            }
+            return { rowCount: texts.length, start: start, detected: detected, transactions: transactions };
+        }
+    """
+
+    # Build one transaction record (same format for fast and old extraction)
+    @staticmethod
+    def build_tx_record(date, time, code, note, amount):
+
+        signature = f"{date} {time}|{note}|{amount}"
+        dt_obj = None
+        time_obj = None
+        try:
+            dt_obj = datetime.strptime(f"{date} {time}", "%d/%m/%Y %H:%M")
+            time_obj = dt_obj.time()
+        except Exception:
+            pass
+
+        return {
+            "date": date,
+            "time": time,
+            "time_obj": time_obj,
+            "dt": dt_obj,
+            "code": code,
+            "note": note,
+            "amount": amount,
+            "signature": signature
+        }
+
     # Extract Transactions
     @classmethod
     def extract_page_transactions_raw(cls, page):
@@ -223,8 +801,71 @@ class Bank_Bot(Automation):
         Extracts collapsed transaction data only.
         Each transaction = 12 rows.
         First transaction may start around index 40-45.
+        Uses the captured transaction XHR response when available,
+        else the single page.evaluate extraction when FAST_EXTRACT is on,
+        else the cell by cell extraction.
         """
 
+        # Transactions from the captured XHR response (no render, no offset guessing)
+        if cls.TX_CAPTURE is not None and cls.TX_CAPTURE.page is page:
+            captured = cls.TX_CAPTURE.transactions()
+            if captured is not None:
+                if cls.TX_CAPTURE.verified:
+                    return captured
+
+                # Not checked yet: use the XHR records only if they have the signatures of the DOM rows
+                dom = cls.extract_page_transactions_dom(page)
+                if cls.TX_CAPTURE.verify(captured, dom):
+                    return captured
+                return dom
+            logger.debug("No transaction response captured, fallback to DOM scraping")
+
+        return cls.extract_page_transactions_dom(page)
+
+    # Extract Transactions from the rendered table
+    @classmethod
+    def extract_page_transactions_dom(cls, page):
+        if cls.FAST_EXTRACT:
+            try:
+                return cls.extract_page_transactions_fast(page)
+            except Exception as e:
+                print("⚠️ Fast extraction failed, fallback to cell by cell:", e)
+                logger.warning("Fast extraction failed, fallback to cell by cell: %s", e)
+
+        return cls.extract_page_transactions_cells(page)
+
+    # Extract Transactions (one page.evaluate round trip)
+    @classmethod
+    def extract_page_transactions_fast(cls, page):
+
+        started = time.perf_counter()
+
+        # Read the whole transaction table inside the browser
+        result = page.evaluate(cls.EXTRACT_TX_JS, cls.ROWS_PER_PAGE)
+
+        if not result["detected"]:
+            print("⚠️ Transaction start index not detected, using fallback 45")
+
+        # Ignore FE, X2, or any other codes you list
+        ignore_codes = ["FE", "X2"]
+
+        transactions = [
+            cls.build_tx_record(tx["date"], tx["time"], tx["code"], tx["note"], tx["amount"])
+            for tx in result["transactions"]
+            if tx["code"] not in ignore_codes
+        ]
+
+        logger.debug(
+            "Fast extraction: %s rows, start=%s, %s tx in %.1f ms",
+            result["rowCount"], result["start"], len(transactions), (time.perf_counter() - started) * 1000
+        )
+
+        return transactions
+
+    # Extract Transactions (cell by cell, old way)
+    @classmethod
+    def extract_page_transactions_cells(cls, page):
+
         # Extract all the rows (transfer name, account number, amount, date)
         # Count total rows of Transactions
         rows = page.locator("//p[contains(@class,'MuiTypography-body1')]")
@@ -239,8 +880,8 @@ class Bank_Bot(Automation):
         if usable <= 0:
             return []
 
-        # Limit to 20 because SCB only shows max 20 transactions per page then divide by 12, to know how many new transaction
-        tx_count = min(20, usable // 12)
+        # Limit to ROWS_PER_PAGE (SCB shows 20 transactions per page by default) then divide by 12, to know how many new transaction
+        tx_count = min(cls.ROWS_PER_PAGE, usable // 12)
         
         # Use to store transaction
         transactions = []
@@ -266,25 +907,7 @@ class Bank_Bot(Automation):
                 # print(f"⚠️ Ignored {code} transaction")
                 continue
 
-            signature = f"{date} {time}|{note}|{amount}"
-            dt_obj = None
-            time_obj = None
-            try:
-                dt_obj = datetime.strptime(f"{date} {time}", "%d/%m/%Y %H:%M")
-                time_obj = dt_obj.time()
-            except Exception:
-                pass
-
-            transactions.append({
-                "date": date,
-                "time": time,
-                "time_obj": time_obj,
-                "dt": dt_obj,
-                "code": code,
-                "note": note,
-                "amount": amount,
-                "signature": signature
-            })
+            transactions.append(cls.build_tx_record(date, time, code, note, amount))
 
         return transactions
 
@@ -304,6 +927,24 @@ class Bank_Bot(Automation):
                 return loc.first
         return None
     
+    # Text of the transaction rows, used to know when the table has changed
+    TABLE_SNAPSHOT_JS = """
+        () => Array.from(document.querySelectorAll("p[class*='MuiTypography-body1']"), el => el.innerText).slice(35).join("|")
+    """
+
+    # Wait until the table text differs from the snapshot (instead of a fixed sleep)
+    @classmethod
+    def wait_table_changed(cls, page, snapshot, timeout=5000):
+        try:
+            page.wait_for_function(
+                f"(before) => ({cls.TABLE_SNAPSHOT_JS})() !== before",
+                arg=snapshot,
+                timeout=timeout,
+            )
+            return True
+        except Exception:
+            return False
+
     # next page button
     @classmethod
     def go_next_page(cls, page):
@@ -324,68 +965,172 @@ class Bank_Bot(Automation):
             return False
         try:
             if btn.is_enabled():
+                if cls.TX_CAPTURE is not None:
+                    cls.TX_CAPTURE.expect_refresh()
+                snapshot = page.evaluate(cls.TABLE_SNAPSHOT_JS)
                 btn.click()
-                time.sleep(1)
+                # Wait for the next page rows to render
+                cls.wait_table_changed(page, snapshot)
                 return True
         except Exception:
             pass
         return False
-    
-    # ---------- Range scan ----------
-    @classmethod
-    def scan_transactions_in_time_range(cls, page, start_time, end_time):
 
-        time.sleep(1)
-        
-        if not start_time or not end_time:
-            return
+    # Select the biggest "Rows per page" option of the table, fewer pages to click (None if not available)
+    @classmethod
+    def raise_rows_per_page(cls, page):
+        try:
+            select = page.locator("//p[contains(normalize-space(),'Rows per page')]/following::div[@aria-haspopup='listbox'][1]")
+            if select.count() == 0:
+                return None
+            select.click(timeout=2000)
+
+            options = page.locator("li[role='option']")
+            options.first.wait_for(state="visible", timeout=2000)
+            sizes = {}
+            for i in range(options.count()):
+                text = options.nth(i).inner_text().strip()
+                if text.isdigit():
+                    sizes[int(text)] = options.nth(i)
+            if not sizes:
+                page.keyboard.press("Escape")
+                return None
+
+            biggest = max(sizes)
+            if biggest <= cls.ROWS_PER_PAGE:
+                page.keyboard.press("Escape")
+                return None
+
+            if cls.TX_CAPTURE is not None:
+                cls.TX_CAPTURE.expect_refresh()
+            snapshot = page.evaluate(cls.TABLE_SNAPSHOT_JS)
+            sizes[biggest].click()
+            cls.wait_table_changed(page, snapshot, timeout=10000)
+
+            cls.ROWS_PER_PAGE = biggest
+            return biggest
+        except Exception as e:
+            logger.debug("Rows per page not changed: %s", e)
+            return None
 
-        if start_time > end_time:
-            print("⚠️ Start time is later than end time. Skipping range scan.")
-            return
+    # ---------- Range scan (backfill) ----------
+    # Collect the transactions of the whole range, newest → oldest, stop paging once older than start
+    @classmethod
+    def collect_range_transactions(cls, page, start_dt):
 
-        history = set(cls.load_last_seen_list())
-        matched = []
-        while True:
+        # 1. Transaction API paging (big pages, no rendering), once the XHR records were checked against the page
+        if cls.TX_CAPTURE is not None and cls.TX_CAPTURE.page is page:
+            if cls.TX_CAPTURE.verified is None:
+                cls.extract_page_transactions_raw(page)
+            try:
+                result = cls.TX_CAPTURE.fetch_pages(start_dt, cls.BACKFILL_PAGE_SIZE, cls.BACKFILL_MAX_PAGES)
+                if result is not None:
+                    records, pages = result
+                    return records, pages, "api"
+            except Exception as e:
+                logger.debug("Transaction API paging failed, fallback to DOM paging: %s", e)
+
+        # 2. DOM paging, with as many rows per page as the portal allows
+        rows = cls.raise_rows_per_page(page)
+        if rows:
+            logger.info("Backfill: rows per page raised to %s", rows)
+
+        records = {}
+        pages = 0
+        while pages < cls.BACKFILL_MAX_PAGES:
             txs = cls.extract_page_transactions_raw(page)
+            pages += 1
             if not txs:
                 break
-
-            times = []
             for tx in txs:
-                tx_time = tx.get("time_obj")
-                if tx_time:
-                    times.append(tx_time)
-                if tx_time and start_time <= tx_time <= end_time:
-                    if tx["signature"] not in history:
-                        matched.append(tx)
-
-            if not times:
-                break
+                records.setdefault(tx["signature"], tx)
 
-            oldest = min(times)
-            if oldest < start_time:
+            dts = [tx["dt"] for tx in txs if tx["dt"]]
+            if not dts or min(dts) < start_dt:
                 break
 
             if not cls.go_next_page(page):
                 break
 
+        return list(records.values()), pages, "dom"
+
+    # Backfill every unsent transaction between start_dt and end_dt (full datetimes, may cross midnight)
+    @classmethod
+    def scan_transactions_in_time_range(cls, page, start_dt, end_dt):
+
+        if not start_dt or not end_dt:
+            return
+
+        if start_dt > end_dt:
+            print("⚠️ Start time is later than end time. Skipping range scan.")
+            return
+
+        started = time.perf_counter()
+        records, pages, source = cls.collect_range_transactions(page, start_dt)
+
+        # In the window and not sent yet, oldest → newest
+        store = cls.history()
+        in_range = [tx for tx in records if tx["dt"] and start_dt <= tx["dt"] <= end_dt]
+        unseen = set(store.unseen([tx["signature"] for tx in in_range]))
+        matched = sorted((tx for tx in in_range if tx["signature"] in unseen), key=lambda x: x["dt"])
 
         if matched:
-            matched.sort(key=lambda x: x["dt"] or datetime.min)
+            # Hand the whole date-sorted batch to the outbox in one transaction
+            batch = []
             for tx in matched:
                 print("\n🆕 RANGE TX:", tx["signature"])
-                dt = tx["dt"]
-                if not dt:
-                    continue
-                timestamp_ms = int(dt.timestamp() * 1000)
-                raw_data = f"{tx['note']}|{tx['amount']}|{scb_web['toAccount']}"
-                cls.eric_api(raw_data.strip(), timestamp_ms)
+                timestamp_ms = int(tx["dt"].timestamp() * 1000)
+                raw_data = f"{tx['note']}|{tx['amount']}|{cls.ACCOUNT['toAccount']}"
+                req = cls.build_eric_request(raw_data.strip(), timestamp_ms)
+                batch.append((tx["signature"], req["url"], req["headers"], req["body"]))
+            queued = cls.outbox().enqueue_many(cls.ACCOUNT["toAccount"], batch)
+            logger.info("Backfill: %s transactions queued in the outbox", queued)
         else:
             print("ℹ️ No transactions found within the time range.")
 
-        cls.seed_last_seen_from_page(page)
-    
+        # Everything scanned (in range or not) counts as seen, so it is not sent again as new
+        store.mark_many([tx["signature"] for tx in records])
+
+        print(f"⏱️ Backfill: {pages} pages ({source}), {len(records)} scanned, {len(in_range)} in range, {len(matched)} new in {time.perf_counter() - started:.1f}s")
+        logger.info("Backfill %s - %s: %s pages (%s), %s scanned, %s in range, %s new in %.1fs",
+                    start_dt, end_dt, pages, source, len(records), len(in_range), len(matched), time.perf_counter() - started)
+
+        # Back to the first page with the default rows per page (the widget request is captured again)
+        if source == "dom" and (pages > 1 or cls.ROWS_PER_PAGE > 20):
+            cls.ROWS_PER_PAGE = 20
+            cls.SCHEDULER.force_full_reload()
+            cls.refresh_transactions(page)
+
+    # Refresh the transaction table, widget data only when possible
+    @classmethod
+    def refresh_transactions(cls, page):
+
+        # Replay the transaction request (no page reload, no re-render)
+        if cls.TX_CAPTURE is not None and not cls.SCHEDULER.full_reload_due():
+            try:
+                if cls.TX_CAPTURE.refetch():
+                    return "widget"
+            except Exception as e:
+                logger.debug("Widget refresh failed, fallback to page reload: %s", e)
+
+        # Refresh F5
+        if cls.TX_CAPTURE is not None:
+            cls.TX_CAPTURE.expect_refresh()
+        page.reload()
+
+        # Button Click "View Details"
+        page.locator("//span[normalize-space()='View Details']").click(timeout=10000) 
+
+        # Wait for "Latest Transactions" title and the rows appear
+        page.locator("//h3[normalize-space()='Latest Transactions']").wait_for(state="visible", timeout=10000)
+        try:
+            page.wait_for_function("document.querySelectorAll(\"p[class*='MuiTypography-body1']\").length >= 47", timeout=10000)
+        except Exception:
+            pass
+
+        cls.SCHEDULER.full_reload_done()
+        return "reload"
+
     # Detect/Record the last seen of Transactions
     @classmethod
     def detect_new_transactions(cls, page):
@@ -394,12 +1139,11 @@ class Bank_Bot(Automation):
         if not tx_list:
             return []
 
-        # Load history (newest → oldest)
-        history = cls.load_last_seen_list()
-        new_tx = []
+        # Load history
+        store = cls.history()
 
         # ============ Upload Old Transaction at the first time ==============
-        if not history:
+        if store.is_empty():
             # Send ALL transactions (oldest → newest)
             all_old_tx = list(reversed(tx_list))
 
@@ -409,306 +1153,318 @@ class Bank_Bot(Automation):
             return all_old_tx
 
         # ======= NORMAL RUN ========
-        for tx in tx_list:
-            if tx not in history:
-                new_tx.append(tx)
-            else:
-                break
+        # Indexed lookup of the whole page, so a burst of more than 20 deposits is not dropped
+        new_tx = store.unseen(tx_list)
 
         return list(reversed(new_tx))
         
-    # SCB Company Web
+    # Popups / language switches handled before the username input is ready
+    LOGIN_MAX_STEPS = 10
+
+    # SCB Login (current account)
     @classmethod
-    def scb_Anywhere_web(cls):
-        with sync_playwright() as p: 
+    def scb_login(cls, page):
+
+        page.goto("https://www.scbbusinessanywhere.com/", wait_until="domcontentloaded")
+
+        # Login page state machine: handle whichever state shows up first until the username is ready (popups win ties)
+        states = {
+            # "For your online security.... apppear", click relogin
+            "security_logout": page.locator("//h2[contains(text(),'For your online security, you have been logged out')]"),
+            # Update your Operating System
+            "enter_site": page.locator("//span[contains(text(),'Enter Site/เข้าสู่เว็บไซต์')]"),
+            # Login Page is in Thai Language, change to English
+            "thai": page.locator("//p[contains(text(),'คู่มือการใช้งาน')]"),
+            "username": page.locator("//input[@name='username']"),
+        }
+        for _ in range(cls.LOGIN_MAX_STEPS):
+            state = WAIT.first("login_state", states, timeout=60, required=True)
 
-            # Wait for Chrome CDP to be ready
-            cls.wait_for_cdp_ready()
+            try:
+                if state == "security_logout":
+                    page.locator("//span[normalize-space()='OK']").click(timeout=10000)
 
-            # Connect to running Chrome
-            browser = p.chromium.connect_over_cdp("http://localhost:9222")
-            context = browser.contexts[0]  
+                elif state == "enter_site":
+                    states["enter_site"].click(timeout=10000)
 
-            # Open a new browser page
-            page = context.new_page() 
-            page.goto("https://www.scbbusinessanywhere.com/", wait_until="domcontentloaded")
+                elif state == "thai":
+                    # Click the change language dropdown menu
+                    page.locator('[data-testid="languageDropdown"] [role="button"]').click()
 
-            # Wait for Username appear
-            expect(page.locator("//input[@name='username']")).to_be_visible(timeout=0)
+                    # Select the english language
+                    page.get_by_role("option", name="English").click()
+                    del states["thai"]
 
-            # if "For your online security.... apppear", click relogin
-            try:
-                expect(page.locator("//h2[contains(text(),'For your online security, you have been logged out')]")).to_be_visible(timeout=1500)
-                page.locator("//span[normalize-space()='OK']").click(timeout=0) 
-            except:
-                pass
-            
-            # Update your Operating System 
-            try:
-                expect(page.locator("//span[contains(text(),'Enter Site/เข้าสู่เว็บไซต์')]")).to_be_visible(timeout=1000)
-                page.locator("//span[contains(text(),'Enter Site/เข้าสู่เว็บไซต์')]").click(timeout=0)
-            except:
-                pass
-                
-            # If Login Page is in Thai Language, change to English
-            try:
-                # Wait up to 2s for Thai label to appear
-                page.wait_for_selector("//p[contains(text(),'คู่มือการใช้งาน')]",timeout=1000)
+                else:
+                    break
+            except Exception as e:
+                logger.debug("Login state %s not handled: %s", state, e)
+        else:
+            raise RuntimeError(f"Login page not ready after {cls.LOGIN_MAX_STEPS} steps, last state: {state}")
 
-                # Click the change language dropdown menu
-                page.locator('[data-testid="languageDropdown"] [role="button"]').click()
+        # Fill "Username"
+        page.locator("//input[@name='username']").fill(cls.ACCOUNT["username"], timeout=10000)
 
-                # Select the english language
-                page.get_by_role("option", name="English").click()
-            except:
-                pass
-            
-            # Fill "Username"
-            page.locator("//input[@name='username']").fill(scb_web["username"], timeout=1000)
+        # Button Click "Next"
+        page.locator("//span[normalize-space()='Next']").click(timeout=30000)
 
-            # Button Click "Next"
-            page.locator("//span[normalize-space()='Next']").click(timeout=0) 
+        # Fill "Password"
+        page.locator("//input[@name='password']").fill(cls.ACCOUNT["password"], timeout=30000)
 
-            # Fill "Password"
-            page.locator("//input[@name='password']").fill(scb_web["password"], timeout=0)
+        # Button Click "submit"
+        page.locator("//button[@type='submit']").click(timeout=30000)
 
-            # Button Click "submit"
-            page.locator("//button[@type='submit']").click(timeout=0) 
+        # Delay 3 seconds (keep Playwright events of the other accounts running)
+        page.wait_for_timeout(3000)
 
-            # Delay 3 seconds
-            time.sleep(3)
-        
-            # Browse to Deposit Report
-            page.goto("https://www.scbbusinessanywhere.com/account-management", wait_until="domcontentloaded")
+    # Browse to the Latest Transactions table
+    @classmethod
+    def open_transactions(cls, page):
 
-            # Delay 1 second
-            time.sleep(1)
+        # Browse to Deposit Report
+        page.goto("https://www.scbbusinessanywhere.com/account-management", wait_until="domcontentloaded")
 
-            # check if is in thai language Account Summary, if yes, change to english, else skip
-            try:
-                # Wait up to 5s for Thai word appear
-                page.wait_for_selector("//h2[contains(text(),'สรุปข้อมูลบัญชี')]",timeout=1000)
+        # "Account Summary" in Thai or English, whichever is rendered first
+        language = WAIT.first("account_summary", {
+            "thai": page.locator("//h2[contains(text(),'สรุปข้อมูลบัญชี')]"),
+            "english": page.locator("//h2[normalize-space()='Account Summary']"),
+        }, timeout=10)
 
+        # Thai language Account Summary, change to english
+        if language == "thai":
+            try:
                 # Click the change language dropdown menu
                 page.locator('[data-testid="languageDropdown"] [role="button"]').click(timeout=5000)
 
                 # Select the english language
                 page.get_by_role("option", name="English").click()
-                
+
                 # Wait for "Account Summary" Eng appear
-                page.locator("//h2[normalize-space()='Account Summary']").wait_for(state="visible", timeout=10000)  
+                page.locator("//h2[normalize-space()='Account Summary']").wait_for(state="visible", timeout=10000)
             except:
                 pass
 
-            # Button Click "View Details"
-            page.locator("//span[normalize-space()='View Details']").click(timeout=0) 
+        # Button Click "View Details"
+        page.locator("//span[normalize-space()='View Details']").click(timeout=30000)
 
-            # Wait for "Latest Transactions" title appear
-            page.locator("//h3[normalize-space()='Latest Transactions']").wait_for(state="visible", timeout=10000)  
-            
-            # Delay 2 seconds
-            time.sleep(2)   
+        # Wait for "Latest Transactions" title appear
+        page.locator("//h3[normalize-space()='Latest Transactions']").wait_for(state="visible", timeout=10000)
 
-            # Optional range scan before normal monitoring
-            if cls.TIME_RANGE and not cls.RANGE_SCAN_DONE:
-                start_t, end_t = cls.TIME_RANGE
-                print(f"⏳ Range scan: {start_t.strftime('%H:%M')} - {end_t.strftime('%H:%M')}")
-                cls.scan_transactions_in_time_range(page, start_t, end_t)
-                cls.RANGE_SCAN_DONE = True
+        # Delay 2 seconds
+        page.wait_for_timeout(2000)
 
-            counter = 1
-            
-            while True:
-                
-                # Detect "Something went wrong" popup
-                try:
-                    if page.locator("//h2[normalize-space()='Something went wrong']").is_visible(timeout=1500):
-                        page.reload()
-                        page.click("//span[normalize-space()='View Details']")
-                except:
-                    pass
+    # Open the account in its browser context, login, show transactions, optional range scan
+    @classmethod
+    def open_account(cls, browser, session):
 
-                # Detect "You have been inactive" popup
-                try:
-                    if page.locator("//h2[normalize-space()='You have been inactive for too long']").is_visible(timeout=1500):
-                        page.click("//span[normalize-space()='Continue']")
-                        print("Resumed after inactivity.")
-                except:
-                    pass
+        session.close()
 
-                # Detect "For your online security" logout popup (MODIFIED BLOCK)
-                try:
-                    if page.locator("//h2[contains(text(),'For your online security, you have been logged out')]").is_visible(timeout=1500):
-                        print("⚠️ Session expired. Attempting relogin...")
+        # Own context = own cookies, so every account keeps its own SCB login
+        session.context = browser.new_context() if session.own_context else browser.contexts[0]
+        session.page = session.context.new_page()
+        session.blocker = cls.block_resources(session.page)
 
-                        try:
-                            # 1. Click 'OK' on the logout popup
-                            page.locator("//span[normalize-space()='OK']").click(timeout=10000)
-                        except:
-                            pass
+        # Capture the transaction XHR responses (DOM scraping stays as fallback)
+        session.tx_capture = TxResponseCapture(session.page)
+        cls.activate(session)
 
-                        # 2. Re-run the login steps:
-                        # Go to the home page (which should be the login page after logout)
-                        page.goto("https://www.scbbusinessanywhere.com/", wait_until="domcontentloaded")
+        # Saved login of this account: restore it when "Account Summary" shows up, else full login
+        restored = session.saved_login.restore(session.context, session.page, "https://www.scbbusinessanywhere.com/account-management", probe=lambda: WAIT.first("session_probe", {
+            "thai": session.page.locator("//h2[contains(text(),'สรุปข้อมูลบัญชี')]"),
+            "english": session.page.locator("//h2[normalize-space()='Account Summary']"),
+            "login": session.page.locator("//input[@name='username']"),
+        }, timeout=15) in ("thai", "english"))
 
-                        # Update your Operating System - skipped as it was commented out in original code
-                        try:
-                            expect(page.locator("//span[contains(text(),'Enter Site/เข้าสู่เว็บไซต์')]")).to_be_visible(timeout=1500)
-                            page.locator("//span[contains(text(),'Enter Site/เข้าสู่เว็บไซต์')]").click(timeout=0)
-                        except:
-                            pass
+        if not restored:
+            print(f"[{session.name}] Login...")
+            cls.scb_login(session.page)
+        cls.open_transactions(session.page)
 
-                        # Wait for "Username" to appear and fill
-                        username_input = page.locator("//input[@name='username']")
-                        username_input.wait_for(state="visible", timeout=10000)  
-                        username_input.fill(scb_web["username"])
+        # Save the login state of this account
+        session.saved_login.save(session.context)
 
-                        # Button Click "Next"
-                        page.locator("//span[normalize-space()='Next']").click(timeout=0) 
+        # Optional range scan before normal monitoring
+        if cls.TIME_RANGE and not session.range_scan_done:
+            start_t, end_t = cls.TIME_RANGE
+            print(f"[{session.name}] ⏳ Range scan: {start_t.strftime('%d/%m/%Y %H:%M')} - {end_t.strftime('%d/%m/%Y %H:%M')}")
+            cls.scan_transactions_in_time_range(session.page, start_t, end_t)
+            session.range_scan_done = True
 
-                        # Fill "Password"
-                        page.locator("//input[@name='password']").fill(scb_web["password"], timeout=0)
+        session.needs_refresh = False
+        session.failures = 0
 
-                        # Button Click "submit"
-                        page.locator("//button[@type='submit']").click(timeout=0) 
+    # Close a failing account and open it again later (backoff), the other accounts keep running
+    @classmethod
+    def account_failed(cls, session, error):
+        session.failures += 1
+        delay = min(cls.REOPEN_BACKOFF_MAX, 5 * 2 ** (session.failures - 1))
+        print(f"[{session.name}] ⚠️ Account error, reopen in {delay}s: {error}")
+        logger.warning("[%s] Account error (#%s), reopen in %ss: %s", session.name, session.failures, delay, error)
+        session.close()
+        session.next_poll_at = time.time() + delay
+
+    # One poll of the current account: popups, refresh, detect, queue, schedule next poll
+    @classmethod
+    def poll_account(cls, session):
+
+        page = session.page
+
+        # Detect popups, one check for all of them (no wait when none is shown)
+        popup = WAIT.first("poll_popup", {
+            "security_logout": page.locator("//h2[contains(text(),'For your online security, you have been logged out')]"),
+            "inactive": page.locator("//h2[normalize-space()='You have been inactive for too long']"),
+            "something_wrong": page.locator("//h2[normalize-space()='Something went wrong']"),
+        }, timeout=0)
+
+        # "For your online security" logout popup, relogin this account only
+        if popup == "security_logout":
+            print(f"[{session.name}] ⚠️ Session expired. Attempting relogin...")
+            cls.scb_login(page)
+            cls.open_transactions(page)
+            session.saved_login.save(session.context)
+            session.needs_refresh = False
+
+        # "You have been inactive" popup
+        elif popup == "inactive":
+            try:
+                page.click("//span[normalize-space()='Continue']")
+                print(f"[{session.name}] Resumed after inactivity.")
+            except:
+                pass
 
-                        # Delay 3 seconds
-                        time.sleep(3)
-                        
-                        # Browse back to Deposit Report
-                        page.goto("https://www.scbbusinessanywhere.com/account-management", wait_until="domcontentloaded")
+        # "Something went wrong" popup
+        elif popup == "something_wrong":
+            cls.SCHEDULER.force_full_reload()
+            session.needs_refresh = True
 
-                        # delay 1 second
-                        time.sleep(1)
+        # --- Refresh the transaction table ---
+        if session.needs_refresh:
+            cls.refresh_transactions(page)
 
-                        # Button Click "View Details"
-                        page.locator("//span[normalize-space()='View Details']").click(timeout=0) 
+        # --- Detect new transactions ---
+        new_items = cls.detect_new_transactions(page)
 
-                        # Wait for "Latest Transactions" title appear
-                        page.locator("//h3[normalize-space()='Latest Transactions']").wait_for(state="visible", timeout=10000)  
+        # Process each new transaction (oldest → newest)
+        for tx in new_items:
+            print(f"\n[{session.name}] 🆕 NEW TX:", tx)
 
-                        time.sleep(2)
-                        
-                        # Continue the while loop (skip the rest of the current iteration and start fresh)
-                        continue 
+            parts = tx.split("|")
+            datetime_str = parts[0]     # "dd/MM/yyyy HH:mm"
+            note = parts[1]
+            amount = parts[2]
 
-                except:
-                    pass
+            # Convert datetime string to timestamp ms
+            dt = datetime.strptime(datetime_str, "%d/%m/%Y %H:%M")
+            timestamp_ms = int(dt.timestamp() * 1000)
 
-                # Try only the inner operations, NOT the whole loop
-                try:
+            # Raw Data
+            raw_data = f"{note}|{amount}|{cls.ACCOUNT['toAccount']}"
 
-                    # --- Detect new transactions ---
-                    new_items = cls.detect_new_transactions(page)
+            # Queue for Eric API (sent by the outbox thread, never blocks here)
+            cls.eric_api(raw_data.strip(), timestamp_ms, tx)
 
-                    # Process each new transaction (oldest → newest)
-                    for tx in new_items:    
-                        print("\n🆕 NEW TX:", tx)
+            # Save only after queued in the outbox
+            cls.save_last_seen(tx)
 
-                        parts = tx.split("|")
-                        datetime_str = parts[0]     # "dd/MM/yyyy HH:mm"
-                        note = parts[1]             
-                        amount = parts[2]
+        # Record deposits for the adaptive interval / latency report
+        cls.SCHEDULER.record([datetime.strptime(tx.split("|")[0], "%d/%m/%Y %H:%M") for tx in new_items])
+        if new_items or session.counter % 20 == 0:
+            logger.info("[%s] %s", session.name, cls.SCHEDULER.report())
 
-                        # Convert datetime string to timestamp ms
-                        dt = datetime.strptime(datetime_str, "%d/%m/%Y %H:%M")
-                        timestamp_ms = int(dt.timestamp() * 1000)
+        # --- Next poll of this account (adaptive interval, small jitter keeps accounts apart) ---
+        interval = cls.SCHEDULER.next_interval()
+        print(f"\n[{session.name}] Wait for Incoming Transaction... [#{session.counter}] next check in {interval:.0f}s\n")
+        session.counter += 1
+        session.next_poll_at = time.time() + interval + random.uniform(0, 1)
+        session.needs_refresh = True
+        session.failures = 0
+        session.errors = 0
 
-                        # Raw Data
-                        raw_data = f"{note}|{amount}|{scb_web['toAccount']}"
+    # SCB Company Web (every account in one Chrome)
+    @classmethod
+    def scb_Anywhere_web(cls):
+        with sync_playwright() as p:
 
-                        # Send to API 
-                        cls.eric_api(raw_data.strip(), timestamp_ms)
+            # Chrome ready on CDP (launched again if it died)
+            cls.chrome_CDP()
 
-                        # Save only after Fired API
-                        cls.save_last_seen(tx)
+            # Connect to running Chrome
+            browser = p.chromium.connect_over_cdp(CHROME.cdp_url)
 
-                    # --- Refresh the transaction table ---
+            # Pages of a previous connection are gone, open every account again (staggered)
+            sessions = cls.ACCOUNTS
+            now = time.time()
+            for index, session in enumerate(sessions):
+                session.context = None
+                session.page = None
+                session.next_poll_at = now + index * cls.STAGGER_SECONDS
 
-                    # Refresh F5
-                    page.reload()
+            while True:
 
-                    # Button Click "View Details"
-                    page.locator("//span[normalize-space()='View Details']").click(timeout=10000) 
+                # Account with the earliest due poll
+                session = min(sessions, key=lambda s: s.next_poll_at)
+                delay = session.next_poll_at - time.time()
+                if delay > 0:
+                    # Keep Playwright events running while waiting
+                    open_page = next((s.page for s in sessions if s.page is not None), None)
+                    if open_page is not None:
+                        open_page.wait_for_timeout(delay * 1000)
+                    else:
+                        time.sleep(delay)
 
-                    # Delay 30 seconds
-                    time.sleep(30)
+                cls.activate(session)
 
-                    # Print "Wait for incoming transaction ..."
-                    print(f"\nWait for Incoming Transaction... [#{counter}]\n")
-                    counter += 1
+                # Try only this account, NOT the whole loop
+                try:
+                    if session.page is None:
+                        cls.open_account(browser, session)
+                    else:
+                        cls.poll_account(session)
 
                 except Exception as e:
-                    msg = str(e)
-                    if "has been closed" in msg or "Target page" in msg:
-                        print("❌ Page or browser is closed. Exiting loop...")
+                    if not browser.is_connected():
+                        print("❌ Browser is closed. Exiting loop...")
                         raise RuntimeError("SessionExpired")
 
-                    print("⚠️ Minor loop error recovered:", e)
-                    time.sleep(1)
+                    # Page closed, login failed, or 3 minor errors in a row: reopen this account
+                    msg = str(e)
+                    session.errors += 1
+                    if session.page is None or "has been closed" in msg or "Target page" in msg or session.errors >= 3:
+                        session.errors = 0
+                        cls.account_failed(session, e)
+                        continue
+
+                    print(f"[{session.name}] ⚠️ Minor loop error recovered:", e)
+                    session.next_poll_at = time.time() + 1
                     continue
 
-    # Eric API
+    # Signed Eric deposit request (shared Eric client builds the hash in the exact order required)
     @classmethod
-    def eric_api(cls, raw_data, timestamp_ms):
-        
-        # Production
-        secret_key = "PRODBankBotIsTheBest"
-        url = "https://bot-integration.cloudbdtech.com/integration-service/transaction/addDepositTransaction"
-
-        # # Staging
-        # secret_key = "DEVBankBotIsTheBest"
-        # url = "https://stg-bot-integration.cloudbdtech.com/integration-service/transaction/addDepositTransaction"
-
-        # Create payload as a DICTIONARY (not JSON yet)
-        payload = {
-            "bankCode": "SCB_COMPANY_WEB",
-            "deviceId": scb_web["deviceID"],
-            "merchantCode": scb_web["merchant_code"],
-            "rawMessage": raw_data,
-            "transactionTime": timestamp_ms
-        }
+    def build_eric_request(cls, raw_data, timestamp_ms):
+        return ERIC.build_deposit("SCB_COMPANY_WEB", cls.ACCOUNT["deviceID"], cls.ACCOUNT["merchant_code"], raw_data, timestamp_ms)
 
+    # Eric API (signed payload is queued in the outbox, delivered in background)
+    @classmethod
+    def eric_api(cls, raw_data, timestamp_ms, signature):
 
-        # Build the hash string (exact order required)
-        string_to_hash = (
-            f"bankCode={payload['bankCode']}&"
-            f"deviceId={payload['deviceId']}&"
-            f"merchantCode={payload['merchantCode']}&"
-            f"rawMessage={payload['rawMessage']}&"
-            f"transactionTime={payload['transactionTime']}{secret_key}"
-        )
+        # Signed request
+        req = cls.build_eric_request(raw_data, timestamp_ms)
 
         # Convert timestamp ms to "date and time"
         dt_gmt7 = datetime.fromtimestamp(timestamp_ms / 1000, tz=timezone(timedelta(hours=7)))
 
-        # Generate MD5 hash
-        hash_result = hashlib.md5(string_to_hash.encode("utf-8")).hexdigest()
-
-        # Convert payload to JSON string AFTER hash
-        payload_json = json.dumps(payload)
-
-        # Send request
-        headers = {
-            'accept': '*/*',
-            'hash': hash_result,
-            'Content-Type': 'application/json'
-        }
-
-        # send back request (post method) to eric
-        response = requests.post(url, headers=headers, data=payload_json)
+        # queue the request (post method) to eric, ordered per account
+        cls.outbox().enqueue(cls.ACCOUNT["toAccount"], signature, req["url"], req["headers"], req["body"])
 
         # Logging
         logger.debug("Transaction Time: %s", dt_gmt7)
         logger.debug("RawData: %s", raw_data)
-        logger.debug("Raw string to hash: %s", string_to_hash)
-        logger.debug("MD5 Hash: %s", hash_result)
-        logger.info("API Response: %s \n", response.text)
+        logger.debug("Raw string to hash: %s", req["string_to_hash"])
+        logger.debug("MD5 Hash: %s", req["hash"])
 
         # Debug info
-        print("\nRaw string to hash:", string_to_hash)
-        print("MD5 Hash:", hash_result)
-        print("Response:", response.text)
+        print("\nRaw string to hash:", req["string_to_hash"])
+        print("MD5 Hash:", req["hash"])
 
 # =========================== Main Loop ===========================
 
@@ -726,31 +1482,28 @@ if __name__ == "__main__":
     # Set CMD title
     ctypes.windll.kernel32.SetConsoleTitleW(title)
 
-    # Start/End Time (optional)
-    start_time = input("Start Time (HH:MM, optional): ").strip()
-    end_time = input("End Time (HH:MM, optional): ").strip()
+    # Start/End Time (optional), "HH:MM" = today, "dd/mm/yyyy HH:MM" for other days
+    start_time = input("Start Time (HH:MM or dd/mm/yyyy HH:MM, optional): ").strip()
+    end_time = input("End Time (HH:MM or dd/mm/yyyy HH:MM, optional): ").strip()
 
-    # Convert Start time and End time text to time objects
+    # Convert Start time and End time text to datetime objects
     if start_time and end_time:
-        start_t = Bank_Bot.parse_time_input(start_time)
-        end_t = Bank_Bot.parse_time_input(end_time)
-        
-        # if wrong time format range scan disabled
-        if not start_t or not end_t:
-            print("⚠️ Invalid time format. Use HH:MM. Range scan disabled.")
-            Bank_Bot.TIME_RANGE = None
-        # elif start time is later than end time, range scan disabled
-        elif start_t > end_t:
-            print("⚠️ Start time is later than end time. Range scan disabled.")
+        try:
+            Bank_Bot.TIME_RANGE = Bank_Bot.parse_time_range(start_time, end_time)
+        except ValueError as e:
+            # if wrong time format or start later than end, range scan disabled
+            print(f"⚠️ {e} Range scan disabled.")
             Bank_Bot.TIME_RANGE = None
-        else:
-        # elif Convert Start time and End time text to time objects
-            Bank_Bot.TIME_RANGE = (start_t, end_t)
-            Bank_Bot.RANGE_SCAN_DONE = False
     else:
         # if start time or end time no set, or both no set, set the time range as None
         Bank_Bot.TIME_RANGE = None
 
+    # Accounts to monitor (accounts.json, else the .env account)
+    Bank_Bot.load_accounts()
+
+    # Start Eric outbox sender (also delivers entries left from the last run)
+    Bank_Bot.outbox()
+
     # Launch Chrome
     Automation.chrome_CDP()
 
@@ -761,6 +1514,8 @@ if __name__ == "__main__":
             if "SessionExpired" in str(e):
                 print("🔁 Reconnecting after logout...")
                 time.sleep(3)
+
+                # Same Chrome (attach), a new one only if it died
                 Automation.chrome_CDP()
                 continue
             else:
@@ -0,0 +1,254 @@
+import sys
+import json
+import time
+import random
+import sqlite3
+import logging
+import requests
+import threading
+from pathlib import Path
+from threading import Lock
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger("BankBotLogger")
+
+# ================== Deposit Outbox ==================
+
+class DepositOutbox:
+
+    """
+    Durable queue of signed Eric deposit callbacks.
+    The scraper only enqueue() (one local SQLite write, never network),
+    a background sender thread delivers them in order per account,
+    with connection pool, timeouts and exponential backoff.
+    Entries that fail MAX_ATTEMPTS times are parked as 'failed' until replay_failed().
+    """
+
+    MAX_ATTEMPTS = 10
+    BACKOFF_BASE = 2            # seconds, doubled every attempt
+    BACKOFF_MAX = 300           # seconds
+    TIMEOUT = (5, 15)           # (connect, read) seconds
+    IDLE_WAIT = 1               # seconds between checks when nothing is due
+
+    # One entry per (account, signature): the signature has no account, two accounts can get the same one
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS outbox (
+            id              INTEGER PRIMARY KEY AUTOINCREMENT,
+            account         TEXT NOT NULL,
+            signature       TEXT NOT NULL,
+            url             TEXT NOT NULL,
+            headers         TEXT NOT NULL,
+            body            TEXT NOT NULL,
+            status          TEXT NOT NULL DEFAULT 'pending',
+            attempts        INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL DEFAULT 0,
+            last_error      TEXT,
+            created_at      REAL NOT NULL,
+            sent_at         REAL,
+            UNIQUE (account, signature)
+        )
+    """
+    COLUMNS = "id, account, signature, url, headers, body, status, attempts, next_attempt_at, last_error, created_at, sent_at"
+
+    def __init__(self, db_path, client=None):
+        self.db_path = Path(db_path)
+        self.lock = Lock()
+        self.wakeup = threading.Event()
+        self.thread = None
+
+        # Keep-alive connection pool for the sender (shared Eric client when given)
+        self.client = client
+        if client is not None:
+            self.session = client.session_no_retry
+        else:
+            self.session = requests.Session()
+            self.session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=4))
+
+        self.conn = sqlite3.connect(str(self.db_path), timeout=30, check_same_thread=False, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(self.SCHEMA)
+        self.migrate()
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_outbox_status ON outbox(status, account, id)")
+
+    # Old table with a UNIQUE signature (one account per outbox): rebuild it with UNIQUE (account, signature)
+    def migrate(self):
+        unique_columns = []
+        for index in self.conn.execute("PRAGMA index_list(outbox)").fetchall():
+            if index["unique"]:
+                unique_columns.append([col["name"] for col in self.conn.execute(f"PRAGMA index_info('{index['name']}')").fetchall()])
+        if ["signature"] not in unique_columns:
+            return
+
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.conn.execute("ALTER TABLE outbox RENAME TO outbox_old")
+                self.conn.execute(self.SCHEMA)
+                self.conn.execute(f"INSERT INTO outbox ({self.COLUMNS}) SELECT {self.COLUMNS} FROM outbox_old")
+                self.conn.execute("DROP TABLE outbox_old")
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        logger.info("Deposit outbox migrated to one entry per (account, signature) (%s)", self.db_path)
+
+    # ================== Producer side ==================
+
+    # Add a signed payload (ignored if the signature is already queued for this account)
+    def enqueue(self, account, signature, url, headers, body):
+        with self.lock:
+            cur = self.conn.execute(
+                "INSERT OR IGNORE INTO outbox (account, signature, url, headers, body, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (str(account), signature, url, json.dumps(headers), body, time.time()),
+            )
+        self.wakeup.set()
+        return cur.rowcount == 1
+
+    # Add a date-sorted batch in one transaction: [(signature, url, headers, body), ...]
+    def enqueue_many(self, account, entries):
+        now = time.time()
+        with self.lock:
+            before = self.conn.total_changes
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.conn.executemany(
+                    "INSERT OR IGNORE INTO outbox (account, signature, url, headers, body, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                    [(str(account), sig, url, json.dumps(headers), body, now) for sig, url, headers, body in entries],
+                )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+            added = self.conn.total_changes - before
+        self.wakeup.set()
+        return added
+
+    # ================== Sender side ==================
+
+    # Start the background sender thread (once)
+    def start(self):
+        if self.thread and self.thread.is_alive():
+            return
+        self.thread = threading.Thread(target=self._run, name="deposit-outbox", daemon=True)
+        self.thread.start()
+        logger.info("Deposit outbox sender started (%s)", self.db_path)
+
+    # Oldest pending entry of every account, only if it is due (keeps per-account order)
+    def _due_entries(self):
+        with self.lock:
+            return self.conn.execute("""
+                SELECT * FROM outbox
+                WHERE id IN (SELECT MIN(id) FROM outbox WHERE status = 'pending' GROUP BY account)
+                  AND next_attempt_at <= ?
+                ORDER BY id
+            """, (time.time(),)).fetchall()
+
+    def _run(self):
+        while True:
+            try:
+                entries = self._due_entries()
+                if not entries:
+                    self.wakeup.wait(self.IDLE_WAIT)
+                    self.wakeup.clear()
+                    continue
+                for entry in entries:
+                    self._deliver(entry)
+            except Exception:
+                logger.exception("Deposit outbox sender loop error")
+                time.sleep(self.IDLE_WAIT)
+
+    # Send one entry and record the result
+    def _deliver(self, entry):
+        started = time.perf_counter()
+        status = None
+        try:
+            response = self.session.post(
+                entry["url"],
+                headers=json.loads(entry["headers"]),
+                data=entry["body"],
+                timeout=self.TIMEOUT,
+            )
+            status = response.status_code
+            response.raise_for_status()
+        except Exception as e:
+            self._failed(entry, str(e))
+            return
+        finally:
+            if self.client is not None:
+                self.client.record_latency(entry["url"], (time.perf_counter() - started) * 1000, status)
+
+        with self.lock:
+            self.conn.execute(
+                "UPDATE outbox SET status = 'sent', attempts = attempts + 1, sent_at = ?, last_error = NULL WHERE id = ?",
+                (time.time(), entry["id"]),
+            )
+
+        logger.info("API Response: %s (outbox #%s, %.0f ms) \n", response.text, entry["id"], (time.perf_counter() - started) * 1000)
+        print("Response:", response.text)
+
+    # Schedule a retry with exponential backoff, or park it as failed
+    def _failed(self, entry, error):
+        attempts = entry["attempts"] + 1
+        if attempts >= self.MAX_ATTEMPTS:
+            status, next_at = "failed", 0
+            logger.error("Outbox #%s failed %s times, parked for replay: %s", entry["id"], attempts, error)
+        else:
+            delay = min(self.BACKOFF_MAX, self.BACKOFF_BASE * (2 ** (attempts - 1)))
+            status, next_at = "pending", time.time() + delay + random.uniform(0, 1)
+            logger.warning("Outbox #%s attempt %s failed, retry in %ss: %s", entry["id"], attempts, delay, error)
+
+        with self.lock:
+            self.conn.execute(
+                "UPDATE outbox SET status = ?, attempts = ?, next_attempt_at = ?, last_error = ? WHERE id = ?",
+                (status, attempts, next_at, error, entry["id"]),
+            )
+
+    # ================== Maintenance ==================
+
+    # Put failed entries back to pending (all, or only the given ids)
+    def replay_failed(self, ids=None):
+        with self.lock:
+            if ids:
+                placeholders = ",".join("?" * len(ids))
+                cur = self.conn.execute(
+                    f"UPDATE outbox SET status = 'pending', attempts = 0, next_attempt_at = 0 WHERE status = 'failed' AND id IN ({placeholders})",
+                    list(ids),
+                )
+            else:
+                cur = self.conn.execute("UPDATE outbox SET status = 'pending', attempts = 0, next_attempt_at = 0 WHERE status = 'failed'")
+        self.wakeup.set()
+        return cur.rowcount
+
+    # Count entries by status
+    def stats(self):
+        with self.lock:
+            rows = self.conn.execute("SELECT status, COUNT(*) FROM outbox GROUP BY status").fetchall()
+        return {row[0]: row[1] for row in rows}
+
+    # List failed entries
+    def failed_entries(self):
+        with self.lock:
+            return self.conn.execute("SELECT id, account, signature, attempts, last_error FROM outbox WHERE status = 'failed' ORDER BY id").fetchall()
+
+
+# ================== Command Line ==================
+# python deposit_outbox.py status
+# python deposit_outbox.py replay [id id ...]
+
+if __name__ == "__main__":
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s | %(levelname)s | %(message)s")
+
+    outbox = DepositOutbox(Path(__file__).parent / "deposit_outbox.db")
+    command = sys.argv[1] if len(sys.argv) > 1 else "status"
+
+    if command == "replay":
+        ids = [int(x) for x in sys.argv[2:]]
+        count = outbox.replay_failed(ids or None)
+        print(f"Replayed {count} failed entries (they will be sent by the running bot)")
+    else:
+        print("Outbox:", outbox.stats())
+        for row in outbox.failed_entries():
+            print(f"  #{row['id']} [{row['account']}] {row['signature']} attempts={row['attempts']} error={row['last_error']}")
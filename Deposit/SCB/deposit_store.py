@@ -0,0 +1,126 @@
+import time
+import sqlite3
+import logging
+from pathlib import Path
+from threading import Lock
+from datetime import datetime
+
+logger = logging.getLogger("BankBotLogger")
+
+# ================== Deposit History Store ==================
+
+class DepositStore:
+
+    """
+    Seen-deposit history of one account: signatures of every deposit already
+    handed to the Eric outbox (deposit_outbox.py, its own deposit_outbox.db, sends
+    them in the background) or skipped as old by the first run / a range scan.
+    Used by the polling loop to tell new deposits from the ones already on the page.
+    SQLite in WAL mode: indexed lookups, one atomic write per mark-as-sent,
+    survives crashes (a half written line like last_seen.txt cannot happen).
+    Nothing is dropped unless compact(keep_days) is asked to prune.
+    """
+
+    def __init__(self, db_path, legacy_file=None):
+        self.db_path = Path(db_path)
+        self.lock = Lock()
+
+        is_new = not self.db_path.exists()
+
+        # check_same_thread=False, so the store may be used from any thread (calls guarded by self.lock)
+        self.conn = sqlite3.connect(str(self.db_path), timeout=30, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS seen (
+                signature  TEXT PRIMARY KEY,
+                tx_time    INTEGER,
+                created_at INTEGER NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_seen_tx_time ON seen(tx_time)")
+
+        # First start: import the old last_seen.txt so nothing is sent twice
+        if is_new and legacy_file and Path(legacy_file).exists():
+            self.import_legacy(legacy_file)
+
+    # signature "dd/mm/yyyy HH:MM|note|amount" → epoch ms (None if not parsable)
+    @staticmethod
+    def signature_time(signature):
+        try:
+            dt = datetime.strptime(signature.split("|")[0], "%d/%m/%Y %H:%M")
+            return int(dt.timestamp() * 1000)
+        except Exception:
+            return None
+
+    # Import signatures from last_seen.txt
+    def import_legacy(self, legacy_file):
+        with Path(legacy_file).open("r", encoding="utf-8") as f:
+            lines = [x.strip() for x in f.readlines() if x.strip()]
+        self.mark_many(lines)
+        logger.info("Imported %s signatures from %s", len(lines), legacy_file)
+
+    # True if there is no history at all (first run)
+    def is_empty(self):
+        with self.lock:
+            return self.conn.execute("SELECT 1 FROM seen LIMIT 1").fetchone() is None
+
+    # True if the signature was already sent
+    def has(self, signature):
+        with self.lock:
+            return self.conn.execute("SELECT 1 FROM seen WHERE signature = ?", (signature,)).fetchone() is not None
+
+    # Keep only the signatures not sent yet (order kept)
+    def unseen(self, signatures):
+        if not signatures:
+            return []
+        with self.lock:
+            placeholders = ",".join("?" * len(signatures))
+            rows = self.conn.execute(f"SELECT signature FROM seen WHERE signature IN ({placeholders})", list(signatures)).fetchall()
+        seen = {row[0] for row in rows}
+        return [sig for sig in signatures if sig not in seen]
+
+    # Mark one signature as sent (single atomic write)
+    def mark_sent(self, signature):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO seen (signature, tx_time, created_at) VALUES (?, ?, ?)",
+                (signature, self.signature_time(signature), int(time.time() * 1000)),
+            )
+
+    # Mark many signatures in one transaction
+    def mark_many(self, signatures):
+        now = int(time.time() * 1000)
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.conn.executemany(
+                    "INSERT OR IGNORE INTO seen (signature, tx_time, created_at) VALUES (?, ?, ?)",
+                    [(sig, self.signature_time(sig), now) for sig in signatures],
+                )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    # Newest signatures (for display / debugging)
+    def recent(self, limit=20):
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT signature FROM seen ORDER BY tx_time DESC, created_at DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    # Checkpoint the WAL file, optionally drop history older than keep_days
+    def compact(self, keep_days=None):
+        with self.lock:
+            if keep_days:
+                cutoff = int((time.time() - keep_days * 86400) * 1000)
+                deleted = self.conn.execute("DELETE FROM seen WHERE tx_time < ?", (cutoff,)).rowcount
+                logger.info("Deposit history compacted, removed %s signatures older than %s days", deleted, keep_days)
+                self.conn.execute("VACUUM")
+            self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
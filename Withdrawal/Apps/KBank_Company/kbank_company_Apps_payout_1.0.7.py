@@ -4,7 +4,6 @@ import sys
 import json
 import time
 import random
-import hashlib
 import logging
 import requests
 import traceback
@@ -12,7 +11,7 @@ import subprocess
 import numpy as np
 from dotenv import load_dotenv
 from threading import Lock, Thread
-from flask import Flask, request, jsonify
+from flask import Flask
 from appium import webdriver
 from appium.webdriver.common.appiumby import *
 from appium.webdriver.common.appiumby import AppiumBy
@@ -22,6 +21,21 @@ from selenium.common.exceptions import TimeoutException
 from selenium.webdriver.common.action_chains import ActionChains
 from selenium.webdriver.support import expected_conditions as EC
 
+# ================== Shared Modules ==================
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..")))
+from common.eric_client import ERIC
+from common.job_api import JobQueue
+from common.worker_pool import WORKER
+from common.step_metrics import step, timed
+from common.wait_engine import WaitEngine
+
+# Step metrics label (same as the job API name)
+BANK = "kbank_company"
+
+# Readiness waits instead of fixed sleeps (deadlines: WAIT_DEADLINES)
+WAIT = WaitEngine(BANK)
+
 # ================== Version Change ==========================
 
 # 1.0.7
@@ -82,6 +96,7 @@ class Appium_Driver():
 
     # Use Appium Driver
     @classmethod
+    @timed(BANK)
     def use_appium_driver(cls):
         global APPIUM_DRIVER
         logger.info("Preparing Appium driver")
@@ -93,6 +108,7 @@ class Appium_Driver():
                 options = UiAutomator2Options()
                 options.platform_name = "Android"
                 options.device_name = "androidtesting"
+                WORKER.apply_device(options)
                 options.automation_name = "UiAutomator2"
                 options.new_command_timeout = 86400
                 options.set_capability("appium:disableWindowAnimation", True)
@@ -103,7 +119,7 @@ class Appium_Driver():
                 options.set_capability("appium:autoGrantPermissions", False)
                 options.set_capability("appium:noReset", True)
                 
-                APPIUM_DRIVER = webdriver.Remote("http://127.0.0.1:8021", options=options)
+                APPIUM_DRIVER = webdriver.Remote(WORKER.appium_url, options=options)
                 APPIUM_DRIVER.update_settings({"waitForIdleTimeout": 0})   ### This setting SUPER IMPORTANT Settings, This can make Appium 2–3× faster because it stops waiting for Android UI idle.
             else:
                 logger.info("Reusing existing Appium driver session")
@@ -112,6 +128,7 @@ class Appium_Driver():
     
     # Start Appium Server
     @classmethod
+    @timed(BANK)
     def start_appium_server(cls):
         
         global APPIUM_PROC
@@ -128,7 +145,7 @@ class Appium_Driver():
         APPIUM_CMD = os.getenv("APPIUM_CMD")
         APPIUM_PROC = subprocess.Popen([
             APPIUM_CMD,
-            "--port", "8021",
+            "--port", str(WORKER.appium_port),
             "--allow-insecure", "uiautomator2:adb_shell",
             "--allow-cors"
         ],
@@ -141,7 +158,7 @@ class Appium_Driver():
         # Wait until Appium server is ready, retry 10 times
         for attempt in range(1, 11):
             try:
-                if requests.get("http://127.0.0.1:8021/status").ok:
+                if requests.get(f"{WORKER.appium_url}/status").ok:
                     logger.info("Appium server is ready (attempt %s/10)", attempt)
                     return
             except Exception:
@@ -181,46 +198,16 @@ class Eric():
 
     # Eric API
     @classmethod
+    @timed(BANK)
     def eric_api(cls, data):
         
         try:
 
-            url = "https://bot-integration.cloudbdtech.com/integration-service/transaction/payoutScriptCallback"
-
-            # Create payload as a DICTIONARY (not JSON yet)
-            payload = {
-                "bankCode": str(data["fromBankCode"]),
-                "deviceId": str(data["deviceId"]),
-                "merchantCode": str(data["merchantCode"]),
-                "transactionId": str(data["transactionId"]),
-            }
-
-            # Your secret key
-            secret_key = "PRODBankBotIsTheBest"
-
-            # Build the hash string (exact order required)
-            string_to_hash = (
-                f"bankCode={payload['bankCode']}&"
-                f"deviceId={payload['deviceId']}&"
-                f"merchantCode={payload['merchantCode']}&"
-                f"transactionId={payload['transactionId']}{secret_key}"
-            )
-
-            # Generate MD5 hash
-            hash_result = hashlib.md5(string_to_hash.encode("utf-8")).hexdigest()
-
-            # Convert payload to JSON string AFTER hash
-            payload_json = json.dumps(payload)
-
-            # Send request
-            headers = {
-                'accept': '*/*',
-                'hash': hash_result,
-                'Content-Type': 'application/json'
-            }
-
-            response = requests.post(url, headers=headers, data=payload_json)
-            response.raise_for_status()
+            # Send request through the shared Eric client (keep-alive pool, timeout, retry)
+            response, req = ERIC.payout_callback(data)
+            payload = json.loads(req["body"])
+            string_to_hash = req["string_to_hash"]
+            hash_result = req["hash"]
 
             # Debug info
             print("Raw string to hash:", string_to_hash)
@@ -264,6 +251,7 @@ class BankBot(Appium_Driver, Eric):
     
     #  Kbank Company Login
     @classmethod
+    @timed(BANK)
     def kbank_login(cls, data):
 
         # The system cannot processs this transaction
@@ -327,11 +315,15 @@ class BankBot(Appium_Driver, Eric):
             
             # Force terminate first to clear any hung background sessions
             driver.terminate_app("com.kasikornbank.kbiz")
-            time.sleep(1) 
-            
+
+            # Wait until the app is closed
+            WAIT.until("app_terminated", lambda: driver.query_app_state("com.kasikornbank.kbiz") == 1, timeout=1)
+
             # Open Apps
             driver.activate_app("com.kasikornbank.kbiz")
-            time.sleep(3) 
+
+            # Wait until the app is in foreground
+            WAIT.until("app_foreground", lambda: driver.query_app_state("com.kasikornbank.kbiz") == 4, timeout=3)
             
             # Check if Apps is Crash
             if driver.query_app_state("com.kasikornbank.kbiz") != 4:
@@ -355,6 +347,7 @@ class BankBot(Appium_Driver, Eric):
 
     # Kbank Company Withdrawal
     @classmethod
+    @timed(BANK)
     def kbank_withdrawal(cls, data):
 
         def human_type(driver, element, text, min_delay=0.2, max_delay=0.25):
@@ -365,7 +358,8 @@ class BankBot(Appium_Driver, Eric):
             # Tap the field to pop up the Android keyboard
             element.click()
 
-            time.sleep(0.5)
+            # Wait for the keyboard
+            WAIT.until("keyboard_open", lambda: driver.is_keyboard_shown(), timeout=0.5)
 
             # Queue up the keystrokes and random pauses
             for char in text:
@@ -387,13 +381,15 @@ class BankBot(Appium_Driver, Eric):
         logger.info("Random Click 'History' or 'Approval' ")
         WebDriverWait(driver, 20).until(EC.element_to_be_clickable((AppiumBy.XPATH, random.choice(['//android.widget.ImageView[contains(@content-desc,"Tab 4 of 5")]', '//android.widget.ImageView[contains(@content-desc,"Tab 2 of 5")]'])))).click()
 
-        time.sleep(2.5)
+        # Wait for "Banking" tab clickable
+        WAIT.element("banking_tab_ready", driver, AppiumBy.XPATH, '//android.widget.Button[normalize-space(@content-desc)="Banking Tab 3 of 5"]', timeout=2.5, clickable=True)
         
         # Wait and Button Click "Banking"
         logger.info("Click Banking (QR Code)")
         WebDriverWait(driver, 20).until(EC.element_to_be_clickable((AppiumBy.XPATH, '//android.widget.Button[normalize-space(@content-desc)="Banking Tab 3 of 5"]'))).click()
 
-        time.sleep(1)
+        # Wait for "Transfer" clickable
+        WAIT.element("transfer_menu_ready", driver, AppiumBy.ACCESSIBILITY_ID, "Transfer", timeout=1, clickable=True)
 
         # Wait and Button Click "Transfer"
         logger.info("Click Transfer")
@@ -403,26 +399,33 @@ class BankBot(Appium_Driver, Eric):
         logger.info("Wait 'From' ...")
         WebDriverWait(driver,20).until(EC.visibility_of_element_located((AppiumBy.ANDROID_UIAUTOMATOR,'new UiSelector().text("From")')))
 
-        time.sleep(1)
+        # Wait for the bank dropdown
+        WAIT.element("bank_dropdown_ready", driver, AppiumBy.ANDROID_UIAUTOMATOR, 'new UiSelector().className("android.widget.Spinner").textContains("Kasikornbank")', timeout=1)
+
+        # Inputs of the transfer form (to know when the bank search closes again)
+        form_inputs = len(driver.find_elements(AppiumBy.CLASS_NAME, "android.widget.EditText"))
 
         # Select Bank (Drop Down Menu)
         logger.info("Select Bank (Drop Down Menu)")
         WebDriverWait(driver, 30).until(EC.presence_of_element_located((AppiumBy.ANDROID_UIAUTOMATOR, 'new UiSelector().className("android.widget.Spinner").textContains("Kasikornbank")'))).click()
 
-        time.sleep(1)
+        # Wait for the bank search input
+        WAIT.until("bank_search_ready", lambda: len(driver.find_elements(AppiumBy.CLASS_NAME, "android.widget.EditText")) > form_inputs, timeout=1)
         
         # Fill Bank Name
         bank_input_element = driver.find_elements(AppiumBy.CLASS_NAME, "android.widget.EditText")[-1]
         # Human Type
         human_type(driver, bank_input_element, data["toBankCode"])
 
-        time.sleep(1)
+        # Wait for the filtered bank list (search input + at least one result)
+        WAIT.until("bank_filtered", lambda: len(driver.find_elements(AppiumBy.ANDROID_UIAUTOMATOR, f'new UiSelector().textContains("{data["toBankCode"]}")')) > 1, timeout=1)
 
         # Press Enter
         logger.info("Press Enter ")
         driver.press_keycode(66)
 
-        time.sleep(2)
+        # Wait for the bank search to close (back on the transfer form)
+        WAIT.until("bank_selected", lambda: len(driver.find_elements(AppiumBy.CLASS_NAME, "android.widget.EditText")) == form_inputs, timeout=2)
 
         # Fill Account Number
         logger.info(f"Fill Account Number {str(data['toAccountNum'])} ...")
@@ -430,7 +433,8 @@ class BankBot(Appium_Driver, Eric):
         # Human Type
         human_type(driver, account_input, str(data["toAccountNum"]))
 
-        time.sleep(1)
+        # Wait for the account number in the input (shown with dashes)
+        WAIT.until("account_typed", lambda: "".join(filter(str.isdigit, account_input.text)) == str(data["toAccountNum"]), timeout=1)
 
         # Press Enter
         logger.info("Press Enter ")
@@ -467,27 +471,40 @@ class BankBot(Appium_Driver, Eric):
         driver.find_element(AppiumBy.ANDROID_UIAUTOMATOR, 'new UiSelector().textContains("Confirm")').click()
         driver.find_element(AppiumBy.ANDROID_UIAUTOMATOR, 'new UiSelector().text("Confirm")').click()
 
+        # Journal: transfer submitted, last confirm next
+        JOBS.checkpoint("form_submitted", data)
+
         # Wait "Do you confirm to perform this transaction?"
         WebDriverWait(driver, 10).until(EC.presence_of_element_located((AppiumBy.ACCESSIBILITY_ID, "Do you confirm to perform this transaction?")))
 
-        time.sleep(1)
+        # Wait for "Confirm" clickable
+        WAIT.element("confirm_dialog_ready", driver, AppiumBy.ACCESSIBILITY_ID, "Confirm", timeout=1, clickable=True)
 
         # Wait and Button Click "Confirm"
         logger.info("Click Confirm again ")
         WebDriverWait(driver,20).until(EC.element_to_be_clickable((AppiumBy.ACCESSIBILITY_ID,"Confirm"))).click()
 
-        time.sleep(2)
+        # Wait for the result page
+        WAIT.element("transfer_result", driver, AppiumBy.ACCESSIBILITY_ID, "Back to main page", timeout=2)
+
+        # Journal: transfer done by the bank
+        JOBS.checkpoint("bank_confirmed", data)
 
         # Call Eric API
         cls.eric_api(data)
 
-        time.sleep(2)
+        # Journal: Eric notified
+        JOBS.checkpoint("eric_notified", data)
+
+        # Wait for "Back to main page" clickable
+        WAIT.element("back_main_ready", driver, AppiumBy.ACCESSIBILITY_ID, "Back to main page", timeout=2, clickable=True)
 
         # Wait and Button Click "Back to main page"
         logger.info("Click Back to Main Page ")
         WebDriverWait(driver,20).until(EC.element_to_be_clickable((AppiumBy.ACCESSIBILITY_ID,"Back to main page"))).click()
 
-        time.sleep(2)
+        # Wait until the result page is closed
+        WAIT.gone("back_main_done", driver, AppiumBy.ACCESSIBILITY_ID, "Back to main page", timeout=2)
 
         # Kill Apps
         APPIUM_DRIVER.terminate_app("com.kasikornbank.kbiz")
@@ -495,35 +512,39 @@ class BankBot(Appium_Driver, Eric):
 
 # ================== Code Start Here ==================
 
-# Run API
-@app.route("/kbank_company/runPython", methods=["POST"])
-def runPython():
+# Run one payout (called by the job runner thread, one payout at a time)
+def run_payout(data):
 
     # Count Inactivity Transaction Timer
     with Appium_Driver.time_Lock:
         Appium_Driver.last_TxN_Time = time.time()
 
-    # Flask reads the JSON body sent by the client
-    data = request.get_json(silent=True)
-
     with LOCK:
         try:
             # Perform Login
             BankBot.kbank_login(data)
 
+            # Journal: logged in
+            JOBS.checkpoint("logged_in", data)
+
             # Perform Withdrawal
             BankBot.kbank_withdrawal(data)
 
             # Return Successful, if withdrawal Successful
-            return jsonify({"success": True,"transactionId": data.get("transactionId")})
+            return {"success": True,"transactionId": data.get("transactionId")}
         except Exception as e:
             
             # Return Error + Failed, if something went wrong
             full_trace = traceback.format_exc()
             print(f"\n--- CRITICAL TRANSACTION ERROR ---\n{full_trace}")
             logging.error(f"CRITICAL ERROR for Transaction {data.get('transactionId', 'unknown')}:\n"f"{full_trace}\n{'-'*40}")
-            return jsonify({"success": False,"message": str(e),"error_type": type(e).__name__}), 500
+            return {"success": False,"message": str(e),"error_type": type(e).__name__}
         
+# Async job API: POST /kbank_company/jobs → 202 + jobId, GET /kbank_company/jobs/<jobId> status, GET /kbank_company/jobs queue depth
+# /kbank_company/runPython still answers when the payout is done (202 with "Prefer: respond-async")
+JOBS = JobQueue("kbank_company", run_payout, required=["transactionId", "amount", "pin", "toAccountNum", "toBankCode"], notify=BankBot.eric_api)
+runPython = JOBS.register(app, "/kbank_company")
+
 if __name__ == "__main__":
 
     # Start the inactivity monitor as a daemon thread (so it exits when the main script stops)
@@ -531,4 +552,4 @@ if __name__ == "__main__":
     inactivity_thread.start()
 
     Eric.start_ws_client()
-    app.run(host="0.0.0.0", port=5104, debug=False, threaded=False, use_reloader=False)
+    app.run(host="0.0.0.0", port=WORKER.flask_port(5104), debug=False, threaded=True, use_reloader=False)
@@ -3,7 +3,6 @@ import io
 import sys
 import json
 import time
-import hashlib
 import logging
 import requests
 import traceback
@@ -11,7 +10,7 @@ import subprocess
 import numpy as np
 from dotenv import load_dotenv
 from threading import Lock, Thread
-from flask import Flask, request, jsonify
+from flask import Flask
 from appium import webdriver
 from appium.webdriver.common.appiumby import *
 from appium.webdriver.common.appiumby import AppiumBy
@@ -19,6 +18,17 @@ from appium.options.android import UiAutomator2Options
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 
+# ================== Shared Modules ==================
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..")))
+from common.eric_client import ERIC
+from common.job_api import JobQueue
+from common.worker_pool import WORKER
+from common.step_metrics import step, timed
+
+# Step metrics label (same as the job API name)
+BANK = "scb_company"
+
 # ================== Version Change =========================
 
 # - 1.0.4
@@ -78,6 +88,7 @@ class Appium_Driver():
 
     # Use Appium Driver
     @classmethod
+    @timed(BANK)
     def use_appium_driver(cls):
 
         global APPIUM_DRIVER
@@ -101,10 +112,11 @@ class Appium_Driver():
                 options = UiAutomator2Options()
                 options.platform_name = "Android"
                 options.device_name = "androidtesting"
+                WORKER.apply_device(options)
                 options.automation_name = "UiAutomator2"
                 options.new_command_timeout = 86400
 
-                APPIUM_DRIVER = webdriver.Remote("http://127.0.0.1:8021", options=options)
+                APPIUM_DRIVER = webdriver.Remote(WORKER.appium_url, options=options)
                 APPIUM_DRIVER.update_settings({"waitForIdleTimeout": 0})   ### This setting SUPER IMPORTANT Settings, This can make Appium 2–3× faster because it stops waiting for Android UI idle.
                 logger.info("Created new Appium driver session")
 
@@ -112,6 +124,7 @@ class Appium_Driver():
     
     # Start Appium Server
     @classmethod
+    @timed(BANK)
     def start_appium_server(cls):
         
         global APPIUM_PROC
@@ -128,7 +141,7 @@ class Appium_Driver():
         APPIUM_CMD = os.getenv("APPIUM_CMD")
         APPIUM_PROC = subprocess.Popen([
             APPIUM_CMD,
-            "--port", "8021",
+            "--port", str(WORKER.appium_port),
             "--allow-insecure", "uiautomator2:adb_shell",
             "--allow-cors"
         ],
@@ -141,7 +154,7 @@ class Appium_Driver():
         # Wait until Appium server is ready, retry 10 times
         for attempt in range(1, 11):
             try:
-                if requests.get("http://127.0.0.1:8021/status").ok:
+                if requests.get(f"{WORKER.appium_url}/status").ok:
                     logger.info("Appium server is ready (attempt %s/10)", attempt)
                     return
             except Exception:
@@ -196,46 +209,16 @@ class Eric():
 
     # Eric API
     @classmethod
+    @timed(BANK)
     def eric_api(cls, data):
         
         try:
 
-            url = "https://bot-integration.cloudbdtech.com/integration-service/transaction/payoutScriptCallback"
-
-            # Create payload as a DICTIONARY (not JSON yet)
-            payload = {
-                "bankCode": str(data["fromBankCode"]),
-                "deviceId": str(data["deviceId"]),
-                "merchantCode": str(data["merchantCode"]),
-                "transactionId": str(data["transactionId"]),
-            }
-
-            # Your secret key
-            secret_key = "PRODBankBotIsTheBest"
-
-            # Build the hash string (exact order required)
-            string_to_hash = (
-                f"bankCode={payload['bankCode']}&"
-                f"deviceId={payload['deviceId']}&"
-                f"merchantCode={payload['merchantCode']}&"
-                f"transactionId={payload['transactionId']}{secret_key}"
-            )
-
-            # Generate MD5 hash
-            hash_result = hashlib.md5(string_to_hash.encode("utf-8")).hexdigest()
-
-            # Convert payload to JSON string AFTER hash
-            payload_json = json.dumps(payload)
-
-            # Send request
-            headers = {
-                'accept': '*/*',
-                'hash': hash_result,
-                'Content-Type': 'application/json'
-            }
-
-            response = requests.post(url, headers=headers, data=payload_json)
-            response.raise_for_status()
+            # Send request through the shared Eric client (keep-alive pool, timeout, retry)
+            response, req = ERIC.payout_callback(data)
+            payload = json.loads(req["body"])
+            string_to_hash = req["string_to_hash"]
+            hash_result = req["hash"]
 
             # Debug info
             print("Raw string to hash:", string_to_hash)
@@ -279,6 +262,7 @@ class BankBot(Appium_Driver, Eric):
     
     # SCB Anywhere Login
     @classmethod
+    @timed(BANK)
     def scbAnywhere_login(cls, data):
 
         # Use Appium Driver
@@ -405,6 +389,7 @@ class BankBot(Appium_Driver, Eric):
 
     # SCB Anywhere Withdrawal
     @classmethod
+    @timed(BANK)
     def scbAnywhere_withdrawal(cls, data):
 
         # Forces the terminal to handle those sea creatures correctly
@@ -451,6 +436,9 @@ class BankBot(Appium_Driver, Eric):
         logger.info('Click Submit ...')
         WebDriverWait(driver, 20).until(EC.element_to_be_clickable((AppiumBy.ACCESSIBILITY_ID, "Submit"))).click()
 
+        # Journal: transfer submitted, waiting for the token PIN
+        JOBS.checkpoint("form_submitted", data)
+
         # Wait for SCB Digital Token Pin
         logger.info("Wait For 'SCB Digital Token Pin' appear ...")
         WebDriverWait(driver, 300).until(EC.visibility_of_element_located((AppiumBy.XPATH, "//*[@text='Enter the 8-digit\nSCB Digital Token PIN']")))
@@ -462,9 +450,15 @@ class BankBot(Appium_Driver, Eric):
             digit_button = WebDriverWait(driver, 10).until(EC.element_to_be_clickable((AppiumBy.XPATH, f"//android.widget.TextView[@text='{digit}']")))
             digit_button.click()
 
+        # Journal: SCB Digital Token PIN entered
+        JOBS.checkpoint("otp_entered", data)
+
         # Call Back Eric API
         cls.eric_api(data)
 
+        # Journal: Eric notified
+        JOBS.checkpoint("eric_notified", data)
+
         # Click "Share payment slip"
         logger.info("Wait for 'Share payment slip' ...")
         WebDriverWait(driver, 30).until(EC.presence_of_element_located((AppiumBy.ACCESSIBILITY_ID, "Share payment slip")))
@@ -494,35 +488,39 @@ class BankBot(Appium_Driver, Eric):
 
 # ================== Code Start Here ==================
 
-# Run API
-@app.route("/scb_company/runPython", methods=["POST"])
-def runPython():
+# Run one payout (called by the job runner thread, one payout at a time)
+def run_payout(data):
 
     # Count Inactivity Transaction Timer
     with Appium_Driver.time_Lock:
         Appium_Driver.last_TxN_Time = time.time()
 
-    # Flask reads the JSON body sent by the client
-    data = request.get_json(silent=True)
-
     with LOCK:
         try:
             # Perform Withdrawal
             BankBot.scbAnywhere_login(data)
 
+            # Journal: logged in
+            JOBS.checkpoint("logged_in", data)
+
             # Withdrawal Process
             BankBot.scbAnywhere_withdrawal(data)
 
             # Return Successful, if withdrawal Successful
-            return jsonify({"success": True,"transactionId": data.get("transactionId")})
+            return {"success": True,"transactionId": data.get("transactionId")}
         except Exception as e:
             
             # Return Error + Failed, if something went wrong
             full_trace = traceback.format_exc()
             print(f"\n--- CRITICAL TRANSACTION ERROR ---\n{full_trace}")
             logging.error(f"CRITICAL ERROR for Transaction {data.get('transactionId', 'unknown')}:\n"f"{full_trace}\n{'-'*40}")
-            return jsonify({"success": False,"message": str(e),"error_type": type(e).__name__}), 500
+            return {"success": False,"message": str(e),"error_type": type(e).__name__}
         
+# Async job API: POST /scb_company/jobs → 202 + jobId, GET /scb_company/jobs/<jobId> status, GET /scb_company/jobs queue depth
+# /scb_company/runPython still answers when the payout is done (202 with "Prefer: respond-async")
+JOBS = JobQueue("scb_company", run_payout, required=["transactionId", "amount", "scbDigitalTokenPin", "toAccountNum"], notify=BankBot.eric_api)
+runPython = JOBS.register(app, "/scb_company")
+
 if __name__ == "__main__":
 
     # Start the inactivity monitor as a daemon thread (so it exits when the main script stops)
@@ -530,5 +528,5 @@ if __name__ == "__main__":
     inactivity_thread.start()
 
     Eric.start_ws_client()
-    app.run(host="0.0.0.0", port=5101, debug=False, threaded=False, use_reloader=False)
+    app.run(host="0.0.0.0", port=WORKER.flask_port(5101), debug=False, threaded=True, use_reloader=False)
 
@@ -1,16 +1,16 @@
 import os
+import sys
 import json
 import time
 import atexit
 import threading
 import logging
-import hashlib
 import requests
 import traceback
 import subprocess
 from threading import Lock
 from dotenv import load_dotenv
-from flask import Flask, request, jsonify
+from flask import Flask
 from playwright.sync_api import sync_playwright, expect
 from appium import webdriver
 from appium.webdriver.common.appiumby import *
@@ -21,6 +21,35 @@ from selenium.common.exceptions import TimeoutException
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 
+# ================== Shared Modules ==================
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..")))
+from common.eric_client import ERIC
+from common.job_api import JobQueue
+from common.worker_pool import WORKER
+from common.chrome_manager import ChromeManager
+from common.resource_blocker import ResourceBlocker
+from common.step_metrics import step, timed
+from common.screen_state import ScreenClassifier
+from common.wait_engine import WaitEngine
+from common.session_state import SessionState
+
+# Step metrics label (same as the job API name)
+BANK = "kbank_company_web"
+
+# Readiness waits instead of fixed sleeps (deadlines: WAIT_DEADLINES)
+WAIT = WaitEngine(BANK)
+
+# Encrypted login state, restored after a Chrome restart (SESSION_STATE_KEY)
+SESSION = SessionState(BANK)
+
+# K BIZ app screens of the approval loop, highest priority first (one page source per check)
+KBIZ_SCREENS = ScreenClassifier({
+    "session_expired": [("content-desc", "~", "session has expired")],
+    "enter_pin": [("content-desc", "=", "Enter PIN")],
+    "confirm_transaction": [("text", "~", "Confirm Transaction")],
+})
+
 # =========================== Eric WS_Client Settings =================
 
 WS_PROC = None
@@ -78,55 +107,38 @@ PAGE = None
 
 # ================== Chrome Settings ==================
 
+# Chrome of this worker (profile / CDP port of WorkerSettings, reused after a bot restart)
+CHROME = ChromeManager(BANK)
+
 class Automation:
-    
-    chrome_proc = None
 
-    # Chrome CDP
+    # Resource blocker profile of this bank portal (common/resource_blocker.py)
+    RESOURCE_PROFILE = "kbank"
+    BLOCKER = None
+
+    # Block images / fonts / media / trackers of a new page, bytes and time saved are logged per page load
     @classmethod
+    def block_resources(cls, page):
+        cls.BLOCKER = ResourceBlocker(cls.RESOURCE_PROFILE).attach(page)
+        return cls.BLOCKER
+
+    # Chrome CDP (attach to the running Chrome of this profile, else launch it, common/chrome_manager.py)
+    @classmethod
+    @timed(BANK)
     def chrome_cdp(cls):
+        global BROWSER, CONTEXT, PAGE
 
-        # Prevent starting Chrome more than once
-        if cls.chrome_proc:
-            return
-        
         # Load .env file
         load_dotenv()
-        USER_DATA_DIR = os.getenv("CHROME_PATH")
-
-        cls.chrome_proc = subprocess.Popen([
-            r"C:\Program Files\Google\Chrome\Application\chrome.exe",
-            "--remote-debugging-port=9222",
-            "--disable-session-crashed-bubble",
-            "--hide-crash-restore-bubble",
-            "--no-first-run",
-            "--no-default-browser-check",
-            f"--user-data-dir={USER_DATA_DIR}",
-        ], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-
-        cls.wait_for_cdp_ready()
-        atexit.register(cls.cleanup)
-
-    # Close Chrome Completely
+
+        # New Chrome (first start or the old one died): the Playwright connection to the old one is gone
+        if CHROME.ensure():
+            BROWSER = CONTEXT = PAGE = None
+
+    # Close Chrome Completely (only a Chrome launched by this bot)
     @classmethod
     def cleanup(cls):
-        try:
-            if cls.chrome_proc and cls.chrome_proc.poll() is None:
-                cls.chrome_proc.terminate()
-        except Exception:
-            pass
-
-    # Wait Chrome CDP Ready
-    @staticmethod
-    def wait_for_cdp_ready(timeout=10):
-        for attempt in range(1, timeout + 1):
-            try:
-                if requests.get("http://localhost:9222/json").status_code == 200:
-                    return
-            except Exception:
-                pass
-            time.sleep(1)
-        raise RuntimeError("Chrome CDP not ready")
+        CHROME.stop()
 
 # ================== KBANK BANK BOT ==================
 
@@ -134,6 +146,7 @@ class BankBot(Automation):
 
     # Use Appium Driver
     @classmethod
+    @timed(BANK)
     def use_appium_driver(cls):
         global APPIUM_DRIVER
         logger.info("Preparing Appium driver")
@@ -145,16 +158,17 @@ class BankBot(Automation):
                 options = UiAutomator2Options()
                 options.platform_name = "Android"
                 options.device_name = "androidtesting"
+                WORKER.apply_device(options)
                 options.automation_name = "UiAutomator2"
                 options.new_command_timeout = 86400
 
                 client_config = AppiumClientConfig(
-                    remote_server_addr="http://127.0.0.1:8021",
+                    remote_server_addr=WORKER.appium_url,
                     keep_alive=False
                 )
 
                 APPIUM_DRIVER = webdriver.Remote(
-                    "http://127.0.0.1:8021",
+                    WORKER.appium_url,
                     options=options,
                     client_config=client_config
                 )
@@ -165,6 +179,7 @@ class BankBot(Automation):
     
     # Start Appium Server
     @classmethod
+    @timed(BANK)
     def start_appium_server(cls):
         
         global APPIUM_PROC
@@ -181,7 +196,7 @@ class BankBot(Automation):
         APPIUM_CMD = os.getenv("APPIUM_CMD")
         APPIUM_PROC = subprocess.Popen([
             APPIUM_CMD,
-            "--port", "8021",
+            "--port", str(WORKER.appium_port),
             "--allow-insecure", "uiautomator2:adb_shell",
             "--allow-cors"
         ],
@@ -194,7 +209,7 @@ class BankBot(Automation):
         # Wait until Appium server is ready, retry 10 times
         for attempt in range(1, 11):
             try:
-                if requests.get("http://127.0.0.1:8021/status").ok:
+                if requests.get(f"{WORKER.appium_url}/status").ok:
                     logger.info("Appium server is ready (attempt %s/10)", attempt)
                     return
             except Exception:
@@ -227,6 +242,7 @@ class BankBot(Automation):
 
     # Login
     @classmethod
+    @timed(BANK)
     def kbank_login(cls, data):
         
         # Get Transaction ID
@@ -249,7 +265,7 @@ class BankBot(Automation):
             # Connect to running Chrome ONLY ONCE
             if BROWSER is None:
                 logger.info("Connecting Playwright to Chrome CDP. txn_id=%s", txn_id)
-                BROWSER = PLAYWRIGHT.chromium.connect_over_cdp("http://localhost:9222")
+                BROWSER = PLAYWRIGHT.chromium.connect_over_cdp(CHROME.cdp_url)
             else:
                 logger.info("Reusing existing Chrome CDP browser connection. txn_id=%s", txn_id)
 
@@ -261,6 +277,7 @@ class BankBot(Automation):
             if PAGE is None or PAGE.is_closed():
                 logger.info("Creating new browser page. txn_id=%s", txn_id)
                 PAGE = CONTEXT.new_page()
+                cls.block_resources(PAGE)
             else:
                 logger.info("Reusing existing browser page. txn_id=%s", txn_id)
 
@@ -274,37 +291,44 @@ class BankBot(Automation):
             except Exception:
                 pass
 
-            # Go to a webpage
-            page.goto("https://kbiz.kasikornbank.com/authen/login.jsp?lang=en", wait_until="domcontentloaded")
-            logger.info("Navigating to KBANK login page. txn_id=%s", txn_id)
+            # Saved login after a Chrome restart: restore it when the "Fund Transfer" menu shows up, else the login page
+            restored = SESSION.restore(CONTEXT, page, "https://kbiz.kasikornbank.com/", probe=lambda: WAIT.first("session_probe", {
+                "logged_in": page.locator("//div[@class='column-menu']//a[@id='BIZ_004']"),
+                "login": page.locator("//input[@id='userName']"),
+            }, timeout=15) == "logged_in")
 
-            # If "Sorry" Appear, Button click "Go to login Page"
-            try:
-                page.wait_for_selector("//span[normalize-space()='Sorry']", timeout=1500)
+            if not restored:
+                # Go to a webpage
+                page.goto("https://kbiz.kasikornbank.com/authen/login.jsp?lang=en", wait_until="domcontentloaded")
+                logger.info("Navigating to KBANK login page. txn_id=%s", txn_id)
+
+                # If "Sorry" Appear, Button click "Go to login Page"
+                try:
+                    page.wait_for_selector("//span[normalize-space()='Sorry']", timeout=1500)
                 
-                # Button Click "Go to login Page"
-                page.locator("//span[normalize-space()='Go to login page']").click()
+                    # Button Click "Go to login Page"
+                    page.locator("//span[normalize-space()='Go to login page']").click()
 
-                # Log for session expired
-                logger.warning("Your session has expired or you are signed in on another device, button click to login Page. txn_id=%s", txn_id)
-            except:
-                pass
+                    # Log for session expired
+                    logger.warning("Your session has expired or you are signed in on another device, button click to login Page. txn_id=%s", txn_id)
+                except:
+                    pass
 
-            # if Account already login, can skip
-            try: 
-                # Fill "User ID"
-                page.locator("//input[@id='userName']").fill(str(data["username"]))
+                # if Account already login, can skip
+                try: 
+                    # Fill "User ID"
+                    page.locator("//input[@id='userName']").fill(str(data["username"]))
 
-                # Fill "Password"
-                page.locator("//input[@id='password']").fill(str(data["password"]))
+                    # Fill "Password"
+                    page.locator("//input[@id='password']").fill(str(data["password"]))
 
-                # Button Click "Log In"
-                page.locator("//a[@id='loginBtn']").click()
+                    # Button Click "Log In"
+                    page.locator("//a[@id='loginBtn']").click()
 
-                logger.info("Login Account...")
-            except Exception:
-                logger.info("Account Already Login, Skip...")
-                pass
+                    logger.info("Login Account...")
+                except Exception:
+                    logger.info("Account Already Login, Skip...")
+                    pass
 
             # Button Click "Fund Transfer"
             page.locator("//div[@class='column-menu']//a[@id='BIZ_004']").click(timeout=100000) 
@@ -314,6 +338,9 @@ class BankBot(Automation):
             page.locator("//h1[normalize-space()='Funds Transfer']").wait_for() 
             logger.info("Wait for navigate to 'Fund Transfer' Title/Page, txn_id=%s", txn_id)
 
+            # Save the login state
+            SESSION.save(CONTEXT)
+
             return page
         
         except Exception as e:
@@ -330,6 +357,7 @@ class BankBot(Automation):
 
     # Withdrawal
     @classmethod
+    @timed(BANK)
     def kbank_withdrawal(cls, page, data):
 
         try:
@@ -342,77 +370,93 @@ class BankBot(Automation):
             logger.info("Starting withdrawal flow. txn_id=%s to_bank=%s to_account=%s amount=%s",txn_id, data.get("toBankCode"), data.get("toAccountNum"), data.get("amount"),)
 
             # Button Click "Select Bank"
-            page.locator("//span[@id='select2-id_select2_example_3-container']//div").click(timeout=10000)
-            logger.info(f"Open Bank Menu....., txn_id=%s", txn_id)
+            with step(BANK, "click_select_bank"):
+                page.locator("//span[@id='select2-id_select2_example_3-container']//div").click(timeout=10000)
+                logger.info(f"Open Bank Menu....., txn_id=%s", txn_id)
 
             # Locate the input
-            page.locator("input.select2-search__field").evaluate("el => el.removeAttribute('readonly')")
-            page.locator("input.select2-search__field").fill(str(data["toBankCode"]))
-            logger.info("Fill in Bank Name %s, txn_id=%s", data.get("toBankCode"), txn_id)
+            with step(BANK, "fill_bank_search"):
+                page.locator("input.select2-search__field").evaluate("el => el.removeAttribute('readonly')")
+                page.locator("input.select2-search__field").fill(str(data["toBankCode"]))
+                logger.info("Fill in Bank Name %s, txn_id=%s", data.get("toBankCode"), txn_id)
 
             # if element == bank code name, then click the third element, else click first element
-            if page.locator("//span[@id='select2-id_select2_example_3-container']//span").inner_text().strip() == data["toBankCode"]:
-                page.locator(f"//div[span[normalize-space()='{data['toBankCode']}']]").nth(2).click()
-            else:
-                page.locator(f"//div[span[normalize-space()='{data['toBankCode']}']]").click()
-            logger.info("Select the Bank Name/Code %s, txn_id=%s", data.get("toBankCode"), txn_id)
+            with step(BANK, "select_bank"):
+                if page.locator("//span[@id='select2-id_select2_example_3-container']//span").inner_text().strip() == data["toBankCode"]:
+                    page.locator(f"//div[span[normalize-space()='{data['toBankCode']}']]").nth(2).click()
+                else:
+                    page.locator(f"//div[span[normalize-space()='{data['toBankCode']}']]").click()
+                logger.info("Select the Bank Name/Code %s, txn_id=%s", data.get("toBankCode"), txn_id)
 
             # Fill Account No.
-            page.locator("//input[@placeholder='xxx-x-xxxxx-x']").fill(str(data["toAccountNum"]))
-            logger.info("Fill in Account Number %s, txn_id=%s", data.get("toAccountNum"), txn_id)
+            with step(BANK, "fill_account_no"):
+                page.locator("//input[@placeholder='xxx-x-xxxxx-x']").fill(str(data["toAccountNum"]))
+                logger.info("Fill in Account Number %s, txn_id=%s", data.get("toAccountNum"), txn_id)
 
             # Fill Amount
-            page.locator("//input[@placeholder='0.00']").fill(str(data["amount"]))
-            logger.info("Fill in Amount %s, txn_id=%s", data.get("amount"), txn_id)
+            with step(BANK, "fill_amount"):
+                page.locator("//input[@placeholder='0.00']").fill(str(data["amount"]))
+                logger.info("Fill in Amount %s, txn_id=%s", data.get("amount"), txn_id)
 
             # Button Click "Next"
-            page.locator("//a[@class='btn btn-gradient f-right disabled-button']").click()
-            logger.info(f"Click Next, txn_id=%s", txn_id)
+            with step(BANK, "click_next"):
+                page.locator("//a[@class='btn btn-gradient f-right disabled-button']").click()
+                logger.info(f"Click Next, txn_id=%s", txn_id)
 
-            time.sleep(1)
+                time.sleep(1)
 
             # If insufficient amount appear, raise and stop code
-            if page.locator("//span[normalize-space()='There is insufficient balance in your account.']").is_visible():
-                    print(("Stopping code: Insufficient balance detected! (ตรวจพบยอดเงินไม่เพียงพอ! บอทหยุดทำงานแล้ว!)\n") * 10)
-                    logger.warning("Stopping code: Insufficient balance detected.")
-                    time.sleep(5)
-                    raise Exception("Stopping code: Insufficient balance detected.")
+            with step(BANK, "check_insufficient_balance"):
+                if page.locator("//span[normalize-space()='There is insufficient balance in your account.']").is_visible():
+                        print(("Stopping code: Insufficient balance detected! (ตรวจพบยอดเงินไม่เพียงพอ! บอทหยุดทำงานแล้ว!)\n") * 10)
+                        logger.warning("Stopping code: Insufficient balance detected.")
+                        time.sleep(5)
+                        raise Exception("Stopping code: Insufficient balance detected.")
             
-            logger.info("Sufficient Balance... Continue...")
+                logger.info("Sufficient Balance... Continue...")
 
             # if Notice | You or Company has made this transaction already .... if this appear click confirm else skip
-            try: 
-                expect(page.locator("//div[@class='mfp-content']//h3[contains(text(),'Notice')]")).to_be_visible(timeout=4000)
-                # Button Click "Confirm"
-                page.locator("//div[@class='mfp-content']//span[contains(text(),'Confirm')]").click()
-                logger.info(f"Notice | You or Company has made this transaction already .... click Confirm, txn_id=%s", txn_id)
-            except Exception:
-                pass
+            with step(BANK, "confirm_duplicate_notice"):
+                try: 
+                    expect(page.locator("//div[@class='mfp-content']//h3[contains(text(),'Notice')]")).to_be_visible(timeout=4000)
+                    # Button Click "Confirm"
+                    page.locator("//div[@class='mfp-content']//span[contains(text(),'Confirm')]").click()
+                    logger.info(f"Notice | You or Company has made this transaction already .... click Confirm, txn_id=%s", txn_id)
+                except Exception:
+                    pass
             
             # Wait for "Confirm Transaction" appear
-            try:
-                page.get_by_role("heading", name="Confirm Transaction").wait_for(timeout=3000)
-            except Exception as e:
-                logger.exception("'Confirm Transaction' is not appear after waiting 3 seconds..., txn_id=%s", txn_id)
+            with step(BANK, "wait_confirm_transaction"):
+                try:
+                    page.get_by_role("heading", name="Confirm Transaction").wait_for(timeout=3000)
+                except Exception as e:
+                    logger.exception("'Confirm Transaction' is not appear after waiting 3 seconds..., txn_id=%s", txn_id)
                 
             # Delay 1 second
             time.sleep(1)
 
+            # Journal: transfer submitted, waiting for the app approval
+            JOBS.checkpoint("form_submitted", data)
+
             # Kbank Apps Approved   
-            logger.info("Moving to mobile approval Confirm transaction. txn_id=%s", txn_id)
-            cls.kbank_business_apps(data)
-            logger.info("Mobile approval completed. txn_id=%s", txn_id)
+            with step(BANK, "app_approval"):
+                logger.info("Moving to mobile approval Confirm transaction. txn_id=%s", txn_id)
+                cls.kbank_business_apps(data)
+                logger.info("Mobile approval completed. txn_id=%s", txn_id)
 
             # wait for "Fund Transfer" to be appear
-            page.locator("//div[@class='column-menu']//a[@id='BIZ_004']").wait_for(state="visible", timeout=10000)
-            logger.info("Wait for Fund Transfer page to appear.")
+            with step(BANK, "wait_fund_transfer_menu"):
+                page.locator("//div[@class='column-menu']//a[@id='BIZ_004']").wait_for(state="visible", timeout=10000)
+                logger.info("Wait for Fund Transfer page to appear.")
             
             # Button Click "Fund Transfer"
-            page.locator("//div[@class='column-menu']//a[@id='BIZ_004']").click() 
-            logger.info("Button click Fund Transfer to wait for the next withdrawal transaction request... ")
+            with step(BANK, "click_fund_transfer"):
+                page.locator("//div[@class='column-menu']//a[@id='BIZ_004']").click() 
+                logger.info("Button click Fund Transfer to wait for the next withdrawal transaction request... ")
 
             # wait for "Fund Transfer" to be appear
-            page.locator("//h1[normalize-space()='Funds Transfer']").wait_for(state="visible", timeout=10000)
+            with step(BANK, "wait_fund_transfer_page"):
+                page.locator("//h1[normalize-space()='Funds Transfer']").wait_for(state="visible", timeout=10000)
 
         except Exception as e:
             error_trace = traceback.format_exc()
@@ -422,6 +466,7 @@ class BankBot(Automation):
         
     # Apps Approved Transaction
     @classmethod
+    @timed(BANK)
     def kbank_business_apps(cls, data):
 
         # Get Transaction ID
@@ -477,6 +522,7 @@ class BankBot(Automation):
             # =============== KBank Apps Part =============================
 
             # Restart Apps -> Key Pin -> Wait Confirm transaction and click
+            @timed(BANK, "app_restart_reopen_confirm")
             def restart_and_reopen_confirm():
                 print("40 seconds reached. Force restarting app...")
                 logging.info("Force restart after 40 seconds")
@@ -529,6 +575,7 @@ class BankBot(Automation):
                     pass
 
             # Enter Login Pin
+            @timed(BANK, "app_enter_pin")
             def enter_pin():
 
                 # Wait for "Enter PIN" to appear
@@ -546,6 +593,7 @@ class BankBot(Automation):
                 logger.info("Enter KBank Apps Pin... txn_id=%s", txn_id)
 
             # Confirm Transaction
+            @timed(BANK, "app_confirm_transaction")
             def confirm_transaction(max_retries=3):
 
                 logger.info("Starting Apps confirm transaction sequence. txn_id=%s", txn_id)
@@ -583,6 +631,9 @@ class BankBot(Automation):
                         # Wait and Button Click "Confirm"s
                         WebDriverWait(driver, 20).until(EC.element_to_be_clickable((AppiumBy.ACCESSIBILITY_ID, "Confirm"))).click()
 
+                        # Journal: transaction confirmed in the K BIZ app
+                        JOBS.checkpoint("otp_entered", data)
+
                         break
                         
                     except Exception as e:
@@ -647,111 +698,54 @@ class BankBot(Automation):
 
             while True:
                 try:
+                    # Current K BIZ screen (one page source, all signatures)
+                    screen = KBIZ_SCREENS.classify(driver)
+
                     # Session Expired
-                    if driver.find_elements(AppiumBy.XPATH, "//*[contains(@content-desc,'session has expired')]"):
+                    if screen == "session_expired":
 
                         # Session Expired Log
                         logger.info("Session Expired, KBank Apps Relogin and Perform Confirm Transaction, and stop Watchdog Timer, txn_id=%s", txn_id)
-                        
+
                         # Button Click "Yes"
                         driver.find_element(AppiumBy.XPATH, "//android.widget.Button[@content-desc='Yes']").click()
 
                         # Enter PIN
                         enter_pin()
 
-                        # Confirm Transaction
-                        confirm_transaction()
-
-                        # Stop Watchdog Timer
-                        stop_watchdog() 
-
-                        # Break While Loop
-                        break
-
                     # else if Enter Pin Page
-                    elif driver.find_elements(AppiumBy.ACCESSIBILITY_ID, "Enter PIN"):
-
-                        try:
-                            # Wait for "Session Expired" to appear
-                            WebDriverWait(driver, 1).until(EC.presence_of_element_located((AppiumBy.XPATH, "//*[contains(@content-desc,'session has expired')]")))
-
-                            # Session Expired Log
-                            logger.info("Session Expired, KBank Apps Relogin and Perform Confirm Transaction, and stop Watchdog Timer, txn_id=%s", txn_id)
-
-                            # Button Click "Yes"
-                            driver.find_element(AppiumBy.XPATH, "//android.widget.Button[@content-desc='Yes']").click()
-
-                            # Enter PIN
-                            enter_pin()
-
-                            # Confirm Transaction
-                            confirm_transaction()
-
-                            # Stop Watchdog Timer
-                            stop_watchdog() 
-
-                            # Break While Loop
-                            break
-                        except Exception:
-                            pass
-
-                        # Enter PIN
-                        enter_pin()
-
-                        # Confirm Transaction
-                        confirm_transaction()
-
-                        # Stop Watchdog Timer
-                        stop_watchdog() 
+                    elif screen == "enter_pin":
 
                         # Kbank Apps login and perform confirm transaction
                         logger.info("KBank Apps login and Perform Confirm Transaction, and stop Watchdog Timer, txn_id=%s", txn_id)
-       
-                        # Break While Loop
-                        break
-                    
-                    # Wait for "Confirm Transaction"
-                    elif driver.find_elements(AppiumBy.XPATH, "//*[contains(@text,'Confirm Transaction')]"):
-                        try:
-                            if driver.find_elements(AppiumBy.XPATH, "//*[contains(@content-desc,'session has expired')]"):
-
-                                # Session Expired Log
-                                logger.info("Session Expired, KBank Apps Relogin and Perform Confirm Transaction, and stop Watchdog Timer, txn_id=%s", txn_id)
-
-                                # Button Click "Yes"
-                                driver.find_element(AppiumBy.XPATH, "//android.widget.Button[@content-desc='Yes']").click()
 
-                                # Enter PIN
-                                enter_pin()
-
-                                # Confirm Transaction
-                                confirm_transaction()
-
-                                # Stop Watchdog Timer
-                                stop_watchdog() 
-
-                                # Break While Loop
-                                break
-                        except Exception:
-                            pass
+                        # Enter PIN
+                        enter_pin()
 
-                        # Confirm Transaction
-                        confirm_transaction()
+                    # Not on "Confirm Transaction" either: check again
+                    elif screen != "confirm_transaction":
+                        continue
 
-                        # Stop Watchdog Timer
-                        stop_watchdog() 
+                    # Confirm Transaction
+                    confirm_transaction()
 
-                        # Confirm Transaction
-                        logger.info("Perform Confirm Transaction, and stop Watchdog Timer, txn_id=%s", txn_id)
+                    # Stop Watchdog Timer
+                    stop_watchdog() 
 
-                        # Break While Loop
-                        break
+                    # Break While Loop
+                    break
 
                 except TimeoutException:
                     continue
             
+            # Journal: transfer done by the bank
+            JOBS.checkpoint("bank_confirmed", data)
+
             # Call Back Eric API
             cls.eric_api(data)
+
+            # Journal: Eric notified
+            JOBS.checkpoint("eric_notified", data)
             
             # Wait and Click "Back to main page"
             WebDriverWait(driver, 20).until(EC.element_to_be_clickable((AppiumBy.XPATH, "//android.view.View[@content-desc='Back to main page']"))).click()
@@ -765,6 +759,7 @@ class BankBot(Automation):
         
     # Clean all notification 1 round
     @classmethod
+    @timed(BANK)
     def kbank_business_apps_clean_notif(cls):
 
         try:
@@ -801,46 +796,16 @@ class BankBot(Automation):
 
     # Callback ERIC API
     @classmethod
+    @timed(BANK)
     def eric_api(cls, data):
         
         try:
 
-            url = "https://bot-integration.cloudbdtech.com/integration-service/transaction/payoutScriptCallback"
-
-            # Create payload as a DICTIONARY (not JSON yet)
-            payload = {
-                "bankCode": str(data["fromBankCode"]),
-                "deviceId": str(data["deviceId"]),
-                "merchantCode": str(data["merchantCode"]),
-                "transactionId": str(data["transactionId"]),
-            }
-
-            # Your secret key
-            secret_key = "PRODBankBotIsTheBest"
-
-            # Build the hash string (exact order required)
-            string_to_hash = (
-                f"bankCode={payload['bankCode']}&"
-                f"deviceId={payload['deviceId']}&"
-                f"merchantCode={payload['merchantCode']}&"
-                f"transactionId={payload['transactionId']}{secret_key}"
-            )
-
-            # Generate MD5 hash
-            hash_result = hashlib.md5(string_to_hash.encode("utf-8")).hexdigest()
-
-            # Convert payload to JSON string AFTER hash
-            payload_json = json.dumps(payload)
-
-            # Send request
-            headers = {
-                'accept': '*/*',
-                'hash': hash_result,
-                'Content-Type': 'application/json'
-            }
-
-            response = requests.post(url, headers=headers, data=payload_json)
-            response.raise_for_status()
+            # Send request through the shared Eric client (keep-alive pool, timeout, retry)
+            response, req = ERIC.payout_callback(data)
+            payload = json.loads(req["body"])
+            string_to_hash = req["string_to_hash"]
+            hash_result = req["hash"]
 
             # Debug info
             logger.info("\n\n")
@@ -861,12 +826,8 @@ class BankBot(Automation):
 
 # ================== Code Start Here ==================
 
-# Run API
-@app.route("/kbank_company_web/runPython", methods=["POST"])        
-def runPython():
-    data = request.get_json(silent=True)
-    if not data:
-        return jsonify({"success": False, "message": "Invalid JSON"}), 400
+# Run one payout (called by the job runner thread, one payout at a time)
+def run_payout(data):
     
     with LOCK:
         try:
@@ -880,16 +841,19 @@ def runPython():
 
             # Login KBANK
             page = BankBot.kbank_login(data)
+
+            # Journal: logged in
+            JOBS.checkpoint("logged_in", data)
             logger.info(f"Processing payout started. txn_id={get_txn_id(data)}")
 
             # Perform Withdrawal and Mobile App Approval
             BankBot.kbank_withdrawal(page, data)
             logger.info(f"Processing payout completed. txn_id={get_txn_id(data)}")
 
-            return jsonify({
+            return {
                 "success": True,
                 "transactionId": data.get("transactionId")
-            })
+            }
 
         except Exception as e:
             full_trace = traceback.format_exc()
@@ -909,12 +873,17 @@ def runPython():
             # Use os._exit(1) to exit immediately from the thread
             os._exit(1)
 
-            return jsonify({
+            return {
                 "success": False,
                 "message": str(e),
                 "error_type": type(e).__name__
-            }), 500
+            }
+
+# Async job API: POST /kbank_company_web/jobs → 202 + jobId, GET /kbank_company_web/jobs/<jobId> status, GET /kbank_company_web/jobs queue depth
+# /kbank_company_web/runPython still answers when the payout is done (202 with "Prefer: respond-async")
+JOBS = JobQueue("kbank_company_web", run_payout, required=["transactionId", "amount", "pin", "toAccountNum", "toBankCode"], notify=BankBot.eric_api)
+runPython = JOBS.register(app, "/kbank_company_web")
 
 if __name__ == "__main__":
     BankBot.start_ws_client()
-    app.run(host="0.0.0.0", port=5004, debug=False, threaded=False, use_reloader=False)
\ No newline at end of file
+    app.run(host="0.0.0.0", port=WORKER.flask_port(5004), debug=False, threaded=True, use_reloader=False)
\ No newline at end of file
@@ -1,16 +1,16 @@
 import os
+import sys
 import json
 import time
 import random
 import atexit
 import logging
-import hashlib
 import requests
 import traceback
 import subprocess
 from threading import Lock
 from dotenv import load_dotenv
-from flask import Flask, request, jsonify
+from flask import Flask
 from playwright.sync_api import sync_playwright, expect
 from appium import webdriver
 from appium.webdriver.common.appiumby import *
@@ -20,6 +20,35 @@ from selenium.common.exceptions import TimeoutException
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 
+# ================== Shared Modules ==================
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..")))
+from common.eric_client import ERIC
+from common.job_api import JobQueue
+from common.worker_pool import WORKER
+from common.chrome_manager import ChromeManager
+from common.resource_blocker import ResourceBlocker
+from common.step_metrics import step, timed
+from common.screen_state import ScreenClassifier
+from common.wait_engine import WaitEngine
+from common.session_state import SessionState
+
+# Step metrics label (same as the job API name)
+BANK = "kbank_company_web"
+
+# Readiness waits instead of fixed sleeps (deadlines: WAIT_DEADLINES)
+WAIT = WaitEngine(BANK)
+
+# Encrypted login state, restored after a Chrome restart (SESSION_STATE_KEY)
+SESSION = SessionState(BANK)
+
+# K BIZ app screens of the approval loop, highest priority first (one page source per check)
+KBIZ_SCREENS = ScreenClassifier({
+    "session_expired": [("content-desc", "~", "session has expired")],
+    "enter_pin": [("content-desc", "=", "Enter PIN")],
+    "confirm_transaction": [("text", "~", "Confirm Transaction")],
+})
+
 # =========================== Eric WS_Client Settings =================
 
 WS_PROC = None
@@ -62,61 +91,38 @@ PAGE = None
 
 # ================== Chrome Settings ==================
 
+# Chrome of this worker (profile / CDP port of WorkerSettings, reused after a bot restart)
+CHROME = ChromeManager(BANK)
+
 class Automation:
-    
-    chrome_proc = None
 
-    # Chrome CDP
+    # Resource blocker profile of this bank portal (common/resource_blocker.py)
+    RESOURCE_PROFILE = "kbank"
+    BLOCKER = None
+
+    # Block images / fonts / media / trackers of a new page, bytes and time saved are logged per page load
     @classmethod
+    def block_resources(cls, page):
+        cls.BLOCKER = ResourceBlocker(cls.RESOURCE_PROFILE).attach(page)
+        return cls.BLOCKER
+
+    # Chrome CDP (attach to the running Chrome of this profile, else launch it, common/chrome_manager.py)
+    @classmethod
+    @timed(BANK)
     def chrome_cdp(cls):
+        global BROWSER, CONTEXT, PAGE
 
-        # Prevent starting Chrome more than once
-        if cls.chrome_proc:
-            return
-        
         # Load .env file
         load_dotenv()
-        USER_DATA_DIR = os.getenv("CHROME_PATH")
-        if USER_DATA_DIR:
-            pass
-        else:
-            pass
-
-        cls.chrome_proc = subprocess.Popen([
-            r"C:\Program Files\Google\Chrome\Application\chrome.exe",
-            "--remote-debugging-port=9222",
-            "--disable-session-crashed-bubble",
-            "--hide-crash-restore-bubble",
-            "--no-first-run",
-            "--no-default-browser-check",
-            f"--user-data-dir={USER_DATA_DIR}",
-        ], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-
-        cls.wait_for_cdp_ready()
-        atexit.register(cls.cleanup)
-
-    # Close Chrome Completely
+
+        # New Chrome (first start or the old one died): the Playwright connection to the old one is gone
+        if CHROME.ensure():
+            BROWSER = CONTEXT = PAGE = None
+
+    # Close Chrome Completely (only a Chrome launched by this bot)
     @classmethod
     def cleanup(cls):
-        try:
-            if cls.chrome_proc and cls.chrome_proc.poll() is None:
-                cls.chrome_proc.terminate()
-            else:
-                pass
-        except Exception:
-            pass
-
-    # Wait Chrome CDP Ready
-    @staticmethod
-    def wait_for_cdp_ready(timeout=10):
-        for attempt in range(1, timeout + 1):
-            try:
-                if requests.get("http://localhost:9222/json").status_code == 200:
-                    return
-            except Exception:
-                pass
-            time.sleep(1)
-        raise RuntimeError("Chrome CDP not ready")
+        CHROME.stop()
 
 # ================== KBANK BANK BOT ==================
 
@@ -124,6 +130,7 @@ class BankBot(Automation):
 
     # Use Appium Driver
     @classmethod
+    @timed(BANK)
     def use_appium_driver(cls):
         global APPIUM_DRIVER
 
@@ -134,15 +141,17 @@ class BankBot(Automation):
                 options = UiAutomator2Options()
                 options.platform_name = "Android"
                 options.device_name = "androidtesting"
+                WORKER.apply_device(options)
                 options.automation_name = "UiAutomator2"
                 options.new_command_timeout = 86400
 
-                APPIUM_DRIVER = webdriver.Remote("http://127.0.0.1:8021", options=options)
+                APPIUM_DRIVER = webdriver.Remote(WORKER.appium_url, options=options)
 
         return APPIUM_DRIVER
     
     # Start Appium Server
     @classmethod
+    @timed(BANK)
     def start_appium_server(cls):
         
         global APPIUM_PROC
@@ -157,7 +166,7 @@ class BankBot(Automation):
         APPIUM_CMD = os.getenv("APPIUM_CMD")
         APPIUM_PROC = subprocess.Popen([
             APPIUM_CMD,
-            "--port", "8021",
+            "--port", str(WORKER.appium_port),
             "--allow-insecure", "uiautomator2:adb_shell",
             "--allow-cors"
         ],
@@ -168,7 +177,7 @@ class BankBot(Automation):
         # Wait until Appium server is ready, retry 10 times
         for attempt in range(1, 11):
             try:
-                if requests.get("http://127.0.0.1:8021/status").ok:
+                if requests.get(f"{WORKER.appium_url}/status").ok:
                     return
             except Exception:
                 time.sleep(1)
@@ -196,6 +205,7 @@ class BankBot(Automation):
 
     # Login
     @classmethod
+    @timed(BANK)
     def kbank_login(cls, data):
 
         try:
@@ -213,7 +223,7 @@ class BankBot(Automation):
 
             # Connect to running Chrome ONLY ONCE
             if BROWSER is None:
-                BROWSER = PLAYWRIGHT.chromium.connect_over_cdp("http://localhost:9222")
+                BROWSER = PLAYWRIGHT.chromium.connect_over_cdp(CHROME.cdp_url)
             else:
                 pass
 
@@ -223,6 +233,7 @@ class BankBot(Automation):
             # Reuse page
             if PAGE is None or PAGE.is_closed():
                 PAGE = CONTEXT.new_page()
+                cls.block_resources(PAGE)
             else:
                 pass
 
@@ -235,31 +246,38 @@ class BankBot(Automation):
             except Exception:
                 pass
 
-            # Go to a webpage
-            page.goto("https://kbiz.kasikornbank.com/authen/login.jsp?lang=en", wait_until="domcontentloaded")
+            # Saved login after a Chrome restart: restore it when the "Fund Transfer" menu shows up, else the login page
+            restored = SESSION.restore(CONTEXT, page, "https://kbiz.kasikornbank.com/", probe=lambda: WAIT.first("session_probe", {
+                "logged_in": page.locator("//div[@class='column-menu']//a[@id='BIZ_004']"),
+                "login": page.locator("//input[@id='userName']"),
+            }, timeout=15) == "logged_in")
 
-            # If "Sorry" Appear, Button click "Go to login Page"
-            try:
-                page.wait_for_selector("//span[normalize-space()='Sorry']", timeout=1500)
-                print("Your session has expired or you are signed in on another device. appeared")
+            if not restored:
+                # Go to a webpage
+                page.goto("https://kbiz.kasikornbank.com/authen/login.jsp?lang=en", wait_until="domcontentloaded")
+
+                # If "Sorry" Appear, Button click "Go to login Page"
+                try:
+                    page.wait_for_selector("//span[normalize-space()='Sorry']", timeout=1500)
+                    print("Your session has expired or you are signed in on another device. appeared")
                 
-                # Button Click "Go to login Page"
-                page.locator("//span[normalize-space()='Go to login page']").click()
-            except:
-                pass
+                    # Button Click "Go to login Page"
+                    page.locator("//span[normalize-space()='Go to login page']").click()
+                except:
+                    pass
 
-            # if Account already login, can skip
-            try: 
-                # Fill "User ID"
-                page.locator("//input[@id='userName']").fill(str(data["username"]))
+                # if Account already login, can skip
+                try: 
+                    # Fill "User ID"
+                    page.locator("//input[@id='userName']").fill(str(data["username"]))
 
-                # Fill "Password"
-                page.locator("//input[@id='password']").fill(str(data["password"]))
+                    # Fill "Password"
+                    page.locator("//input[@id='password']").fill(str(data["password"]))
 
-                # Button Click "Log In"
-                page.locator("//a[@id='loginBtn']").click()
-            except Exception:
-                pass
+                    # Button Click "Log In"
+                    page.locator("//a[@id='loginBtn']").click()
+                except Exception:
+                    pass
 
             # Button Click "Fund Transfer"
             page.locator("//div[@class='column-menu']//a[@id='BIZ_004']").click(timeout=100000) 
@@ -267,6 +285,9 @@ class BankBot(Automation):
             # wait for "Fund Transfer" to be appear
             page.locator("//h1[normalize-space()='Funds Transfer']").wait_for() 
 
+            # Save the login state
+            SESSION.save(CONTEXT)
+
             return page
         
         except Exception as e:
@@ -283,6 +304,7 @@ class BankBot(Automation):
 
     # Withdrawal
     @classmethod
+    @timed(BANK)
     def kbank_withdrawal(cls, page, data):
 
         try: 
@@ -293,51 +315,65 @@ class BankBot(Automation):
             time.sleep(1)
             
             # Button Click "Select Bank"
-            page.locator("//span[@id='select2-id_select2_example_3-container']//div").click(timeout=10000)
+            with step(BANK, "click_select_bank"):
+                page.locator("//span[@id='select2-id_select2_example_3-container']//div").click(timeout=10000)
 
             # Locate the input
-            page.locator("input.select2-search__field").evaluate("el => el.removeAttribute('readonly')")
-            page.locator("input.select2-search__field").fill(str(data["toBankCode"]))
+            with step(BANK, "fill_bank_search"):
+                page.locator("input.select2-search__field").evaluate("el => el.removeAttribute('readonly')")
+                page.locator("input.select2-search__field").fill(str(data["toBankCode"]))
 
             # if element == bank code name, then click the third element, else click first element
-            if page.locator("//span[@id='select2-id_select2_example_3-container']//span").inner_text().strip() == data["toBankCode"]:
-                page.locator(f"//div[span[normalize-space()='{data['toBankCode']}']]").nth(2).click()
-            else:
-                page.locator(f"//div[span[normalize-space()='{data['toBankCode']}']]").click()
+            with step(BANK, "select_bank"):
+                if page.locator("//span[@id='select2-id_select2_example_3-container']//span").inner_text().strip() == data["toBankCode"]:
+                    page.locator(f"//div[span[normalize-space()='{data['toBankCode']}']]").nth(2).click()
+                else:
+                    page.locator(f"//div[span[normalize-space()='{data['toBankCode']}']]").click()
 
             # Fill Account No.
-            page.locator("//input[@placeholder='xxx-x-xxxxx-x']").fill(str(data["toAccountNum"]))
+            with step(BANK, "fill_account_no"):
+                page.locator("//input[@placeholder='xxx-x-xxxxx-x']").fill(str(data["toAccountNum"]))
 
             # Fill Amount
-            page.locator("//input[@placeholder='0.00']").fill(str(data["amount"]))
+            with step(BANK, "fill_amount"):
+                page.locator("//input[@placeholder='0.00']").fill(str(data["amount"]))
 
             # Button Click "Next"
-            page.locator("//a[@class='btn btn-gradient f-right disabled-button']").click()
+            with step(BANK, "click_next"):
+                page.locator("//a[@class='btn btn-gradient f-right disabled-button']").click()
 
             # if Notice | You or Company has made this transaction already .... if this appear click confirm else skip
-            try: 
-                expect(page.locator("//div[@class='mfp-content']//h3[contains(text(),'Notice')]")).to_be_visible(timeout=4000)
-                # Button Click "Confirm"
-                page.locator("//div[@class='mfp-content']//span[contains(text(),'Confirm')]").click()
-            except Exception:
-                pass
-            # Wait for "Confirm Transaction" appear
-            page.locator("//app-notification-modal-header//h3[1]").wait_for(state="visible", timeout=100000)
+            with step(BANK, "confirm_duplicate_notice"):
+                try: 
+                    expect(page.locator("//div[@class='mfp-content']//h3[contains(text(),'Notice')]")).to_be_visible(timeout=4000)
+                    # Button Click "Confirm"
+                    page.locator("//div[@class='mfp-content']//span[contains(text(),'Confirm')]").click()
+                except Exception:
+                    pass
+                # Wait for "Confirm Transaction" appear
+                page.locator("//app-notification-modal-header//h3[1]").wait_for(state="visible", timeout=100000)
 
             # Delay 1 second
             time.sleep(1)
 
+            # Journal: transfer submitted, waiting for the app approval
+            JOBS.checkpoint("form_submitted", data)
+
             # Kbank Apps Approved   
-            cls.kbank_business_apps(data)
+            with step(BANK, "app_approval"):
+                cls.kbank_business_apps(data)
 
             # wait for "Fund Transfer" to be appear
-            page.locator("//div[@class='column-menu']//a[@id='BIZ_004']").wait_for(state="visible", timeout=10000)
+            with step(BANK, "wait_fund_transfer_menu"):
+                page.locator("//div[@class='column-menu']//a[@id='BIZ_004']").wait_for(state="visible", timeout=10000)
             
             # Button Click "Fund Transfer"
-            page.locator("//div[@class='column-menu']//a[@id='BIZ_004']").click() 
+            with step(BANK, "click_fund_transfer"):
+                page.locator("//div[@class='column-menu']//a[@id='BIZ_004']").click() 
 
             # wait for "Fund Transfer" to be appear
-            page.locator("//h1[normalize-space()='Funds Transfer']").wait_for(state="visible", timeout=10000)
+            with step(BANK, "wait_fund_transfer_page"):
+                page.locator("//h1[normalize-space()='Funds Transfer']").wait_for(state="visible", timeout=10000)
         
         except Exception as e:
             error_trace = traceback.format_exc()
@@ -347,6 +383,7 @@ class BankBot(Automation):
         
     # Apps Approved Transaction
     @classmethod
+    @timed(BANK)
     def kbank_business_apps(cls, data):
 
         try:
@@ -373,6 +410,7 @@ class BankBot(Automation):
                     pass
 
             # Enter Login Pin
+            @timed(BANK, "app_enter_pin")
             def enter_pin():
 
                 # Wait for "Enter PIN" to appear
@@ -387,6 +425,7 @@ class BankBot(Automation):
                     error_unable_process_this_transaction()
 
             # Confirm Transaction
+            @timed(BANK, "app_confirm_transaction")
             def confirm_transaction():
 
                 # Scroll Down Confirmation Transaction
@@ -433,6 +472,9 @@ class BankBot(Automation):
                 # Wait and Button Click "Confirm"s
                 WebDriverWait(driver, 20).until(EC.element_to_be_clickable((AppiumBy.ACCESSIBILITY_ID, "Confirm"))).click()
 
+                # Journal: transaction confirmed in the K BIZ app
+                JOBS.checkpoint("otp_entered", data)
+
             ### Click K BIZ Confirm transaction ###
             # Expand Notification Bar
             driver.open_notifications()
@@ -452,8 +494,11 @@ class BankBot(Automation):
             while True:
                 loop_count += 1
                 try:
+                    # Current K BIZ screen (one page source, all signatures)
+                    screen = KBIZ_SCREENS.classify(driver)
+
                     # Session Expired
-                    if driver.find_elements(AppiumBy.XPATH, "//*[contains(@content-desc,'session has expired')]"):
+                    if screen == "session_expired":
 
                         # Button Click "Yes"
                         driver.find_element(AppiumBy.XPATH, "//android.widget.Button[@content-desc='Yes']").click()
@@ -461,66 +506,20 @@ class BankBot(Automation):
                         # Enter PIN
                         enter_pin()
 
-                        # Confirm Transaction
-                        confirm_transaction()
-
-                        # Break While Loop
-                        break
-                    
                     # else if Enter Pin Page
-                    elif driver.find_elements(AppiumBy.ACCESSIBILITY_ID, "Enter PIN"):
-                        
-                        try:
-                            # Wait for "Session Expired" to appear
-                            WebDriverWait(driver, 1).until(EC.presence_of_element_located((AppiumBy.XPATH, "//*[contains(@content-desc,'session has expired')]")))
-
-                            # Button Click "Yes"
-                            driver.find_element(AppiumBy.XPATH, "//android.widget.Button[@content-desc='Yes']").click()
-
-                            # Enter PIN
-                            enter_pin()
-
-                            # Confirm Transaction
-                            confirm_transaction()
-
-                            # Break While Loop
-                            break
-                        except Exception:
-                            pass
-
+                    elif screen == "enter_pin":
                         # Enter PIN
                         enter_pin()
 
-                        # Confirm Transaction
-                        confirm_transaction()
-                        
-                        # Break While Loop
-                        break
-                    
-                    # Wait for "Confirm Transaction"
-                    elif driver.find_elements(AppiumBy.XPATH, "//*[contains(@text,'Confirm Transaction')]"):
-                        try:
-                            if driver.find_elements(AppiumBy.XPATH, "//*[contains(@content-desc,'session has expired')]"):
-
-                                # Button Click "Yes"
-                                driver.find_element(AppiumBy.XPATH, "//android.widget.Button[@content-desc='Yes']").click()
-
-                                # Enter PIN
-                                enter_pin()
+                    # Not on "Confirm Transaction" either: check again
+                    elif screen != "confirm_transaction":
+                        continue
 
-                                # Confirm Transaction
-                                confirm_transaction()
-
-                                # Break While Loop
-                                break
-                        except Exception:
-                            pass
-
-                        # Confirm Transaction
-                        confirm_transaction()
+                    # Confirm Transaction
+                    confirm_transaction()
 
-                        # Break While Loop
-                        break
+                    # Break While Loop
+                    break
 
                 except TimeoutException:
                     continue
@@ -528,9 +527,15 @@ class BankBot(Automation):
                 if loop_count % 10 == 0:
                     pass
 
+            # Journal: transfer done by the bank
+            JOBS.checkpoint("bank_confirmed", data)
+
             # Callback Eric API
             cls.eric_api(data)
 
+            # Journal: Eric notified
+            JOBS.checkpoint("eric_notified", data)
+
             # Wait and Click "Back to main page"
             WebDriverWait(driver, 20).until(EC.element_to_be_clickable((AppiumBy.XPATH, "//android.view.View[@content-desc='Back to main page']"))).click()
        
@@ -542,6 +547,7 @@ class BankBot(Automation):
         
     # Clean all notification 1 round
     @classmethod
+    @timed(BANK)
     def kbank_business_apps_clean_notif(cls):
 
         try:
@@ -578,45 +584,15 @@ class BankBot(Automation):
            
     # Callback ERIC API
     @classmethod
+    @timed(BANK)
     def eric_api(cls, data):
 
         try:
-            url = "https://bot-integration.cloudbdtech.com/integration-service/transaction/payoutScriptCallback"
-
-            # Create payload as a DICTIONARY (not JSON yet)
-            payload = {
-                "bankCode": str(data["fromBankCode"]),
-                "deviceId": str(data["deviceId"]),
-                "merchantCode": str(data["merchantCode"]),
-                "transactionId": str(data["transactionId"]),
-            }
-
-            # Your secret key
-            secret_key = "PRODBankBotIsTheBest"
-
-            # Build the hash string (exact order required)
-            string_to_hash = (
-                f"bankCode={payload['bankCode']}&"
-                f"deviceId={payload['deviceId']}&"
-                f"merchantCode={payload['merchantCode']}&"
-                f"transactionId={payload['transactionId']}{secret_key}"
-            )
-
-            # Generate MD5 hash
-            hash_result = hashlib.md5(string_to_hash.encode("utf-8")).hexdigest()
-
-            # Convert payload to JSON string AFTER hash
-            payload_json = json.dumps(payload)
-
-            # Send request
-            headers = {
-                'accept': '*/*',
-                'hash': hash_result,
-                'Content-Type': 'application/json'
-            }
-
-            response = requests.post(url, headers=headers, data=payload_json)
-            response.raise_for_status()
+            # Send request through the shared Eric client (keep-alive pool, timeout, retry)
+            response, req = ERIC.payout_callback(data)
+            payload = json.loads(req["body"])
+            string_to_hash = req["string_to_hash"]
+            hash_result = req["hash"]
 
             # Debug info
             print("Raw string to hash:", string_to_hash)
@@ -635,12 +611,8 @@ class BankBot(Automation):
         
 # ================== Code Start Here ==================
 
-# Run API
-@app.route("/kbank_company_web/runPython", methods=["POST"])        
-def runPython():
-    data = request.get_json(silent=True)
-    if not data:
-        return jsonify({"success": False, "message": "Invalid JSON"}), 400
+# Run one payout (called by the job runner thread, one payout at a time)
+def run_payout(data):
 
     with LOCK:
         try:
@@ -650,11 +622,14 @@ def runPython():
             BankBot.kbank_business_apps_clean_notif()
             # Login KBANK
             page = BankBot.kbank_login(data)
+
+            # Journal: logged in
+            JOBS.checkpoint("logged_in", data)
             BankBot.kbank_withdrawal(page, data)
-            return jsonify({
+            return {
                 "success": True,
                 "transactionId": data["transactionId"]
-            })
+            }
         except Exception as e:
             full_trace = traceback.format_exc()
             
@@ -674,12 +649,17 @@ def runPython():
             # Use os._exit(1) to exit immediately from the thread
             os._exit(1)
             
-            return jsonify({
+            return {
                 "success": False,
                 "message": str(e),
                 "error_type": type(e).__name__
-            }), 500
+            }
         
+# Async job API: POST /kbank_company_web/jobs → 202 + jobId, GET /kbank_company_web/jobs/<jobId> status, GET /kbank_company_web/jobs queue depth
+# /kbank_company_web/runPython still answers when the payout is done (202 with "Prefer: respond-async")
+JOBS = JobQueue("kbank_company_web", run_payout, required=["transactionId", "amount", "pin", "toAccountNum", "toBankCode"], notify=BankBot.eric_api)
+runPython = JOBS.register(app, "/kbank_company_web")
+
 if __name__ == "__main__":
     BankBot.start_ws_client()
-    app.run(host="0.0.0.0", port=5004, debug=False, threaded=False, use_reloader=False)
+    app.run(host="0.0.0.0", port=WORKER.flask_port(5004), debug=False, threaded=True, use_reloader=False)
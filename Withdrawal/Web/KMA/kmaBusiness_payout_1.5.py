@@ -7,13 +7,12 @@ import time
 import random
 import atexit
 import logging
-import hashlib
 import requests
 import traceback
 import subprocess
 from threading import Lock
 from dotenv import load_dotenv
-from flask import Flask, request, jsonify
+from flask import Flask
 from playwright.sync_api import sync_playwright
 from appium import webdriver
 from appium.webdriver.common.appiumby import *
@@ -22,6 +21,28 @@ from appium.options.android import UiAutomator2Options
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 
+# ================== Shared Modules ==================
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..")))
+from common.eric_client import ERIC
+from common.job_api import JobQueue
+from common.worker_pool import WORKER
+from common.chrome_manager import ChromeManager
+from common.resource_blocker import ResourceBlocker
+from common.step_metrics import step, timed
+from common.wait_engine import WaitEngine
+from common.sms_inbox import SmsInbox, SmsInboxError
+from common.otp_broker import create_broker, parse_otp, OtpWarmup
+
+# Step metrics label (same as the job API name)
+BANK = "kma_company_web"
+
+# Readiness waits instead of fixed sleeps (deadlines: WAIT_DEADLINES)
+WAIT = WaitEngine(BANK)
+
+# OTP SMS of the phone keyed by Ref (OTP_BROKER_URL: broker server shared by the bots of the phone)
+OTP = create_broker(lambda: SmsInbox(SmsInbox.appium_shell(BankBot.use_appium_driver()), sender=os.getenv("SMS_SENDER")))
+
 
 # =========================== Eric WS_Client Settings =================
 
@@ -78,6 +99,7 @@ class Appium_Driver():
 
     # Use Appium Driver
     @classmethod
+    @timed(BANK)
     def use_appium_driver(cls):
         global APPIUM_DRIVER
         logger.info("Preparing Appium driver")
@@ -89,10 +111,11 @@ class Appium_Driver():
                 options = UiAutomator2Options()
                 options.platform_name = "Android"
                 options.device_name = "androidtesting"
+                WORKER.apply_device(options)
                 options.automation_name = "UiAutomator2"
                 options.new_command_timeout = 86400
 
-                APPIUM_DRIVER = webdriver.Remote("http://127.0.0.1:8021", options=options)
+                APPIUM_DRIVER = webdriver.Remote(WORKER.appium_url, options=options)
                 APPIUM_DRIVER.update_settings({"waitForIdleTimeout": 0})   ### This setting SUPER IMPORTANT Settings, This can make Appium 2–3× faster because it stops waiting for Android UI idle.
             else:
                 logger.info("Reusing existing Appium driver session")
@@ -101,6 +124,7 @@ class Appium_Driver():
     
     # Start Appium Server
     @classmethod
+    @timed(BANK)
     def start_appium_server(cls):
         
         global APPIUM_PROC
@@ -117,7 +141,7 @@ class Appium_Driver():
         APPIUM_CMD = os.getenv("APPIUM_CMD")
         APPIUM_PROC = subprocess.Popen([
             APPIUM_CMD,
-            "--port", "8021",
+            "--port", str(WORKER.appium_port),
             "--allow-insecure", "uiautomator2:adb_shell",
             "--allow-cors"
         ],
@@ -130,7 +154,7 @@ class Appium_Driver():
         # Wait until Appium server is ready, retry 10 times
         for attempt in range(1, 11):
             try:
-                if requests.get("http://127.0.0.1:8021/status").ok:
+                if requests.get(f"{WORKER.appium_url}/status").ok:
                     logger.info("Appium server is ready (attempt %s/10)", attempt)
                     return
             except Exception:
@@ -147,45 +171,15 @@ class Eric():
 
     # Callback ERIC API
     @classmethod
+    @timed(BANK)
     def eric_api(cls, data):
 
         try:
-            url = "https://bot-integration.cloudbdtech.com/integration-service/transaction/payoutScriptCallback"
-
-            # Create payload as a DICTIONARY (not JSON yet)
-            payload = {
-                "bankCode": str(data["fromBankCode"]),
-                "deviceId": str(data["deviceId"]),
-                "merchantCode": str(data["merchantCode"]),
-                "transactionId": str(data["transactionId"]),
-            }
-
-            # Your secret key
-            secret_key = "PRODBankBotIsTheBest"
-
-            # Build the hash string (exact order required)
-            string_to_hash = (
-                f"bankCode={payload['bankCode']}&"
-                f"deviceId={payload['deviceId']}&"
-                f"merchantCode={payload['merchantCode']}&"
-                f"transactionId={payload['transactionId']}{secret_key}"
-            )
-
-            # Generate MD5 hash
-            hash_result = hashlib.md5(string_to_hash.encode("utf-8")).hexdigest()
-
-            # Convert payload to JSON string AFTER hash
-            payload_json = json.dumps(payload)
-
-            # Send request
-            headers = {
-                'accept': '*/*',
-                'hash': hash_result,
-                'Content-Type': 'application/json'
-            }
-
-            response = requests.post(url, headers=headers, data=payload_json)
-            response.raise_for_status()
+            # Send request through the shared Eric client (keep-alive pool, timeout, retry)
+            response, req = ERIC.payout_callback(data)
+            payload = json.loads(req["body"])
+            string_to_hash = req["string_to_hash"]
+            hash_result = req["hash"]
 
             # Debug info
             print("Raw string to hash:", string_to_hash)
@@ -225,64 +219,57 @@ class Eric():
 
 # ================== Chrome Settings ================
 
+# Chrome of this worker (profile / CDP port of WorkerSettings, reused after a bot restart)
+CHROME = ChromeManager(BANK)
+
 class Automation:
-    
-    chrome_proc = None
 
-    # Chrome CDP
+    # Resource blocker profile of this bank portal (common/resource_blocker.py)
+    RESOURCE_PROFILE = "kma"
+    BLOCKER = None
+
+    # Block images / fonts / media / trackers of a new page, bytes and time saved are logged per page load
     @classmethod
+    def block_resources(cls, page):
+        cls.BLOCKER = ResourceBlocker(cls.RESOURCE_PROFILE).attach(page)
+        return cls.BLOCKER
+
+    # Chrome CDP (attach to the running Chrome of this profile, else launch it, common/chrome_manager.py)
+    @classmethod
+    @timed(BANK)
     def chrome_cdp(cls):
+        global BROWSER, CONTEXT, PAGE
 
-        # Prevent starting Chrome more than once
-        if cls.chrome_proc:
-            return
-        
         # Load .env file
         load_dotenv()
-        USER_DATA_DIR = os.getenv("CHROME_PATH")
-
-        cls.chrome_proc = subprocess.Popen([
-            r"C:\Program Files\Google\Chrome\Application\chrome.exe",
-            "--remote-debugging-port=9222",
-            "--disable-session-crashed-bubble",
-            "--hide-crash-restore-bubble",
-            "--no-first-run",
-            "--no-default-browser-check",
-            f"--user-data-dir={USER_DATA_DIR}",
-        ], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-
-        cls.wait_for_cdp_ready()
-        atexit.register(cls.cleanup)
-
-    # Close Chrome Completely
+
+        # New Chrome (first start or the old one died): the Playwright connection to the old one is gone
+        if CHROME.ensure():
+            BROWSER = CONTEXT = PAGE = None
+
+    # Close Chrome Completely (only a Chrome launched by this bot)
     @classmethod
     def cleanup(cls):
-        try:
-            if cls.chrome_proc and cls.chrome_proc.poll() is None:
-                cls.chrome_proc.terminate()
-        except Exception:
-            pass
-
-    # Wait Chrome CDP Ready
-    @staticmethod
-    def wait_for_cdp_ready(timeout=10):
-        for _ in range(timeout):
-            try:
-                if requests.get("http://localhost:9222/json").status_code == 200:
-                    return
-            except:
-                pass
-            time.sleep(1)
-        raise RuntimeError("Chrome CDP not ready")
+        CHROME.stop()
 
 # ================== KMA BANK BOT ===================
 
 class BankBot(Automation, Appium_Driver, Eric):
     
     _kma_ref = None
+    _otp_warmup = None
+
+    # Cheap session probe (no wait): transfer form shown, no logout message
+    @classmethod
+    def kma_session_probe(cls, page):
+        try:
+            return page.locator("#ddlBanking").is_visible() and not page.locator("//div[@class='header_error']").is_visible()
+        except Exception:
+            return False
 
     # Login
     @classmethod
+    @timed(BANK)
     def kma_login(cls, data):
 
         try:
@@ -297,7 +284,7 @@ class BankBot(Automation, Appium_Driver, Eric):
 
             # Connect to running Chrome ONLY ONCE
             if BROWSER is None:
-                BROWSER = PLAYWRIGHT.chromium.connect_over_cdp("http://localhost:9222")
+                BROWSER = PLAYWRIGHT.chromium.connect_over_cdp(CHROME.cdp_url)
 
             # Reuse context
             CONTEXT = BROWSER.contexts[0] if BROWSER.contexts else BROWSER.new_context()
@@ -305,9 +292,14 @@ class BankBot(Automation, Appium_Driver, Eric):
             # Reuse page
             if PAGE is None or PAGE.is_closed():
                 PAGE = CONTEXT.new_page()
+                cls.block_resources(PAGE)
 
             page = PAGE
 
+            # Hot form: transfer form left open by the last payout ("Transfer other transaction"), skip login
+            if cls.kma_session_probe(page):
+                return page # Already Login
+
             # If already on transfer page, skip login
             try:
                 page.locator("//div[@class='page_header']").wait_for(timeout=1500)
@@ -357,6 +349,7 @@ class BankBot(Automation, Appium_Driver, Eric):
 
     # Withdrawal
     @classmethod
+    @timed(BANK)
     def kma_withdrawal(cls, page, data):
 
         # Withdrawal Process
@@ -368,80 +361,112 @@ class BankBot(Automation, Appium_Driver, Eric):
             # Select Bank Code
             logger.info("Select Bank Name ... ")
             page.locator("#ddlBanking").wait_for(timeout=10000)
-            page.select_option("#ddlBanking", str(data["toBankCode"]))
-
-            try:
-                # Wait only 5 seconds for the message
-                page.wait_for_selector("//div[@class='header_error']", timeout=5000)
-                
-                # Print Detect Invalid Session
-                logger.info("Detected logout message. Redirecting to login ...")
 
-                # Button Click Sign in
-                logger.info("Click Sign in ...")
-                page.click("//input[@id='ctl00_cphSectionButton_btnLogin']")
-                time.sleep(1)
-
-                BankBot.kma_login(data)    
+            # Mark the current document: the transfer form only counts once the bank postback replaced it
+            page.evaluate("() => { window.__kmaBeforeBankPostback = true }")
+            page.select_option("#ddlBanking", str(data["toBankCode"]))
 
-                # Select Bank Code
-                logger.info("Select Bank Name ... ")
-                page.locator("#ddlBanking").wait_for(timeout=10000)
-                page.select_option("#ddlBanking", str(data["toBankCode"]))
-    
-            except:
-                pass
+            # Session probe: the logout message, or the transfer form of the page reloaded by the bank selection (5 seconds max, none = live session)
+            header_error = page.locator("//div[@class='header_error']")
+            account_field = page.locator("#ctl00_cphSectionData_txtAccTo")
+            state = WAIT.until("bank_selected", lambda: (
+                "session_expired" if header_error.first.is_visible()
+                else "form_ready" if account_field.first.is_visible() and not page.evaluate("() => window.__kmaBeforeBankPostback === true")
+                else None
+            ), timeout=5)
+
+            if state == "session_expired":
+                try:
+                    # Print Detect Invalid Session
+                    logger.info("Detected logout message. Redirecting to login ...")
+
+                    # Button Click Sign in
+                    logger.info("Click Sign in ...")
+                    page.click("//input[@id='ctl00_cphSectionButton_btnLogin']")
+                    time.sleep(1)
+
+                    BankBot.kma_login(data)    
+
+                    # Select Bank Code
+                    logger.info("Select Bank Name ... ")
+                    page.locator("#ddlBanking").wait_for(timeout=10000)
+                    page.select_option("#ddlBanking", str(data["toBankCode"]))
+        
+                except:
+                    pass
 
             # Fill in Account Number
-            logger.info("Fill in Account Number ... ")
-            page.fill("#ctl00_cphSectionData_txtAccTo", str(data["toAccountNum"]))
+            with step(BANK, "fill_account_number"):
+                logger.info("Fill in Account Number ... ")
+                page.fill("#ctl00_cphSectionData_txtAccTo", str(data["toAccountNum"]))
 
             # Fill in Amount
-            logger.info("Fill in Amount ... ")
-            page.fill("#ctl00_cphSectionData_txtAmountTransfer", str(data["amount"]))
+            with step(BANK, "fill_amount"):
+                logger.info("Fill in Amount ... ")
+                page.fill("#ctl00_cphSectionData_txtAmountTransfer", str(data["amount"]))
 
             # Click Submit
-            logger.info("Click Submit button ... ")
-            page.click("#ctl00_cphSectionData_btnSubmit")
+            with step(BANK, "click_submit"):
+                logger.info("Click Submit button ... ")
+                page.click("#ctl00_cphSectionData_btnSubmit")
+
+            # Journal: transfer submitted, waiting for the OTP
+            JOBS.checkpoint("form_submitted", data)
 
             # Wait for OTP Box Appear
-            logger.info("Waiting for OTP Box Appear ... ")
-            page.locator(".otpbox_header").wait_for(timeout=10000)
+            with step(BANK, "wait_otp_box"):
+                logger.info("Waiting for OTP Box Appear ... ")
+                page.locator(".otpbox_header").wait_for(timeout=10000)
 
             # Capture OTP Reference Number
-            logger.info("Capture OTP Reference Number ... ")
-            cls._kma_ref = page.locator("//div[@class='inputbox_half_center']//div[@class='input_input_half']").first.inner_text().strip()
+            with step(BANK, "capture_otp_ref"):
+                logger.info("Capture OTP Reference Number ... ")
+                cls._kma_ref = page.locator("//div[@class='inputbox_half_center']//div[@class='input_input_half']").first.inner_text().strip()
 
             # Run Read OTP Code
-            otp = cls.kma_read_otp()
-            logger.info("Successful Get OTP-Code ...")
+            with step(BANK, "run_read_otp_code"):
+                otp = cls.kma_read_otp(cls._kma_ref)
+                logger.info("Successful Get OTP-Code ...")
 
             # Fill OTP Code
-            logger.info(f"Fill in OTP Code = {otp} ")
-            page.fill("#ctl00_cphSectionData_OTPBox1_txtOTPPassword", otp)
+            with step(BANK, "fill_otp_code"):
+                logger.info(f"Fill in OTP Code = {otp} ")
+                page.fill("#ctl00_cphSectionData_OTPBox1_txtOTPPassword", otp)
 
             # Delay 0.5 second
             page.wait_for_timeout(500)
 
             # Button Click "Confirm"
-            logger.info("Click Confirm ... ")
-            page.locator("//input[@id='ctl00_cphSectionData_OTPBox1_btnConfirm']").click(timeout=0)
-            page.locator("//input[@id='ctl00_cphSectionData_OTPBox1_btnConfirm']").click(timeout=0)
+            with step(BANK, "click_confirm"):
+                logger.info("Click Confirm ... ")
+                page.locator("//input[@id='ctl00_cphSectionData_OTPBox1_btnConfirm']").click(timeout=0)
+                page.locator("//input[@id='ctl00_cphSectionData_OTPBox1_btnConfirm']").click(timeout=0)
+
+            # Journal: OTP entered and confirmed
+            JOBS.checkpoint("otp_entered", data)
 
             # Wait for Appear withdrawal Successful
-            logger.info("Wait for 'Appear Withdrawal Successful' Text appear ... ")
-            page.locator("#ctl00_cphSectionData_pnlSuccessMsg").wait_for(timeout=10000)
+            with step(BANK, "wait_withdrawal_successful"):
+                logger.info("Wait for 'Appear Withdrawal Successful' Text appear ... ")
+                page.locator("#ctl00_cphSectionData_pnlSuccessMsg").wait_for(timeout=10000)
 
             # Delay 1 second
             page.wait_for_timeout(1000)
 
+            # Journal: transfer done by the bank
+            JOBS.checkpoint("bank_confirmed", data)
+
             # Call Eric API
             logger.info("Call Back Eric API ...")
             cls.eric_api(data)
 
+            # Journal: Eric notified
+            JOBS.checkpoint("eric_notified", data)
+
             # Button click "Transfer other transaction"
-            logger.info("Click 'Transfer other Transaction' ...")
-            page.click("#ctl00_cphSectionData_btnOtherTxn")
+            with step(BANK, "click_transfer_other_transaction"):
+                logger.info("Click 'Transfer other Transaction' ...")
+                page.click("#ctl00_cphSectionData_btnOtherTxn")
 
         except Exception as e:
             error_trace = traceback.format_exc()
@@ -451,64 +476,50 @@ class BankBot(Automation, Appium_Driver, Eric):
 
     # Read Phone Message OTP Code
     @classmethod
-    def kma_read_otp(cls):
+    @timed(BANK)
+    def kma_read_otp(cls, ref_code):
         
         # Read OTP
         logger.info("="*50)
         logger.info("🎰 Starting Read Phone SMS OTP-Code Flow ....")
         logger.info("="*50)
         
+        # OTP reader warmed up since the payout start, else set it up now
+        if not (cls._otp_warmup and cls._otp_warmup.ready()):
+            cls.kma_otp_setup()
+
         driver = cls.use_appium_driver()
 
-        # Start Messages Apps
-        driver.activate_app("com.google.android.apps.messaging")
+        # OTP broker of the phone: woken as soon as the SMS of this Ref is in the inbox
+        if SmsInbox.ENABLED:
+            try:
+                otp = OTP.wait("kma", ref_code, since=JOBS.running_since(time.time()))
+                logger.info(f"Found matching Ref: {ref_code} | OTP: {otp} ✅")
+                return otp
+            except SmsInboxError as e:
+                logger.warning(f"SMS inbox query failed ({e}), read the Messages app instead")
 
-        # ADB Shell Never Screen Timeout
-        logger.info("ADB Shell Screen never Time Out ...")
-        driver.execute_script("mobile: shell", {"command": "settings","args": ["put", "system", "screen_off_timeout", "2147483647"]})
+        # Start Messages Apps (fallback of the SMS inbox query)
+        driver.activate_app("com.google.android.apps.messaging")
 
-    
         while True:
             try:
 
                 # Read All KMA Bank Messages
                 logger.info("🤖 Reading latest message from KMA bank...")
 
-                # Wait for the 'message_list' container to be visible
-                # We use the specific XPath from your screenshot to avoid ID errors
-                WebDriverWait(driver, 15).until(EC.visibility_of_element_located((AppiumBy.XPATH, '//android.view.View[@resource-id="message_list"]')))
-
-                # Find all 'message_text' elements that are descendants (offspring) of 'message_list'
-                # The "//" in the middle acts as the .offspring() command
-                message_nodes = driver.find_elements(AppiumBy.XPATH, '//android.view.View[@resource-id="message_list"]//android.widget.TextView[@resource-id="message_text"]')
-                
-                # Store Messages OTP
+                # Store Messages OTP (Ref, OTP), newest first
                 otp_candidates = []
 
-                # Process the messages (Newest first)
-                for node in reversed(message_nodes):
-                    try:
-                        # Get the text content
-                        messages = node.text
-                        
-                        if not messages:
-                            continue
-                            
-                        # Regex to find Ref and OTP
-                        match = re.search(r"\bRef\s*[:\-]?\s*(\d+)\b.*?\bOTP\s*[:\-]?\s*(\d+)\b", messages, re.IGNORECASE)
-
-                        if match:
-                            _messages_ref_code, messages_otp_code = match.groups()
-                            otp_candidates.append((_messages_ref_code.strip(), messages_otp_code.strip()))
-                            logger.info(f"# Ref: {_messages_ref_code}, OTP: {messages_otp_code} ❌")
-
-                    except Exception:
-                        # Ignore errors for single stale elements
-                        continue
+                for messages in cls.kma_sms_ui_texts(driver):
+                    found = parse_otp("kma", messages)
+                    if found:
+                        otp_candidates.append(found)
+                        logger.info(f"# Ref: {found[0]}, OTP: {found[1]} ❌")
 
                 # Match correct Ref Code 
                 for _messages_ref_code, messages_otp_code in otp_candidates:
-                    if cls._kma_ref == _messages_ref_code:
+                    if str(ref_code).upper() == _messages_ref_code:
                         logger.info(f"Found matching Ref: {_messages_ref_code} | OTP: {messages_otp_code} ✅")
                         return messages_otp_code
                     
@@ -520,26 +531,73 @@ class BankBot(Automation, Appium_Driver, Eric):
                 logger.info(f"❌ Error reading messages: {e}")
                 time.sleep(1)
 
+    # OTP reader setup: Appium session, screen never off, inbox baseline (or Messages app open)
+    @classmethod
+    def kma_otp_setup(cls):
+
+        driver = cls.use_appium_driver()
+
+        # ADB Shell Never Screen Timeout
+        logger.info("ADB Shell Screen never Time Out ...")
+        driver.execute_script("mobile: shell", {"command": "settings","args": ["put", "system", "screen_off_timeout", "2147483647"]})
+
+        # Messages already in the inbox (only new ones are parsed once the Ref is known)
+        if SmsInbox.ENABLED:
+            try:
+                OTP.prime(JOBS.running_since(time.time()))
+                return
+            except SmsInboxError as e:
+                logger.warning(f"SMS inbox query failed ({e}), read the Messages app instead")
+
+        # Start Messages Apps
+        driver.activate_app("com.google.android.apps.messaging")
+
+    # Messages app UI: text of every message bubble, newest first (fallback of the SMS inbox query)
+    @classmethod
+    def kma_sms_ui_texts(cls, driver):
+
+        # Wait for the 'message_list' container to be visible
+        # We use the specific XPath from your screenshot to avoid ID errors
+        WebDriverWait(driver, 15).until(EC.visibility_of_element_located((AppiumBy.XPATH, '//android.view.View[@resource-id="message_list"]')))
+
+        # Find all 'message_text' elements that are descendants (offspring) of 'message_list'
+        # The "//" in the middle acts as the .offspring() command
+        message_nodes = driver.find_elements(AppiumBy.XPATH, '//android.view.View[@resource-id="message_list"]//android.widget.TextView[@resource-id="message_text"]')
+
+        texts = []
+        for node in reversed(message_nodes):
+            try:
+                # Get the text content
+                if node.text:
+                    texts.append(node.text)
+            except Exception:
+                # Ignore errors for single stale elements
+                continue
+        return texts
+
 # ================== Code Start Here ================
 
-# Run API
-@app.route("/kma_company_web/runPython", methods=["POST"])        
-def runPython():
-    data = request.get_json(silent=True)
-    if not data:
-        return jsonify({"success": False, "message": "Invalid JSON"}), 400
+# Run one payout (called by the job runner thread, one payout at a time)
+def run_payout(data):
 
     with LOCK:
         try:
+            # OTP reader warms up in the background while the web form is submitted
+            BankBot._otp_warmup = OtpWarmup.begin(BankBot._otp_warmup, BankBot.kma_otp_setup)
+
             # Run Browser
             Automation.chrome_cdp()
             # Login KMA
             page = BankBot.kma_login(data)
+
+            # Journal: logged in
+            JOBS.checkpoint("logged_in", data)
+
             BankBot.kma_withdrawal(page, data)
-            return jsonify({
+            return {
                 "success": True,
                 "transactionId": data["transactionId"]
-            })
+            }
         except Exception as e:
             full_trace = traceback.format_exc()
             
@@ -559,12 +617,17 @@ def runPython():
             # Use os._exit(1) to exit immediately from the thread
             os._exit(1)
             
-            return jsonify({
+            return {
                 "success": False,
                 "message": str(e),
                 "error_type": type(e).__name__
-            }), 500
+            }
         
+# Async job API: POST /kma_company_web/jobs → 202 + jobId, GET /kma_company_web/jobs/<jobId> status, GET /kma_company_web/jobs queue depth
+# /kma_company_web/runPython still answers when the payout is done (202 with "Prefer: respond-async")
+JOBS = JobQueue("kma_company_web", run_payout, required=["transactionId", "amount", "password", "toAccountNum", "toBankCode", "username"], notify=BankBot.eric_api)
+runPython = JOBS.register(app, "/kma_company_web")
+
 if __name__ == "__main__":
     BankBot.start_ws_client()
-    app.run(host="0.0.0.0", port=5002, debug=False, threaded=False, use_reloader=False)
+    app.run(host="0.0.0.0", port=WORKER.flask_port(5002), debug=False, threaded=True, use_reloader=False)
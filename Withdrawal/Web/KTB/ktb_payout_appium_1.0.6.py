@@ -6,7 +6,6 @@ import json
 import time
 import queue
 import atexit
-import hashlib
 import logging
 import requests
 import traceback
@@ -14,7 +13,7 @@ import threading
 import subprocess
 from threading import Lock
 from dotenv import load_dotenv
-from flask import Flask, request, jsonify
+from flask import Flask
 from playwright.sync_api import sync_playwright
 from appium import webdriver
 from appium.webdriver.common.appiumby import *
@@ -23,6 +22,35 @@ from appium.options.android import UiAutomator2Options
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 
+# ================== Shared Modules ==================
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..")))
+from common.eric_client import ERIC
+from common.job_api import JobQueue
+from common.worker_pool import WORKER
+from common.chrome_manager import ChromeManager
+from common.resource_blocker import ResourceBlocker
+from common.step_metrics import step, timed
+from common.wait_engine import WaitEngine
+from common.sms_inbox import SmsInbox, SmsInboxError
+from common.otp_broker import create_broker, parse_otp, OtpWarmup
+from common.session_state import SessionState
+
+# Step metrics label (same as the job API name)
+BANK = "ktb_company_web"
+
+# Readiness waits instead of fixed sleeps (deadlines: WAIT_DEADLINES)
+WAIT = WaitEngine(BANK)
+
+# Hot form: after each payout the page is left on a fresh transfer form, the next one skips the menu navigation (HOT_FORM=0: off)
+HOT_FORM = os.getenv("HOT_FORM", "1") != "0"
+
+# Encrypted login state, restored after a Chrome restart (SESSION_STATE_KEY)
+SESSION = SessionState(BANK)
+
+# OTP SMS of the phone keyed by Ref (OTP_BROKER_URL: broker server shared by the bots of the phone)
+OTP = create_broker(lambda: SmsInbox(SmsInbox.appium_shell(BankBot.use_appium_driver()), sender=os.getenv("SMS_SENDER")))
+
 # ================== Version Change ==========================
 
 # - 1.0.2
@@ -95,6 +123,7 @@ class Appium_Driver:
 
     # Use Appium Driver
     @classmethod
+    @timed(BANK)
     def use_appium_driver(cls):
         global APPIUM_DRIVER
         logger.info("Preparing Appium driver")
@@ -106,10 +135,11 @@ class Appium_Driver:
                 options = UiAutomator2Options()
                 options.platform_name = "Android"
                 options.device_name = "androidtesting"
+                WORKER.apply_device(options)
                 options.automation_name = "UiAutomator2"
                 options.new_command_timeout = 86400
 
-                APPIUM_DRIVER = webdriver.Remote("http://127.0.0.1:8021", options=options)
+                APPIUM_DRIVER = webdriver.Remote(WORKER.appium_url, options=options)
                 APPIUM_DRIVER.update_settings({"waitForIdleTimeout": 0})   ### This setting SUPER IMPORTANT Settings, This can make Appium 2–3× faster because it stops waiting for Android UI idle.
             else:
                 logger.info("Reusing existing Appium driver session")
@@ -118,6 +148,7 @@ class Appium_Driver:
     
     # Start Appium Server
     @classmethod
+    @timed(BANK)
     def start_appium_server(cls):
         
         global APPIUM_PROC
@@ -134,7 +165,7 @@ class Appium_Driver:
         APPIUM_CMD = os.getenv("APPIUM_CMD")
         APPIUM_PROC = subprocess.Popen([
             APPIUM_CMD,
-            "--port", "8021",
+            "--port", str(WORKER.appium_port),
             "--allow-insecure", "uiautomator2:adb_shell",
             "--allow-cors"
         ],
@@ -147,7 +178,7 @@ class Appium_Driver:
         # Wait until Appium server is ready, retry 10 times
         for attempt in range(1, 11):
             try:
-                if requests.get("http://127.0.0.1:8021/status").ok:
+                if requests.get(f"{WORKER.appium_url}/status").ok:
                     logger.info("Appium server is ready (attempt %s/10)", attempt)
                     return
             except Exception:
@@ -164,43 +195,15 @@ class Eric:
 
     # Callback ERIC API
     @classmethod
+    @timed(BANK)
     def eric_api(cls, data):
 
-        url = "https://bot-integration.cloudbdtech.com/integration-service/transaction/payoutScriptCallback"
-
-        # Create payload as a DICTIONARY (not JSON yet)
-        payload = {
-            "bankCode": str(data["fromBankCode"]),
-            "deviceId": str(data["deviceId"]),
-            "merchantCode": str(data["merchantCode"]),
-            "transactionId": str(data["transactionId"]),
-        }
-
-        # Your secret key
-        secret_key = "PRODBankBotIsTheBest"
-
-        # Build the hash string (exact order required)
-        string_to_hash = (
-            f"bankCode={payload['bankCode']}&"
-            f"deviceId={payload['deviceId']}&"
-            f"merchantCode={payload['merchantCode']}&"
-            f"transactionId={payload['transactionId']}{secret_key}"
-        )
-
-        # Generate MD5 hash
-        hash_result = hashlib.md5(string_to_hash.encode("utf-8")).hexdigest()
-
-        # Convert payload to JSON string AFTER hash
-        payload_json = json.dumps(payload)
-
-        # Send request
-        headers = {
-            'accept': '*/*',
-            'hash': hash_result,
-            'Content-Type': 'application/json'
-        }
-
-        response = requests.post(url, headers=headers, data=payload_json)
+        # Send request through the shared Eric client (keep-alive pool, timeout, retry)
+        # A 4xx/5xx reply is only printed, the payout is not failed on it (money already sent)
+        response, req = ERIC.payout_callback(data, check=False)
+        payload = json.loads(req["body"])
+        string_to_hash = req["string_to_hash"]
+        hash_result = req["hash"]
 
         # 7️⃣ Debug info
         print("Raw string to hash:", string_to_hash)
@@ -289,10 +292,16 @@ class BrowserWorker:
 
                         self.touch()
 
+                        # OTP reader warms up in the background while the web form is submitted
+                        BankBot._otp_warmup = OtpWarmup.begin(BankBot._otp_warmup, BankBot.ktb_otp_setup)
+
                         # all Playwright work stays in this worker thread
                         Automation.chrome_cdp()
                         page = BankBot.ktb_login(data)
 
+                        # Journal: logged in
+                        JOBS.checkpoint("logged_in", data)
+
                         # if is False, means no active session, do not logout
                         # if is True, means
                         self.session_active = True
@@ -306,10 +315,20 @@ class BrowserWorker:
                             "transactionId": data["transactionId"]
                         })
 
+                        # Hot form: open the next transfer form now, off the payout's critical path
+                        if HOT_FORM:
+                            try:
+                                BankBot.ktb_open_transfer_form(page)
+                                BankBot._fresh_form = True
+                            except Exception:
+                                logger.warning("Hot form not ready, the next payout navigates again", exc_info=True)
+                            self.touch()
+
                     elif action == "logout":
                         if self.session_active and PAGE is not None and not PAGE.is_closed():
                             BankBot.ktb_logout(PAGE)
                         self.session_active = False
+                        BankBot._fresh_form = False
                         self.touch()
                         reply_q.put({"success": True})
 
@@ -320,6 +339,8 @@ class BrowserWorker:
                         })
 
                 except Exception as e:
+                    # The form may hold the failed payout's payee / amount: the next payout navigates again
+                    BankBot._fresh_form = False
                     full_trace = traceback.format_exc()
                     logger.error(f"Worker error:\n{full_trace}")
                     reply_q.put({
@@ -333,65 +354,103 @@ class BrowserWorker:
 
 # ================== Chrome Settings ==================
 
+# Chrome of this worker (profile / CDP port of WorkerSettings, reused after a bot restart)
+CHROME = ChromeManager(BANK)
+
 class Automation:
-    
-    chrome_proc = None
 
-    # Chrome CDP
+    # Resource blocker profile of this bank portal (common/resource_blocker.py)
+    RESOURCE_PROFILE = "ktb"
+    BLOCKER = None
+
+    # Block images / fonts / media / trackers of a new page, bytes and time saved are logged per page load
+    @classmethod
+    def block_resources(cls, page):
+        cls.BLOCKER = ResourceBlocker(cls.RESOURCE_PROFILE).attach(page)
+        return cls.BLOCKER
+
+    # Chrome CDP (attach to the running Chrome of this profile, else launch it, common/chrome_manager.py)
     @classmethod
+    @timed(BANK)
     def chrome_cdp(cls):
+        global BROWSER, CONTEXT, PAGE
 
-        # Prevent starting Chrome more than once
-        if cls.chrome_proc:
-            return
-        
         # Load .env file
         load_dotenv()
-        USER_DATA_DIR = os.getenv("CHROME_PATH")
-
-        cls.chrome_proc = subprocess.Popen([
-            r"C:\Program Files\Google\Chrome\Application\chrome.exe",
-            "--remote-debugging-port=9222",
-            "--disable-session-crashed-bubble",
-            "--hide-crash-restore-bubble",
-            "--no-first-run",
-            "--no-default-browser-check",
-            f"--user-data-dir={USER_DATA_DIR}",
-        ], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-
-        cls.wait_for_cdp_ready()
-        atexit.register(cls.cleanup)
-
-    # Close Chrome Completely
+
+        # New Chrome (first start or the old one died): the Playwright connection to the old one is gone
+        if CHROME.ensure():
+            BROWSER = CONTEXT = PAGE = None
+
+    # Close Chrome Completely (only a Chrome launched by this bot)
     @classmethod
     def cleanup(cls):
-        try:
-            if cls.chrome_proc and cls.chrome_proc.poll() is None:
-                logging.getLogger("bank_bot").info("Closing Chrome CDP")
-                cls.chrome_proc.terminate()
-        except Exception:
-            logging.getLogger("bank_bot").exception("Chrome cleanup error")
-
-    # Wait Chrome CDP Ready
-    @staticmethod
-    def wait_for_cdp_ready(timeout=10):
-        for _ in range(timeout):
-            try:
-                if requests.get("http://localhost:9222/json").status_code == 200:
-                    return
-            except:
-                pass
-            time.sleep(1)
-        raise RuntimeError("Chrome CDP not ready")
+        CHROME.stop()
 
 # ================== KTB BANK BOT =====================
 
 class BankBot(Automation, Appium_Driver, Eric):
     
     _ktb_web_ref_code = None
+    _otp_warmup = None
+    _fresh_form = False     # hot form opened after a successful payout, not used by a payout yet
+
+    # Ref Code shown in the OTP dialog (upper case), None while not rendered yet
+    @classmethod
+    def ktb_ref_on_page(cls, page):
+        text = page.locator("//p[@class='ref ref-number-size mb-16px']").inner_text()
+        match = re.search(r"Ref\.?\s*([A-Za-z0-9]+)", text, re.IGNORECASE)
+        return match.group(1).upper() if match else None
+
+    # Cheap session probe (no wait): logged in and on the "Transfer Details" form
+    @classmethod
+    def ktb_session_probe(cls, page):
+        try:
+            if "#/login" in page.url:
+                return False
+            return page.locator("//h4[normalize-space()='Transfer Details']").is_visible()
+        except Exception:
+            return False
+
+    # Navigate to a new transfer form (left menu → Transfer & Pay → New Transfer)
+    @classmethod
+    @timed(BANK)
+    def ktb_open_transfer_form(cls, page):
+
+        # Hover to Left Menu
+        with step(BANK, "hover_left_menu"):
+            page.locator("//a[@class='link active']").hover()
+            logger.info("Hover to left Menu ...")
+
+        # Wait for the left menu to open
+        WAIT.visible("transfer_pay_menu", page.locator("//span[normalize-space()='Transfer & Pay']"), timeout=1)
+
+        # Click Transfer & Pay
+        with step(BANK, "click_transfer_pay"):
+            logger.info("Click 'Transfer & Pay' ... ")
+            page.locator("//span[normalize-space()='Transfer & Pay']").evaluate("node => node.click()")
+        
+        # Wait for "Transfer & Bill Payment" Appear
+        with step(BANK, "wait_transfer_bill_payment"):
+            logger.info("Wait for 'Transfer & Bill Payment' ... ")
+            page.locator("//a[normalize-space()='Transfer & Bill Payment']").wait_for(state="visible", timeout=0)
+
+        # Wait for the "New Transfer" card to settle
+        WAIT.stable("new_transfer_card", page.locator("ui-card-sub-menu"), timeout=1)
+
+        # Button Click "New Transfer"
+        with step(BANK, "click_new_transfer"):
+            logger.info("Click 'New Transfer' ... ")
+            page.locator("//body/ktb-root/ui-layout/div[@class='main-container']/ui-side-panel/ng-sidebar-container[@backdropclass='custom-backdrop']/div[@class='ng-sidebar__content ng-sidebar__content--animate']/main/div[@class='main-inner']/ktb-module-transfer-pay[@class='ng-star-inserted']/ktb-module-transfer-pay-index-page[@class='ng-star-inserted']/ui-section[@class='transfer-landing-header section-wrapper ng-star-inserted']/section[@class='is-dark']/div[@class='section-content']/ui-container/div[@class='container']/div[@class='inner']/div[@class='sub-menu-container ng-star-inserted']/ui-card-sub-menu[1]/div[1]").click(timeout=0)
+
+        # Wait for "Transfer Details" Appear
+        with step(BANK, "wait_transfer_details_appear"):
+            logger.info("Wait for 'Transfer Details' ...")
+            page.locator("//h4[normalize-space()='Transfer Details']").wait_for(state="visible", timeout=30000)
 
     # Login
     @classmethod
+    @timed(BANK)
     def ktb_login(cls, data):
         
         global PLAYWRIGHT, BROWSER, CONTEXT, PAGE
@@ -405,7 +464,7 @@ class BankBot(Automation, Appium_Driver, Eric):
 
         # Connect to running Chrome ONLY ONCE
         if BROWSER is None:
-            BROWSER = PLAYWRIGHT.chromium.connect_over_cdp("http://localhost:9222")
+            BROWSER = PLAYWRIGHT.chromium.connect_over_cdp(CHROME.cdp_url)
 
         # Reuse context
         CONTEXT = BROWSER.contexts[0] if BROWSER.contexts else BROWSER.new_context()
@@ -413,6 +472,7 @@ class BankBot(Automation, Appium_Driver, Eric):
         # Reuse page
         if PAGE is None or PAGE.is_closed():
             PAGE = CONTEXT.new_page()
+            cls.block_resources(PAGE)
 
         page = PAGE
 
@@ -421,12 +481,16 @@ class BankBot(Automation, Appium_Driver, Eric):
         logger.info(f"🎰 Starting KTB Company Web Login Flow .... {data['transactionId']}")
         logger.info("="*50)
 
-        # If already on transfer page, skip login
-        try:
-            page.locator("//h4[normalize-space()='Transfer Details']").wait_for(timeout=3000)
+        # If already on a fresh transfer page, skip login (hot form of the last payout)
+        if cls._fresh_form and cls.ktb_session_probe(page):
             return page # Already Login
-        except:
-            pass
+
+        # Saved login after a Chrome restart: restore it when "Account Overview" shows up (the withdrawal then navigates)
+        if SESSION.restore(CONTEXT, page, "https://business.krungthai.com/", probe=lambda: WAIT.first("session_probe", {
+            "logged_in": page.locator("//h4[normalize-space()='Account Overview']"),
+            "login": page.locator("//input[@placeholder='Enter company ID']"),
+        }, timeout=15) == "logged_in"):
+            return page
         
         # Browse to Krungthai Website 
         logger.info("Browse to Krungthai Website ...")
@@ -436,8 +500,8 @@ class BankBot(Automation, Appium_Driver, Eric):
         logger.info("Force change to English Language ...")
         page.locator("//p[@class='language-english']").click(timeout=0) 
 
-        # Delay 0.5 seconds
-        page.wait_for_timeout(500) 
+        # Wait for the login form (English)
+        WAIT.visible("login_form_ready", page.locator("//input[@placeholder='Enter company ID']"), timeout=0.5)
 
         # if Account already login, can skip
         logger.info("Perform Login ...")
@@ -454,8 +518,8 @@ class BankBot(Automation, Appium_Driver, Eric):
             logger.info('Fill in Password ...')
             page.locator("//input[@placeholder='Enter password']").fill(str(data["password"]), timeout=1000)
 
-            # Delay 0.5 seconds
-            page.wait_for_timeout(500)
+            # Wait for "Login" enabled
+            WAIT.enabled("login_button_ready", page.locator("//button[.//span[@class='ktb-button-label']]"), timeout=0.5)
 
             # Button Click "Login"
             logger.info("Click Login ...")
@@ -469,8 +533,8 @@ class BankBot(Automation, Appium_Driver, Eric):
         logger.info("Wait for OTP Verification ...")
         page.locator("//h4[normalize-space()='OTP Verification']").wait_for(state="visible", timeout=300000)
         
-        # Delay 1 second
-        page.wait_for_timeout(1000)  
+        # Wait for the Ref Code text
+        WAIT.until("login_otp_ref_ready", lambda: cls.ktb_ref_on_page(page), timeout=1)
 
         # Get KTB Ref Code
         logger.info("Read KTB Ref Code ...")
@@ -481,7 +545,7 @@ class BankBot(Automation, Appium_Driver, Eric):
             logger.info(f"KTB Web Ref Code: {cls._ktb_web_ref_code}")
 
         # Run Read OTP Code
-        otp = cls.ktb_read_otp(data)
+        otp = cls.ktb_read_otp(data, cls._ktb_web_ref_code)
         logger.info("Get OTP-Code Successful ....")
 
         # Fill OTP Code
@@ -496,10 +560,14 @@ class BankBot(Automation, Appium_Driver, Eric):
         logger.info("Wait for 'Account Overview' Appear ... " )
         page.locator("//h4[normalize-space()='Account Overview']").wait_for(state="visible", timeout=300000)
 
+        # Save the login state
+        SESSION.save(CONTEXT)
+
         return page
 
     # Withdrawal
     @classmethod
+    @timed(BANK)
     def ktb_withdrawal(cls, page, data):
         
         # Withdrawal Processs
@@ -507,177 +575,194 @@ class BankBot(Automation, Appium_Driver, Eric):
         logger.info(f"🎰 Starting KTB Company Web Withdrawal Flow ....  {data['transactionId']}")
         logger.info("="*50)
 
-        # Hover to Left Menu
-        page.locator("//a[@class='link active']").hover()
-        logger.info("Hover to left Menu ...")
-
-        # Delay 1 second
-        page.wait_for_timeout(1000)
-
-        # Click Transfer & Pay
-        logger.info("Click 'Transfer & Pay' ... ")
-        page.locator("//span[normalize-space()='Transfer & Pay']").evaluate("node => node.click()")
-        
-        # Wait for "Transfer & Bill Payment" Appear
-        logger.info("Wait for 'Transfer & Bill Payment' ... ")
-        page.locator("//a[normalize-space()='Transfer & Bill Payment']").wait_for(state="visible", timeout=0)
-
-        # Delay 1 second
-        page.wait_for_timeout(1000)
-
-        # Button Click "New Transfer"
-        logger.info("Click 'New Transfer' ... ")
-        page.locator("//body/ktb-root/ui-layout/div[@class='main-container']/ui-side-panel/ng-sidebar-container[@backdropclass='custom-backdrop']/div[@class='ng-sidebar__content ng-sidebar__content--animate']/main/div[@class='main-inner']/ktb-module-transfer-pay[@class='ng-star-inserted']/ktb-module-transfer-pay-index-page[@class='ng-star-inserted']/ui-section[@class='transfer-landing-header section-wrapper ng-star-inserted']/section[@class='is-dark']/div[@class='section-content']/ui-container/div[@class='container']/div[@class='inner']/div[@class='sub-menu-container ng-star-inserted']/ui-card-sub-menu[1]/div[1]").click(timeout=0)
-
-        # Wait for "Transfer Details" Appear
-        logger.info("Wait for 'Transfer Details' ...")
-        page.locator("//h4[normalize-space()='Transfer Details']").wait_for(state="visible", timeout=30000)
+        # Hot form: already on a fresh transfer form with a live session, else navigate to it
+        # (used once: a payout failing after this point leaves its payee / amount in the form)
+        fresh, cls._fresh_form = cls._fresh_form, False
+        if HOT_FORM and fresh and cls.ktb_session_probe(page):
+            logger.info("Transfer form already open (hot form), skip navigation ...")
+        else:
+            cls.ktb_open_transfer_form(page)
 
         # Click "Select Payee"
-        logger.info("Select Payee ...")
-        page.locator("//div[@class='add-payee-button']").click()
+        with step(BANK, "click_select_payee"):
+            logger.info("Select Payee ...")
+            page.locator("//div[@class='add-payee-button']").click()
 
         # Wait for "New Account" Appear
-        logger.info("Wait for 'New Account' Appear ...")
-        page.locator("//h6[normalize-space()='New Account']").wait_for(state="visible", timeout=30000)
+        with step(BANK, "wait_new_account_appear"):
+            logger.info("Wait for 'New Account' Appear ...")
+            page.locator("//h6[normalize-space()='New Account']").wait_for(state="visible", timeout=30000)
 
         # Click "New Account"  
-        logger.info("Click 'New Account' ...")
-        page.locator("//h6[normalize-space()='New Account']").click()
+        with step(BANK, "click_new_account"):
+            logger.info("Click 'New Account' ...")
+            page.locator("//h6[normalize-space()='New Account']").click()
 
-        # Delay 1 second
-        page.wait_for_timeout(1500)
+        # Wait for the bank search input
+        WAIT.enabled("bank_search_ready", page.locator("input[formcontrolname='searchControl']"), timeout=1.5)
 
         # Open dropdown (# Select Bank Code)
-        logger.info("Open 'Select Bank' Drop Down Menu ...")
-        bank_input = page.locator("input[formcontrolname='searchControl']")
-        bank_input.click()
-        bank_input.fill(str(data["toBankCode"]))
+        with step(BANK, "open_bank_dropdown"):
+            logger.info("Open 'Select Bank' Drop Down Menu ...")
+            bank_input = page.locator("input[formcontrolname='searchControl']")
+            bank_input.click()
+            bank_input.fill(str(data["toBankCode"]))
 
-        # Delay 1 second
-        page.wait_for_timeout(1500)
+        # Wait for the bank in the search result
+        WAIT.visible("bank_option_ready", page.get_by_text(str(data["toBankCode"]), exact=True), timeout=1.5)
 
         # Select bank
-        logger.info("Select Bank ...")
-        page.get_by_text(str(data["toBankCode"]), exact=True).wait_for(state="visible", timeout=5000)
-        page.get_by_text(str(data["toBankCode"]), exact=True).click()
+        with step(BANK, "select_bank"):
+            logger.info("Select Bank ...")
+            page.get_by_text(str(data["toBankCode"]), exact=True).wait_for(state="visible", timeout=5000)
+            page.get_by_text(str(data["toBankCode"]), exact=True).click()
 
-        # Delay 1 second
-        page.wait_for_timeout(1500)
+        # Wait for the account number input
+        WAIT.enabled("account_input_ready", page.get_by_placeholder("Enter account no."), timeout=1.5)
 
         # Fill AccouNT Number 
-        logger.info("Fill Account Number ...")
-        page.get_by_placeholder("Enter account no.").click()
-        page.get_by_placeholder("Enter account no.").fill(str(data["toAccountNum"])) 
-        page.keyboard.press("Tab")
+        with step(BANK, "fill_account_number"):
+            logger.info("Fill Account Number ...")
+            page.get_by_placeholder("Enter account no.").click()
+            page.get_by_placeholder("Enter account no.").fill(str(data["toAccountNum"])) 
+            page.keyboard.press("Tab")
 
-        # Delay 1 second
-        page.wait_for_timeout(1500)
+        # Wait for the account lookup (beneficiary name input)
+        WAIT.visible("beneficiary_input_ready", page.locator("//input[@placeholder='Enter name / company name (in full)']"), timeout=1.5)
 
         # Fill Beneficiary Name
-        try:
-            logger.info("Fill Beneficiary Name ...")
-            page.locator("//input[@placeholder='Enter name / company name (in full)']").click()
-            page.locator("//input[@placeholder='Enter name / company name (in full)']").fill(str(data["toAccountName"]), timeout=1000)
-        except:
-            pass
+        with step(BANK, "fill_beneficiary_name"):
+            try:
+                logger.info("Fill Beneficiary Name ...")
+                page.locator("//input[@placeholder='Enter name / company name (in full)']").click()
+                page.locator("//input[@placeholder='Enter name / company name (in full)']").fill(str(data["toAccountName"]), timeout=1000)
+            except:
+                pass
 
-        # Delay 3 seconds
-        page.wait_for_timeout(3000)
+        # Wait for "Add Details" enabled
+        WAIT.enabled("add_details_ready", page.locator("//button[.//span[normalize-space()='Add Details']]"), timeout=3)
 
         # Click "Add Details"  
-        logger.info("Click 'Add Details' ....")
-        page.locator("//span[normalize-space()='Add Details']").click(timeout=100000)
+        with step(BANK, "click_add_details"):
+            logger.info("Click 'Add Details' ....")
+            page.locator("//span[normalize-space()='Add Details']").click(timeout=100000)
 
-        # Delay 1 second
-        page.wait_for_timeout(1500)
+        # Wait for the details dialog
+        WAIT.visible("details_dialog_open", page.locator("//label[normalize-space()='Value Date']"), timeout=1.5)
 
         # Wait for "value date" appear
-        logger.info("Wait for 'Value Date' ...")
-        page.locator("//label[normalize-space()='Value Date']").wait_for(state="visible", timeout=100000)
+        with step(BANK, "wait_value_date_appear"):
+            logger.info("Wait for 'Value Date' ...")
+            page.locator("//label[normalize-space()='Value Date']").wait_for(state="visible", timeout=100000)
 
-        # Delay 1 second
-        page.wait_for_timeout(1500)
+        # Wait for the amount input
+        WAIT.enabled("amount_input_ready", page.locator("//input[@formcontrolname='amount']"), timeout=1.5)
         
         # Fill AccouNT Number 
-        logger.info("Fill Account Number ...")
-        page.locator("//input[@formcontrolname='amount']").click()
-        page.locator("//input[@formcontrolname='amount']").fill(str(data["amount"]))
+        with step(BANK, "fill_amount"):
+            logger.info("Fill Account Number ...")
+            page.locator("//input[@formcontrolname='amount']").click()
+            page.locator("//input[@formcontrolname='amount']").fill(str(data["amount"]))
 
-        # Delay 2.5 second
-        page.wait_for_timeout(2500)
+        # Wait for "SAVE" enabled (amount validated)
+        WAIT.enabled("save_ready", page.locator("//button[.//span[normalize-space()='SAVE']]"), timeout=2.5)
 
         # Click "SAVE"
-        logger.info("Click Save ...")
-        page.locator("//span[normalize-space()='SAVE']").click()
+        with step(BANK, "click_save"):
+            logger.info("Click Save ...")
+            page.locator("//span[normalize-space()='SAVE']").click()
 
-        # Delay 1 second
-        page.wait_for_timeout(1000)
+        # Wait for "NEXT" enabled
+        WAIT.enabled("next_ready", page.locator("//button[.//span[normalize-space()='NEXT']]"), timeout=1)
 
         # Click "NEXT"
-        logger.info("Click Next ...")
-        page.locator("//span[normalize-space()='NEXT']").click()
+        with step(BANK, "click_next"):
+            logger.info("Click Next ...")
+            page.locator("//span[normalize-space()='NEXT']").click()
 
-        # Delay 1 second
-        page.wait_for_timeout(1000)
+        # Wait for "CONFIRM" enabled
+        WAIT.enabled("confirm_ready", page.locator("//button[.//span[normalize-space()='CONFIRM']]"), timeout=1)
 
         # Click "CONFIRM"
-        logger.info("Click Confirm ...")
-        page.locator("//span[normalize-space()='CONFIRM']").click()
+        with step(BANK, "click_confirm"):
+            logger.info("Click Confirm ...")
+            page.locator("//span[normalize-space()='CONFIRM']").click()
+
+        # Journal: transfer confirmed, waiting for the OTP
+        JOBS.checkpoint("form_submitted", data)
 
-        # Delay 1 second
-        page.wait_for_timeout(1000)
+        # Wait for the OTP dialog
+        WAIT.visible("otp_dialog_open", page.locator("//h4[normalize-space()='OTP Verification']"), timeout=1)
 
         # Wait for "OTP Verification"
-        logger.info("Wait for OTP Verification Code Title Appear ...")
-        page.locator("//h4[normalize-space()='OTP Verification']").wait_for(state="visible", timeout=300000)
+        with step(BANK, "wait_otp_verification"):
+            logger.info("Wait for OTP Verification Code Title Appear ...")
+            page.locator("//h4[normalize-space()='OTP Verification']").wait_for(state="visible", timeout=300000)
 
-        # Delay 1 second
-        page.wait_for_timeout(1000)
+        # Wait for the Ref element to settle
+        WAIT.stable("otp_ref_visible", page.locator("//p[@class='ref ref-number-size mb-16px']"), timeout=1)
 
         # Wait until the Ref element is visible
-        logger.info("Wait for Ref ID Element Appear ...")
-        page.locator("//p[@class='ref ref-number-size mb-16px']").wait_for(state="visible", timeout=10000)
+        with step(BANK, "wait_ref_element"):
+            logger.info("Wait for Ref ID Element Appear ...")
+            page.locator("//p[@class='ref ref-number-size mb-16px']").wait_for(state="visible", timeout=10000)
 
-        # Delay 1 second
-        page.wait_for_timeout(1000)
+        # Wait for the new Ref Code (not the login one)
+        WAIT.until("otp_ref_ready", lambda: cls.ktb_ref_on_page(page) not in (None, str(cls._ktb_web_ref_code).upper()), timeout=1)
 
         # Get KTB Ref Code (Comfirm Transfer there)
-        logger.info("Get KTB Ref Code ....")
-        cls._ktb_web_ref_code = page.locator("//p[@class='ref ref-number-size mb-16px']").inner_text().strip()
-        match = re.search(r"Ref\.?\s*([A-Za-z0-9]+)", cls._ktb_web_ref_code, re.IGNORECASE)
-        if match:
-            cls._ktb_web_ref_code = match.group(1)
-            logger.info(f"KTB Web Ref Code: {cls._ktb_web_ref_code}")
+        with step(BANK, "get_ktb_ref_code"):
+            logger.info("Get KTB Ref Code ....")
+            cls._ktb_web_ref_code = page.locator("//p[@class='ref ref-number-size mb-16px']").inner_text().strip()
+            match = re.search(r"Ref\.?\s*([A-Za-z0-9]+)", cls._ktb_web_ref_code, re.IGNORECASE)
+            if match:
+                cls._ktb_web_ref_code = match.group(1)
+                logger.info(f"KTB Web Ref Code: {cls._ktb_web_ref_code}")
         
         # Run Read OTP Code
-        otp = cls.ktb_read_otp(data)
-        logger.info("Successful Get OTP-CODE ...")
+        with step(BANK, "run_read_otp_code"):
+            otp = cls.ktb_read_otp(data, cls._ktb_web_ref_code)
+            logger.info("Successful Get OTP-CODE ...")
 
         # Fill OTP Code
-        logger.info("Fill OTP Code ...")
-        page.locator("//input[@id='otp-input-0']").fill(otp)
+        with step(BANK, "fill_otp_code"):
+            logger.info("Fill OTP Code ...")
+            page.locator("//input[@id='otp-input-0']").fill(otp)
 
-        # Delay 1 second
-        page.wait_for_timeout(1000)
+        # Wait for "VERIFY" enabled
+        WAIT.enabled("verify_ready", page.locator("//button[.//span[normalize-space()='VERIFY']]"), timeout=1)
 
         # Button Click "Verify"
-        logger.info("Click Verify button ...")
-        page.locator("//span[normalize-space()='VERIFY']").click()
+        with step(BANK, "click_verify"):
+            logger.info("Click Verify button ...")
+            page.locator("//span[normalize-space()='VERIFY']").click()
+
+        # Journal: OTP entered
+        JOBS.checkpoint("otp_entered", data)
+
+        # Wait for the OTP dialog to close (transfer done), still open = OTP not accepted: the job stops at otp_entered (needs review)
+        WAIT.hidden("otp_verified", page.locator("//h4[normalize-space()='OTP Verification']"), timeout=30, required=True)
 
-        # Delay 1 second
-        page.wait_for_timeout(1000)
+        # Journal: transfer done by the bank
+        JOBS.checkpoint("bank_confirmed", data)
 
         # Call Eric API
         cls.eric_api(data)
 
+        # Journal: Eric notified
+        JOBS.checkpoint("eric_notified", data)
+
         # Print Withdrawal SuccessFul!!
         logger.info(f"Withdrawal SuccessFul!!!")
 
     # Logout
     @classmethod
+    @timed(BANK)
     def ktb_logout(cls, page):
 
+        # The saved login state must not bring the session back
+        SESSION.clear()
+
         # Clear all cookies
         page.context.clear_cookies()
 
@@ -690,83 +775,109 @@ class BankBot(Automation, Appium_Driver, Eric):
         """)
 
         # Reload page if cookies affect session
-        page.reload(wait_until="networkidle")
+        page.reload(wait_until="domcontentloaded")
 
     # Read Phone Message OTP Code
     @classmethod
-    def ktb_read_otp(cls, data):
+    @timed(BANK)
+    def ktb_read_otp(cls, data, ref_code):
 
         # Forces the terminal to handle those sea creatures correctly
         logger.info("="*50)
         logger.info(f"🎰 Starting Read Phone SMS OTP-Code Flow ....  {data['transactionId']} ")
         logger.info("="*50)
         
+        # OTP reader warmed up since the payout start, else set it up now
+        if not (cls._otp_warmup and cls._otp_warmup.ready()):
+            cls.ktb_otp_setup()
+
         # Use Appium Driver
         driver = cls.use_appium_driver()
 
-        # ADB Shell Never Screen Timeout
-        logger.info("ADB Shell Screen never Time Out ...")
-        driver.execute_script("mobile: shell", {"command": "settings","args": ["put", "system", "screen_off_timeout", "2147483647"]})
- 
-        # Start Messages Apps
+        # OTP broker of the phone: woken as soon as the SMS of this Ref is in the inbox
+        if SmsInbox.ENABLED:
+            try:
+                otp = OTP.wait("ktb", ref_code, since=JOBS.running_since(time.time()))
+                print(f"Found matching Ref: {ref_code} | OTP: {otp} ✅")
+                return otp
+            except SmsInboxError as e:
+                logger.warning(f"SMS inbox query failed ({e}), read the Messages app instead")
+
+        # Start Messages Apps (fallback of the SMS inbox query)
         driver.activate_app("com.google.android.apps.messaging")
-        
+
         while True:
 
             # Read All KTB Bank Messages
             print("🤖 Reading latest message from KTB bank...")
 
-            # Wait for the 'message_list' container to be visible
-            # We use the specific XPath from your screenshot to avoid ID errors
-            WebDriverWait(driver, 15).until(EC.visibility_of_element_located((AppiumBy.XPATH, '//android.view.View[@resource-id="message_list"]')))
-
-            # Find all 'message_text' elements that are descendants (offspring) of 'message_list'
-            # The "//" in the middle acts as the .offspring() command
-            message_nodes = driver.find_elements(AppiumBy.XPATH, '//android.view.View[@resource-id="message_list"]//android.widget.TextView[@resource-id="message_text"]')
-            
-            # --- Collect OTP + Ref from all new messages ---
+            # --- Collect OTP + Ref from all messages, newest first ---
             otp_candidates = []
-            
-            # Process the messages (Newest first)
-            for node in reversed(message_nodes):
 
-                try:
-
-                    # Get the text content
-                    messages = node.text
-                    
-                    if not messages:
-                        continue
-                
-                    # using regex to get Message OTP Code and Ref Code
-                    match = re.search(r"\bOTP\s*(?:is|:)?\s*(\d{4,8})\b.*?\bRef\s*(?:No\.?|:)?\s*([A-Z0-9]+)\b", messages, re.IGNORECASE,)
-
-                    if match:
-                        messages_otp_code, _messages_ref_code = match.groups()
-                        otp_candidates.append((_messages_ref_code.strip(), messages_otp_code.strip()))
-                        print(f"# Ref: {_messages_ref_code}, OTP: {messages_otp_code} ❌")
-                
-                except Exception:
-                    # Ignore errors for single stale elements
-                    continue
+            for messages in cls.ktb_sms_ui_texts(driver):
+                found = parse_otp("ktb", messages)
+                if found:
+                    otp_candidates.append(found)
+                    print(f"# Ref: {found[0]}, OTP: {found[1]} ❌")
 
             # --- Match correct Ref Code ---
             for _messages_ref_code, messages_otp_code in otp_candidates:
-                if cls._ktb_web_ref_code == _messages_ref_code:
+                if str(ref_code).upper() == _messages_ref_code:
                     print(f"Found matching Ref: {_messages_ref_code} | OTP: {messages_otp_code} ✅")
                     return messages_otp_code
                 
             # If no match, loop again
             print("# OTP not found yet, keep waiting... \n")
-    
+
+    # OTP reader setup: Appium session, screen never off, inbox baseline (or Messages app open)
+    @classmethod
+    def ktb_otp_setup(cls):
+
+        # Use Appium Driver
+        driver = cls.use_appium_driver()
+
+        # ADB Shell Never Screen Timeout
+        logger.info("ADB Shell Screen never Time Out ...")
+        driver.execute_script("mobile: shell", {"command": "settings","args": ["put", "system", "screen_off_timeout", "2147483647"]})
+
+        # Messages already in the inbox (only new ones are parsed once the Ref is known)
+        if SmsInbox.ENABLED:
+            try:
+                OTP.prime(JOBS.running_since(time.time()))
+                return
+            except SmsInboxError as e:
+                logger.warning(f"SMS inbox query failed ({e}), read the Messages app instead")
+
+        # Start Messages Apps
+        driver.activate_app("com.google.android.apps.messaging")
+
+    # Messages app UI: text of every message bubble, newest first (fallback of the SMS inbox query)
+    @classmethod
+    def ktb_sms_ui_texts(cls, driver):
+
+        # Wait for the 'message_list' container to be visible
+        # We use the specific XPath from your screenshot to avoid ID errors
+        WebDriverWait(driver, 15).until(EC.visibility_of_element_located((AppiumBy.XPATH, '//android.view.View[@resource-id="message_list"]')))
+
+        # Find all 'message_text' elements that are descendants (offspring) of 'message_list'
+        # The "//" in the middle acts as the .offspring() command
+        message_nodes = driver.find_elements(AppiumBy.XPATH, '//android.view.View[@resource-id="message_list"]//android.widget.TextView[@resource-id="message_text"]')
+
+        texts = []
+        for node in reversed(message_nodes):
+            try:
+                # Get the text content
+                if node.text:
+                    texts.append(node.text)
+            except Exception:
+                # Ignore errors for single stale elements
+                continue
+        return texts
+
 # ================== Code Start Here ==================
 
-# Run API
-@app.route("/ktb_company_web/runPython", methods=["POST"])
-def runPython():
-    data = request.get_json(silent=True)
-    if not data:
-        return jsonify({"success": False, "message": "Invalid JSON"}), 400
+# Run one payout (called by the job runner thread, one payout at a time)
+def run_payout(data):
 
     try:
         reply_q = queue.Queue()
@@ -780,28 +891,30 @@ def runPython():
         try:
             result = reply_q.get(timeout=600)   # 10 minutes
         except queue.Empty:
-            return jsonify({
+            return {
                 "success": False,
                 "message": "Worker timeout waiting for browser job"
-            }), 504
-
-        if result.get("success"):
-            return jsonify(result)
+            }
 
-        return jsonify(result), 500
+        return result
 
     except Exception as e:
         full_trace = traceback.format_exc()
         logger.error(f"CRITICAL ERROR for Transaction {data.get('transactionId', 'unknown')}:\n{full_trace}")
-        return jsonify({
+        return {
             "success": False,
             "message": str(e),
             "error_type": type(e).__name__
-        }), 500
+        }
         
+# Async job API: POST /ktb_company_web/jobs → 202 + jobId, GET /ktb_company_web/jobs/<jobId> status, GET /ktb_company_web/jobs queue depth
+# /ktb_company_web/runPython still answers when the payout is done (202 with "Prefer: respond-async")
+JOBS = JobQueue("ktb_company_web", run_payout, required=["transactionId", "amount", "toAccountNum", "toBankCode"], notify=BankBot.eric_api)
+runPython = JOBS.register(app, "/ktb_company_web")
+
 if __name__ == "__main__":
     BankBot.start_ws_client()
     BROWSER_WORKER = BrowserWorker()
     BROWSER_WORKER.start()
 
-    app.run(host="0.0.0.0", port=5003, debug=False, threaded=True, use_reloader=False)
+    app.run(host="0.0.0.0", port=WORKER.flask_port(5003), debug=False, threaded=True, use_reloader=False)
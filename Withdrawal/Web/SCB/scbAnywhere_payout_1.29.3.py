@@ -1,20 +1,21 @@
 import os
 import io
 import sys
+import re
 import json
 import time
 import queue
 import atexit
 import random
-import hashlib
 import logging
 import requests
 import traceback
 import threading
 import subprocess
 from threading import Lock
+from contextlib import nullcontext
 from dotenv import load_dotenv
-from flask import Flask, request, jsonify
+from flask import Flask
 from playwright.sync_api import sync_playwright, expect
 from appium import webdriver
 from appium.webdriver.common.appiumby import *
@@ -23,6 +24,40 @@ from appium.options.android import UiAutomator2Options
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 
+# ================== Shared Modules ==================
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..")))
+from common.eric_client import ERIC
+from common.job_api import JobQueue
+from common.worker_pool import WORKER
+from common.chrome_manager import ChromeManager
+from common.resource_blocker import ResourceBlocker
+from common.step_metrics import step, timed
+from common.wait_engine import WaitEngine
+from common.screen_state import ScreenClassifier
+from common.session_state import SessionState
+
+# Step metrics label (same as the job API name)
+BANK = "scb_company_web"
+
+# Readiness waits instead of fixed sleeps (deadlines: WAIT_DEADLINES)
+WAIT = WaitEngine(BANK)
+
+# Encrypted login state, restored after a Chrome restart (SESSION_STATE_KEY)
+SESSION = SessionState(BANK)
+
+# SCB Anywhere app screens before "View request", highest priority first (one page source per check)
+SCB_SCREENS = ScreenClassifier({
+    "inactive": [("text", "~", "You have been inactive for too long")],
+    "session_timeout": [("text", "~", "Session timeout")],
+    "enter_pin": [("text", "=", "Enter PIN")],
+    "notifications": [("text", "=", "Notifications")],
+})
+
+# SCB Anywhere home page entries (UiSelector): single approval from Notifications, batch from the To-do List
+NOTIFICATIONS = 'new UiSelector().text("Notifications")'
+TODO_LIST = 'new UiSelector().textContains("To-do List")'
+
 # =========================== Eric WS_Client Settings =================
 
 WS_PROC = None
@@ -76,10 +111,149 @@ def get_txn_id(data):
 IDLE_SECONDS = 174 # 2.9 minutes
 SCB_APP_PACKAGE = "com.scb.corporate"
 
+# ================== WEB / APP PIPELINE ==========================
+
+# SCB_PIPELINE=0: web form and app approval of a payout one after the other (no overlap between payouts)
+PIPELINE = os.getenv("SCB_PIPELINE", "1") != "0"
+
+# SCB_BATCH_SIZE > 1 (pipeline only): submit up to N queued transfers on the web, approve them in one app pass
+BATCH_SIZE = max(1, int(os.getenv("SCB_BATCH_SIZE", "1"))) if PIPELINE else 1
+
+class ApprovalPipeline:
+
+    """
+    Hand-over of submitted transfers from the web stage (Playwright worker thread) to the app stage (phone),
+    so the web form of the next payout is filled in while the phone approves the previous one:
+        web:  ... PIPE.before_submit() → Submit / OK → ticket = PIPE.submitted(data) → Done → Make New Transfer
+        app:  PIPE.approve_turn(ticket) → scb_Anywhere_apps (PIPE.opened(ticket) after "View request") → PIPE.done(ticket)
+    Approvals run in submission order, and a transfer is only submitted once every earlier request is
+    opened in the app (so "View request" always opens the request of its own payout).
+    Batch (batch_size > 1): the submitted transfers wait together, the first waiter whose batch is ready
+    approves all of them with one token PIN (approve gets the payouts of the batch, in submission order),
+    each payout then goes on (Eric) with the batch result:
+        app:  PIPE.approve_batch(ticket, lambda payouts: scb_Anywhere_apps_batch(payouts))
+    A batch is ready when it is full, when no other payout is on its way to the web submit, or when its
+    oldest transfer waited BATCH_WAIT seconds. No transfer is submitted while a batch is being approved.
+    """
+
+    TIMEOUT = 300           # a request not approved within 5 minutes is cancelled by the bank
+    BATCH_WAIT = float(os.getenv("SCB_BATCH_WAIT_SECONDS", "120"))
+
+    def __init__(self, batch_size=1):
+        self.cond = threading.Condition()
+        self.batch_size = batch_size
+        self.next_ticket = 0
+        self.turn = 0
+        self.unopened = set()   # tickets submitted on the web, not opened in the app yet
+        self.pending = {}       # ticket → submit time, not approved yet
+        self.payouts = {}       # ticket → payout data, not approved yet
+        self.results = {}       # ticket → None (approved) / exception of its batch
+        self.approving = False  # batch approval running on the phone
+        self.web_running = 0    # payouts between the job start and the end of their web stage
+
+    # Web stage: wait until the earlier requests are opened in the app (batch: no batch approval running)
+    def before_submit(self):
+        with self.cond:
+            ready = (lambda: not self.approving) if self.batch_size > 1 else (lambda: not self.unopened)
+            if not self.cond.wait_for(ready, timeout=self.TIMEOUT):
+                raise TimeoutError("Previous SCB request still not opened / approved in the app")
+
+    # Web stage: transfer submitted, returns its approval ticket
+    def submitted(self, data=None):
+        with self.cond:
+            ticket = self.next_ticket
+            self.next_ticket += 1
+            self.pending[ticket] = time.time()
+            self.payouts[ticket] = data
+            if self.batch_size == 1:
+                self.unopened.add(ticket)
+            return ticket
+
+    # Payout on its way to the web submit (started=True) / web stage over (False), a batch waits for it
+    def web_stage(self, started):
+        with self.cond:
+            self.web_running += 1 if started else -1
+            self.cond.notify_all()
+
+    # Batch ready to approve (called with the condition held)
+    def _batch_ready(self):
+        if not self.pending or self.approving:
+            return False
+        return (len(self.pending) >= self.batch_size
+                or self.web_running == 0
+                or time.time() - min(self.pending.values()) >= self.BATCH_WAIT)
+
+    # App stage (batch): approve this ticket with its batch, approve(payouts) runs on the phone in the leader thread
+    def approve_batch(self, ticket, approve):
+        deadline = time.time() + self.TIMEOUT
+        with self.cond:
+            while ticket not in self.results:
+                if self._batch_ready():
+                    batch = sorted(self.pending)
+                    payouts = [self.payouts.pop(other, None) for other in batch]
+                    self.approving = True
+                    break
+                if time.time() >= deadline and not self.approving:
+                    self.pending.pop(ticket, None)
+                    self.payouts.pop(ticket, None)
+                    raise TimeoutError("SCB batch approval not done in time")
+                self.cond.wait(timeout=1)
+            else:
+                error = self.results.pop(ticket)
+                if error is not None:
+                    raise error
+                return
+
+        # Leader: the whole batch with one app pass
+        error = None
+        try:
+            approve(payouts)
+        except Exception as e:
+            error = e
+
+        with self.cond:
+            for other in batch:
+                self.pending.pop(other, None)
+                self.turn = max(self.turn, other + 1)
+                if other != ticket:
+                    self.results[other] = error
+            self.approving = False
+            self.cond.notify_all()
+        if error is not None:
+            raise error
+
+    # App stage: wait for the approvals of the earlier tickets
+    def approve_turn(self, ticket):
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.turn >= ticket, timeout=self.TIMEOUT):
+                raise TimeoutError(f"Previous SCB approval still running (ticket {self.turn})")
+
+    # App stage: "View request" of this ticket opened
+    def opened(self, ticket):
+        with self.cond:
+            self.unopened.discard(ticket)
+            self.cond.notify_all()
+
+    # App stage over (approved or failed): next ticket's turn
+    def done(self, ticket):
+        with self.cond:
+            self.unopened.discard(ticket)
+            self.pending.pop(ticket, None)
+            self.payouts.pop(ticket, None)
+            self.turn = max(self.turn, ticket + 1)
+            self.cond.notify_all()
+
+    # Approval still to do on the phone (no idle logout / app kill meanwhile)
+    def busy(self):
+        with self.cond:
+            return bool(self.pending) or self.approving
+
+PIPE = ApprovalPipeline(BATCH_SIZE)
+
 # ================== PLAYWRIGHT WORKER ===========================
 
-WORKER = None
-WORKER_LOCK = Lock()
+PW_WORKER = None
+PW_WORKER_LOCK = Lock()
 
 class PlaywrightWorker:
 
@@ -116,6 +290,10 @@ class PlaywrightWorker:
                 elapsed = time.time() - self.last_activity
                 remaining = self.idle_seconds - elapsed
                 if remaining <= 0:
+                    # Approval still running on the phone: keep the session and the app
+                    if PIPE.busy():
+                        self.last_activity = time.time()
+                        continue
                     self._idle_logout()
                     self.last_activity = None
                     self.idle_logged_out = True
@@ -125,7 +303,8 @@ class PlaywrightWorker:
             try:
                 item = self.queue.get(timeout=timeout)
             except queue.Empty:
-                self._idle_logout()
+                if not PIPE.busy():
+                    self._idle_logout()
                 self.last_activity = time.time()
                 continue
 
@@ -146,6 +325,7 @@ class PlaywrightWorker:
                 done.set()
 
     @staticmethod
+    @timed(BANK)
     def _idle_logout():
         global PAGE, APPIUM_DRIVER
         try:
@@ -160,13 +340,13 @@ class PlaywrightWorker:
             logging.error(f"Idle cleanup failed:\n{error_trace}")
     
     def get_worker():
-        global WORKER
-        if WORKER is None:
-            with WORKER_LOCK:
-                if WORKER is None:
-                    WORKER = PlaywrightWorker(IDLE_SECONDS)
-                    WORKER.start()
-        return WORKER
+        global PW_WORKER
+        if PW_WORKER is None:
+            with PW_WORKER_LOCK:
+                if PW_WORKER is None:
+                    PW_WORKER = PlaywrightWorker(IDLE_SECONDS)
+                    PW_WORKER.start()
+        return PW_WORKER
 
 # ================== PLAYWRIGHT SINGLETON ========================
 
@@ -177,57 +357,38 @@ PAGE = None
 
 # ================== Chrome Settings ==================
 
+# Chrome of this worker (profile / CDP port of WorkerSettings, reused after a bot restart)
+CHROME = ChromeManager(BANK)
+
 class Automation:
-    
-    chrome_proc = None
 
-    # Chrome CDP
+    # Resource blocker profile of this bank portal (common/resource_blocker.py)
+    RESOURCE_PROFILE = "scb"
+    BLOCKER = None
+
+    # Block images / fonts / media / trackers of a new page, bytes and time saved are logged per page load
     @classmethod
+    def block_resources(cls, page):
+        cls.BLOCKER = ResourceBlocker(cls.RESOURCE_PROFILE).attach(page)
+        return cls.BLOCKER
+
+    # Chrome CDP (attach to the running Chrome of this profile, else launch it, common/chrome_manager.py)
+    @classmethod
+    @timed(BANK)
     def chrome_cdp(cls):
+        global BROWSER, CONTEXT, PAGE
 
-        # Prevent starting Chrome more than once
-        if cls.chrome_proc:
-            return
-        
         # Load .env file
         load_dotenv()
-        USER_DATA_DIR = os.getenv("CHROME_PATH")
-
-        cls.chrome_proc = subprocess.Popen([
-            r"C:\Program Files\Google\Chrome\Application\chrome.exe",
-            "--remote-debugging-port=9222",
-            "--disable-session-crashed-bubble",
-            "--hide-crash-restore-bubble",
-            "--no-first-run",
-            "--no-default-browser-check",
-            f"--user-data-dir={USER_DATA_DIR}",
-        ], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-
-        cls.wait_for_cdp_ready()
-        atexit.register(cls.cleanup)
-
-    # Close Chrome Completely
+
+        # New Chrome (first start or the old one died): the Playwright connection to the old one is gone
+        if CHROME.ensure():
+            BROWSER = CONTEXT = PAGE = None
+
+    # Close Chrome Completely (only a Chrome launched by this bot)
     @classmethod
     def cleanup(cls):
-        try:
-            if cls.chrome_proc and cls.chrome_proc.poll() is None:
-                logging.info("Closing Chrome CDP")
-                cls.chrome_proc.terminate()
-        except Exception as e:
-            error_trace = traceback.format_exc()
-            logging.error(f"Chrome cleanup error:\n{error_trace}")
-
-    # Wait Chrome CDP Ready
-    @staticmethod
-    def wait_for_cdp_ready(timeout=10):
-        for _ in range(timeout):
-            try:
-                if requests.get("http://localhost:9222/json").status_code == 200:
-                    return
-            except:
-                pass
-            time.sleep(1)
-        raise RuntimeError("Chrome CDP not ready")
+        CHROME.stop()
 
 # ================== SCB BANK BOT ==================
 
@@ -235,6 +396,7 @@ class BankBot(Automation):
 
     # Use Appium Driver
     @classmethod
+    @timed(BANK)
     def use_appium_driver(cls):
         global APPIUM_DRIVER
         logger.info("Preparing Appium driver")
@@ -246,10 +408,11 @@ class BankBot(Automation):
                 options = UiAutomator2Options()
                 options.platform_name = "Android"
                 options.device_name = "androidtesting"
+                WORKER.apply_device(options)
                 options.automation_name = "UiAutomator2"
                 options.new_command_timeout = 86400
 
-                APPIUM_DRIVER = webdriver.Remote("http://127.0.0.1:8021", options=options)
+                APPIUM_DRIVER = webdriver.Remote(WORKER.appium_url, options=options)
             else:
                 logger.info("Reusing existing Appium driver session")
 
@@ -257,6 +420,7 @@ class BankBot(Automation):
     
     # Start Appium Server
     @classmethod
+    @timed(BANK)
     def start_appium_server(cls):
         
         global APPIUM_PROC
@@ -273,7 +437,7 @@ class BankBot(Automation):
         APPIUM_CMD = os.getenv("APPIUM_CMD")
         APPIUM_PROC = subprocess.Popen([
             APPIUM_CMD,
-            "--port", "8021",
+            "--port", str(WORKER.appium_port),
             "--allow-insecure", "uiautomator2:adb_shell",
             "--allow-cors"
         ],
@@ -286,7 +450,7 @@ class BankBot(Automation):
         # Wait until Appium server is ready, retry 10 times
         for attempt in range(1, 11):
             try:
-                if requests.get("http://127.0.0.1:8021/status").ok:
+                if requests.get(f"{WORKER.appium_url}/status").ok:
                     logger.info("Appium server is ready (attempt %s/10)", attempt)
                     return
             except Exception:
@@ -317,8 +481,19 @@ class BankBot(Automation):
 
         logger.info(f"WS client started with PID {WS_PROC.pid}")
 
+    # Seconds to wait for the next login page state (popup, username, password, menu)
+    LOGIN_STATE_TIMEOUT = 300
+    LOGIN_MAX_STEPS = 10
+
+    # Click "Next" of the login form: English button or Thai "ถัดไป", whichever is shown
+    @classmethod
+    def scb_click_next(cls, page, english):
+        buttons = {"english": page.locator(english), "thai": page.locator("//span[contains(text(),'ถัดไป')]")}
+        buttons[WAIT.first("login_next_button", buttons, timeout=1, required=True)].first.click(timeout=1000)
+
     # Login
     @classmethod
+    @timed(BANK)
     def scb_login(cls, data):
 
         # Get Transaction ID
@@ -345,7 +520,7 @@ class BankBot(Automation):
 
             # Connect to running Chrome ONLY ONCE
             if BROWSER is None:
-                BROWSER = PLAYWRIGHT.chromium.connect_over_cdp("http://localhost:9222")
+                BROWSER = PLAYWRIGHT.chromium.connect_over_cdp(CHROME.cdp_url)
 
             # Reuse context
             CONTEXT = BROWSER.contexts[0] if BROWSER.contexts else BROWSER.new_context()
@@ -354,6 +529,7 @@ class BankBot(Automation):
             # Reuse page
             if PAGE is None or PAGE.is_closed():
                 PAGE = CONTEXT.new_page()
+                cls.block_resources(PAGE)
                 PAGE.bring_to_front()
             else:
                 logger.info("Reusing existing browser page. ")
@@ -368,65 +544,76 @@ class BankBot(Automation):
             except Exception:
                 pass
 
-            # Go to SCB Business Website to login
-            page.goto("https://www.scbbusinessanywhere.com/", wait_until="networkidle")
-            logger.info("Navigating to SCB_Businesss login page. ")
-
-            # Wait for Username appear
-            expect(page.locator("//input[@name='username']")).to_be_visible(timeout=0)
-            logger.info("Wait for Username appear. ")
-
-            # For your online security, you have been logged out of SCB Business Anywhere (please log in again.)
-            try:
-                expect(page.get_by_text("For your online security, you have been logged out of SCB Business Anywhere")).to_be_visible(timeout=1500)
-                page.locator("//span[normalize-space()='OK']").click(timeout=1000) 
-                logger.info("For your online security, you have been logged out of SCB Business Anywhere, Button Click OK! ")
-            except:
-                pass
+            # Saved login after a Chrome restart: restore it when the Transfers menu shows up, else the login page
+            restored = SESSION.restore(CONTEXT, page, "https://www.scbbusinessanywhere.com/", probe=lambda: WAIT.first("session_probe", {
+                "logged_in": page.locator("//p[normalize-space()='Transfers']"),
+                "login": page.locator("//input[@name='username']"),
+            }, timeout=15) == "logged_in")
 
-            # Update your Operating System 
-            try:
-                expect(page.locator("//span[contains(text(),'Enter Site/เข้าสู่เว็บไซต์')]")).to_be_visible(timeout=1500)
-                page.locator("//span[contains(text(),'Enter Site/เข้าสู่เว็บไซต์')]").click(timeout=1500)
-                logger.info("Update SCB Apps Notes, Click Enter Site to continue... ")
-            except:
-                pass
-            
-            # if Account already login, can skip
-            try: 
-                # Fill "Username"
-                page.locator("//input[@name='username']").fill(str(data["username"]), timeout=1000)
-                logger.info("Fill Account Username.. ")
+            # Go to SCB Business Website to login
+            if not restored:
+                page.goto("https://www.scbbusinessanywhere.com/", wait_until="domcontentloaded")
+                logger.info("Navigating to SCB_Businesss login page. ")
+
+            # Login state machine: handle whichever state shows up first (popups listed first win ties)
+            states = {
+                # For your online security, you have been logged out of SCB Business Anywhere (please log in again.)
+                "security_logout": page.get_by_text("For your online security, you have been logged out of SCB Business Anywhere"),
+                # Update your Operating System
+                "enter_site": page.locator("//span[contains(text(),'Enter Site/เข้าสู่เว็บไซต์')]"),
+                "username": page.locator("//input[@name='username']"),
+                "password": page.locator("//input[@name='password']"),
+                "transfers_menu": page.locator("//p[normalize-space()='Transfers']"),
+            }
+            for _ in range(cls.LOGIN_MAX_STEPS):
+                state = WAIT.first("login_state", states, timeout=cls.LOGIN_STATE_TIMEOUT, required=True)
 
-                # Button Click "Next"
-                try:
-                    # English
-                    page.locator("//span[normalize-space()='Next']").click(timeout=1000) 
-                except:
-                    # Thai
-                    page.locator("//span[contains(text(),'ถัดไป')]").click(timeout=1000)
-                logger.info("Click Next...")
+                if state == "security_logout":
+                    try:
+                        page.locator("//span[normalize-space()='OK']").click(timeout=1000)
+                        logger.info("For your online security, you have been logged out of SCB Business Anywhere, Button Click OK! ")
+                    except:
+                        pass
 
-                # Fill "Password"
-                page.locator("//input[@name='password']").fill(str(data["password"]), timeout=0)
-                logger.info("Fill Account Password...")
+                elif state == "enter_site":
+                    try:
+                        states["enter_site"].click(timeout=1500)
+                        logger.info("Update SCB Apps Notes, Click Enter Site to continue... ")
+                    except:
+                        pass
 
-                # Button Click "Next"
-                try:
-                    # English
-                    page.locator("//button[@type='submit']").click(timeout=1000) 
-                except:
-                    # Thai
-                    page.locator("//span[contains(text(),'ถัดไป')]").click(timeout=1000)
-                logger.info("Click Next...")
-            except:
-                pass
-            
-            # only click Transfers if NOT on login page
-            if not page.locator("//input[@name='username']").is_visible():
-                # Button Click "Transfer"
-                page.locator("//p[normalize-space()='Transfers']").click(timeout=0)
-                logger.info("Click to Transfer Page...")
+                elif state == "username":
+                    # Fill "Username"
+                    states["username"].fill(str(data["username"]), timeout=1000)
+                    logger.info("Fill Account Username.. ")
+
+                    # Button Click "Next" (English / Thai)
+                    cls.scb_click_next(page, "//span[normalize-space()='Next']")
+                    logger.info("Click Next...")
+                    del states["username"]
+
+                elif state == "password":
+                    # Fill "Password"
+                    states["password"].fill(str(data["password"]), timeout=1000)
+                    logger.info("Fill Account Password...")
+
+                    # Button Click "Next" (English / Thai)
+                    cls.scb_click_next(page, "//button[@type='submit']")
+                    logger.info("Click Next...")
+                    states.pop("username", None)
+                    del states["password"]
+
+                else:
+                    # Logged in with the password: save the login state
+                    if "password" not in states:
+                        SESSION.save(CONTEXT)
+
+                    # Button Click "Transfer"
+                    states["transfers_menu"].click(timeout=0)
+                    logger.info("Click to Transfer Page...")
+                    break
+            else:
+                raise RuntimeError(f"Login not finished after {cls.LOGIN_MAX_STEPS} steps, last state: {state}")
 
             return page
         
@@ -444,11 +631,15 @@ class BankBot(Automation):
 
     # Withdrawal
     @classmethod
+    @timed(BANK)
     def scb_withdrawal(cls, page, data):
 
         # Get Transaction ID
         txn_id = get_txn_id(data)
 
+        # Approval ticket of the app stage (pipeline only)
+        ticket = None
+
         # Forces the terminal to handle those sea creatures correctly
         logger.info("="*50)
         logger.info(f"🎰 Starting SCB Company Withdrawal Flow .... {txn_id}")
@@ -457,131 +648,183 @@ class BankBot(Automation):
         try:
 
             # Button Click "Add New Recipient"
-            page.locator("//span[normalize-space()='Add New Recipient']").click(timeout=10000) 
-            logger.info("Click Add New Recipient...")
+            with step(BANK, "click_add_new_recipient"):
+                page.locator("//span[normalize-space()='Add New Recipient']").click(timeout=10000) 
+                logger.info("Click Add New Recipient...")
             
             # Fill Bank Name and Click
-            page.get_by_label("Bank Name *").fill(str(data["toBankCode"]), timeout=0)
-            page.keyboard.press("ArrowDown")
-            page.keyboard.press("Enter")
-            logger.info("Fill and Select Bank Name/Code %s", data.get("toBankCode"))
+            with step(BANK, "fill_bank_name"):
+                page.get_by_label("Bank Name *").fill(str(data["toBankCode"]), timeout=0)
+                page.keyboard.press("ArrowDown")
+                page.keyboard.press("Enter")
+                logger.info("Fill and Select Bank Name/Code %s", data.get("toBankCode"))
 
             # Fill Account No.
-            page.locator("//input[@id='accountNumber']").fill(str(data["toAccountNum"]), timeout=0)
-            logger.info("Fill in Account Number %s", data.get("toAccountNum"))
+            with step(BANK, "fill_account_no"):
+                page.locator("//input[@id='accountNumber']").fill(str(data["toAccountNum"]), timeout=0)
+                logger.info("Fill in Account Number %s", data.get("toAccountNum"))
 
             # Button Click "Next"
-            page.locator("//span[normalize-space()='Next']").click(timeout=0) 
-            logger.info("Button Click Next ...")
+            with step(BANK, "click_next"):
+                page.locator("//span[normalize-space()='Next']").click(timeout=0) 
+                logger.info("Button Click Next ...")
 
             # Wait for "Recipient Details"
-            page.locator("//h4[normalize-space()='Recipient Details']").wait_for(timeout=0) 
-            logger.info("Waiting for Recipient Details Appear ...")
+            with step(BANK, "wait_recipient_details"):
+                page.locator("//h4[normalize-space()='Recipient Details']").wait_for(timeout=0) 
+                logger.info("Waiting for Recipient Details Appear ...")
             
             # Fill Account Name
-            try:
-                page.locator("//input[@name='accountName']").fill(str(data["toAccountName"]), timeout=2000)
-                logger.info("Fill in Account Name %s", data.get("toAccountName"))
-            except:
-                pass
+            with step(BANK, "fill_account_name"):
+                try:
+                    page.locator("//input[@name='accountName']").fill(str(data["toAccountName"]), timeout=2000)
+                    logger.info("Fill in Account Name %s", data.get("toAccountName"))
+                except:
+                    pass
 
             # Button Click "Confirm"
-            page.locator("//span[normalize-space()='Confirm']").click(timeout=0) 
-            logger.info("Click Confirm ...")
+            with step(BANK, "click_confirm"):
+                page.locator("//span[normalize-space()='Confirm']").click(timeout=0) 
+                logger.info("Click Confirm ...")
 
             # Button Click "Enter"
-            page.locator("//span[normalize-space()='Enter']").click(timeout=0) 
-            logger.info("Click Next ...")
+            with step(BANK, "click_enter"):
+                page.locator("//span[normalize-space()='Enter']").click(timeout=0) 
+                logger.info("Click Next ...")
 
             # Fill Amount
-            page.locator("//input[@name='amount']").fill(str(data["amount"]), timeout=0)
-            logger.info("Fill in Amount ...")
+            with step(BANK, "fill_amount"):
+                page.locator("//input[@name='amount']").fill(str(data["amount"]), timeout=0)
+                logger.info("Fill in Amount ...")
 
             # Press Enter
-            page.keyboard.press("Enter")
-            logger.info("Press Enter ... ")
+            with step(BANK, "press_enter"):
+                page.keyboard.press("Enter")
+                logger.info("Press Enter ... ")
 
             # Button Click "Continue to Transfer Services"
-            page.locator("//span[normalize-space()='Continue to Transfer Services']").click(timeout=0) 
-            logger.info("Continue to Transfer ...")
+            with step(BANK, "click_continue_to_transfer"):
+                page.locator("//span[normalize-space()='Continue to Transfer Services']").click(timeout=0) 
+                logger.info("Continue to Transfer ...")
 
             # if insufficient pop up appear, break
-            try:
-                page.wait_for_selector("//h2[normalize-space()='Insufficient funds in the selected account.']", timeout=1500)
+            with step(BANK, "check_insufficient_funds"):
+                try:
+                    page.wait_for_selector("//h2[normalize-space()='Insufficient funds in the selected account.']", timeout=1500)
                 
-                # Print to console for immediate visibility
-                print(("Stopping code: Insufficient balance detected! (ตรวจพบยอดเงินไม่เพียงพอ! บอทหยุดทำงานแล้ว!)\n") * 10)
-                logger.warning("Stopping code: Insufficient balance detected.")
-                time.sleep(5)
-                # Raise an exception instead of sys.exit() to trigger your robust error handling
-                raise Exception("Bot stopped: Insufficient funds detected!")
-            except Exception as e:
-                # If the exception is exactly our custom insufficient funds error, re-raise it
-                if str(e) == "Bot stopped: Insufficient funds detected!":
-                    raise e
-                # Otherwise, the pop-up didn't appear, so we just pass and continue the transfer
-                logger.info("Sufficient Balance... Continue...")
-                pass
+                    # Print to console for immediate visibility
+                    print(("Stopping code: Insufficient balance detected! (ตรวจพบยอดเงินไม่เพียงพอ! บอทหยุดทำงานแล้ว!)\n") * 10)
+                    logger.warning("Stopping code: Insufficient balance detected.")
+                    time.sleep(5)
+                    # Raise an exception instead of sys.exit() to trigger your robust error handling
+                    raise Exception("Bot stopped: Insufficient funds detected!")
+                except Exception as e:
+                    # If the exception is exactly our custom insufficient funds error, re-raise it
+                    if str(e) == "Bot stopped: Insufficient funds detected!":
+                        raise e
+                    # Otherwise, the pop-up didn't appear, so we just pass and continue the transfer
+                    logger.info("Sufficient Balance... Continue...")
+                    pass
 
             # Button Click "Skip to Review Information"
-            page.locator("//span[normalize-space()='Skip to Review Information']").click(timeout=0) 
-            logger.info("Click Skip to Review Information ...")
+            with step(BANK, "click_skip_review_information"):
+                page.locator("//span[normalize-space()='Skip to Review Information']").click(timeout=0) 
+                logger.info("Click Skip to Review Information ...")
 
             # wait for "Review Information" to be appear
-            page.locator("//h2[normalize-space()='Review Information']").wait_for(timeout=0) 
-            logger.info("Wating for Review Information appear ...")
+            with step(BANK, "wait_review_information"):
+                page.locator("//h2[normalize-space()='Review Information']").wait_for(timeout=0) 
+                logger.info("Wating for Review Information appear ...")
 
             # Scroll to very Bottom
-            page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
-            logger.info("Scroll down to the Bottom ...")
+            with step(BANK, "scroll_very_bottom"):
+                page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
+                logger.info("Scroll down to the Bottom ...")
+
+            # Pipeline: the earlier requests must be opened in the app before this one is submitted
+            if PIPELINE:
+                with step(BANK, "wait_previous_request_opened"):
+                    PIPE.before_submit()
 
             # Button Click "Submit"
-            page.locator("//span[normalize-space()='Submit']").click(timeout=0)
-            logger.info("Click Submit Button ...")
+            with step(BANK, "click_submit"):
+                page.locator("//span[normalize-space()='Submit']").click(timeout=0)
+                logger.info("Click Submit Button ...")
 
             # Button Click "OK"
-            page.locator("//span[normalize-space()='OK']").click(timeout=0)
-            logger.info("Button Click OK ...")
+            with step(BANK, "click_ok"):
+                page.locator("//span[normalize-space()='OK']").click(timeout=0)
+                logger.info("Button Click OK ...")
+
+            # Journal: transfer request submitted
+            JOBS.checkpoint("form_submitted", data)
+            if PIPELINE:
+                ticket = PIPE.submitted(data)
 
             # Wait for "Please authorize transaction(s) within 5 minutes.
-            page.locator("//p[normalize-space()='Please authorize transaction(s) within 5 minutes.']").wait_for(timeout=0) 
-            logger.info("Wait for 'Please authorize transaction(s) within 5 minutes'")
+            with step(BANK, "wait_authorize_prompt"):
+                page.locator("//p[normalize-space()='Please authorize transaction(s) within 5 minutes.']").wait_for(timeout=0) 
+                logger.info("Wait for 'Please authorize transaction(s) within 5 minutes'")
 
-            # Launch Apps to Approve Transfer Request
-            BankBot.scb_Anywhere_apps(data)
-            logger.info("Successful to Approve Transfer Request!!!")
+            # Launch Apps to Approve Transfer Request (pipeline: the app stage approves it, see process_app_stage)
+            if not PIPELINE:
+                with step(BANK, "app_approval"):
+                    BankBot.scb_Anywhere_apps(data)
+                    logger.info("Successful to Approve Transfer Request!!!")
 
             # Button Click "Done"
-            page.locator("//span[normalize-space()='Done']").click(timeout=1000)
-            logger.info("Click Done...")
+            with step(BANK, "click_done"):
+                page.locator("//span[normalize-space()='Done']").click(timeout=1000)
+                logger.info("Click Done...")
 
             # Delay 0.5 second
             page.wait_for_timeout(500)
 
             # wait for "Review Information" to be appear
-            page.locator("//h2[contains(text(),'You have successfully submitted the transaction re')]").wait_for(timeout=0) 
-            logger.info("Waiting for You have successfully submitted the transaction re...")
+            with step(BANK, "wait_submitted_message"):
+                page.locator("//h2[contains(text(),'You have successfully submitted the transaction re')]").wait_for(timeout=0) 
+                logger.info("Waiting for You have successfully submitted the transaction re...")
             
             # Wait for MUI backdrop animation to finish
-            page.locator("div.MuiBackdrop-root").wait_for(state="hidden", timeout=5000)
+            with step(BANK, "wait_backdrop_hidden"):
+                page.locator("div.MuiBackdrop-root").wait_for(state="hidden", timeout=5000)
+
+            if not PIPELINE:
+                # Journal: transfer approved by the bank
+                JOBS.checkpoint("bank_confirmed", data)
 
-            # Call Eric API
-            cls.eric_api(data)
+                # Call Eric API
+                cls.eric_api(data)
+
+                # Journal: Eric notified
+                JOBS.checkpoint("eric_notified", data)
 
             # Button Click Make New Transfer
-            page.locator("//span[normalize-space()='Make New Transfer']").click(timeout=5000)
-            logger.info("Click Make New Transfer...")
-            logger.info("Wait for next Withdrawal Transaction Request...")
+            with step(BANK, "click_make_new_transfer"):
+                page.locator("//span[normalize-space()='Make New Transfer']").click(timeout=5000)
+                logger.info("Click Make New Transfer...")
+                logger.info("Wait for next Withdrawal Transaction Request...")
+
+            return ticket
 
         except Exception as e:
             error_trace = traceback.format_exc()
+
+            # Submitted: the request waits in the bank, keep its ticket so the app stage still approves it
+            # (releasing it would leave an orphan request that the next "View request" / "Select all" picks up).
+            # The next payout's login goes back to the Transfer page.
+            if ticket is not None:
+                logger.warning("Web stage error after the submit, request kept for the app stage. txn_id=%s\n%s", txn_id, error_trace)
+                return ticket
+
             print(f"\n[!] WITHDRAWAL EXCEPTION:\n{error_trace}")
             logging.error(f"WITHDRAWAL FAILED for Transaction {get_txn_id(data)}:\n{error_trace}")
             raise Exception(f"Withdrawal failed: {str(e)}")
         
     # Read Apps OTP Code
     @classmethod
-    def scb_Anywhere_apps(cls, data):
+    @timed(BANK)
+    def scb_Anywhere_apps(cls, data, ticket=None):
 
         # Get Transaction ID
         txn_id = get_txn_id(data)
@@ -589,134 +832,27 @@ class BankBot(Automation):
 
         try:
 
-            # ============== Call Appium driver =======================
-            
-            driver = cls.use_appium_driver()
-            logger.info("Start Appium Driver...")
-
-            # bypass scbanyware detect using usb debugging
-            driver.execute_script('mobile: shell', {'command': 'settings', 'args': ['put', 'global', 'adb_enabled', '12']})
-            logger.info("Bypass USB Debugging...")
-
-            # Check Apps State
-            # 1 = Apps Not Running, 2 = App running in background (suspended)
-            # 3 = App running in background, 4 = Apps Running in foreground (Apps is running)    
-            state = driver.query_app_state(SCB_APP_PACKAGE)
-            print("App state:", state)
-            
-            # If state 1, open apps
-            if state == 1:
-                print("App not running → starting activity")
-                logger.info("App not running → starting activity.")
-                driver.activate_app(SCB_APP_PACKAGE)
-            # else if 2,3, open apps
-            elif state in (2, 3):
-                print("App in background → activating")
-                logger.info("App in background → activating. ")
-                driver.activate_app(SCB_APP_PACKAGE)
-            # else 4, skip
-            elif state == 4:
-                print("App already in foreground")
-                logger.info("App already in foreground.")
-
-            # Inactive Too Long
-            try:
-                # wait for text "You have been inactive too long"
-                WebDriverWait(driver, 1).until(EC.presence_of_element_located((AppiumBy.XPATH, "//*[contains(@text, 'You have been inactive for too long')]")))
-                
-                # Find "Continue" button and click continue
-                driver.find_element(AppiumBy.XPATH, "//*[contains(@text, 'Continue')]").click()
-                logger.info("You have been inactive too long, Click Continue...")
-            except:
-                pass
-
-            # Session Timeout
-            try:
-                # wait for text "Session Timeout"
-                WebDriverWait(driver, 1).until(EC.presence_of_element_located((AppiumBy.XPATH, "//*[contains(@text, 'Session timeout')]")))
-                
-                # Find "Continue" / "Log in" button and click continue
-                try:
-                    driver.find_element(AppiumBy.XPATH, "//*[contains(@text, 'Continue')]").click()
-                except:
-                    driver.find_element(AppiumBy.XPATH, "//*[contains(@text, 'Log in')]").click()
-                
-                logger.info("Session Timeout, Click Continue / Log in...")
-            except:
-                pass
-
-            # Enter Pin / Pending edit (0)
-            while True:
-                try: 
-                    # Wait for "Enter PIN" to appear
-                    WebDriverWait(driver, 1).until(EC.visibility_of_element_located((AppiumBy.XPATH, "//*[@text='Enter PIN']")))
-                    logger.info("Enter PIN Appear...")
-                    logger.info("Start Enter PIN...")
-                
-                    # Enter Pin
-                    pin = str(data["pin"])
-                    for digit in pin:
-                        digit_button = WebDriverWait(driver, 10).until(EC.element_to_be_clickable((AppiumBy.XPATH, f"//android.widget.TextView[@text='{digit}']")))
-                        digit_button.click()
-                    break
-                except:
-                    try:
-                        # Wait for "Pending edit (0)" to appear
-                        WebDriverWait(driver, 1).until(EC.visibility_of_element_located((AppiumBy.XPATH, "//*[@text='Pending edit (0)']")))
-                        logger.info("Wait for Pending edit (0) appear ...")
-                        break
-                    except:
-                        pass
-            
-            # Click Notification / You have been inactive too long
-            while True:
-                try:
-                    # Wait and Click Notifications
-                    notif = WebDriverWait(driver, 300).until(EC.element_to_be_clickable((AppiumBy.ANDROID_UIAUTOMATOR, 'new UiSelector().text("Notifications")')))
-                    notif.click()
-                    logger.info("Wait and Click Notifications ...")
-                    break
-                except:
-                    try:
-                        # wait for text "You have been inactive too long"
-                        WebDriverWait(driver, 1).until(EC.presence_of_element_located((AppiumBy.XPATH, "//*[contains(@text, 'You have been inactive for too long')]")))
-
-                        # Find "Continue" button and click continue
-                        driver.find_element(AppiumBy.XPATH, "//*[contains(@text, 'Continue')]").click()
-
-                        logger.info("You have been inactive too long, click Continue...")
-
-                        break
-                    except:
-                        pass
+            # Open the app up to the home page, click "Notifications"
+            driver = cls.scb_app_enter(data, NOTIFICATIONS)
 
             # Click "View request"
             btn_view_request = WebDriverWait(driver, 300).until(EC.element_to_be_clickable((AppiumBy.ANDROID_UIAUTOMATOR,'new UiSelector().text("View request")')))
-            time.sleep(0.3)
+            WAIT.settled("view_request_ready", btn_view_request, timeout=0.3)
             driver.execute_script("mobile: clickGesture", {"elementId": btn_view_request.id})
             logger.info("Button click View Request...")
 
+            # Pipeline: the web stage may submit the next transfer now
+            if ticket is not None:
+                PIPE.opened(ticket)
+
             # Wait and Click "Submit for approval"
             label = WebDriverWait(driver, 300).until(EC.presence_of_element_located((AppiumBy.ANDROID_UIAUTOMATOR,'new UiSelector().text("Submit for approval")')))
-            time.sleep(0.3)
+            WAIT.settled("submit_approval_ready", label, timeout=0.3)
             driver.execute_script("mobile: clickGesture", {"elementId": label.id})
             logger.info("Wait and Click Submit for Approval...")
 
-            # Wait for SCB Digital Token Pin
-            WebDriverWait(driver, 300).until(EC.visibility_of_element_located((AppiumBy.XPATH, "//*[@text='Enter the 8-digit\nSCB Digital Token PIN']")))
-            logger.info("Key in SCB Digital Token PIN...")
-
-            time.sleep(1)
-            token_pin = str(data["scbDigitalTokenPin"])
-            for digit in token_pin:
-                digit_button = WebDriverWait(driver, 10).until(EC.element_to_be_clickable((AppiumBy.XPATH, f"//android.widget.TextView[@text='{digit}']")))
-                digit_button.click()
-                time.sleep(0.5)
-
-            # Click "Go to To-do List"
-            gtdList = WebDriverWait(driver, 20).until(EC.presence_of_element_located((AppiumBy.ANDROID_UIAUTOMATOR, 'new UiSelector().text("Go to To-do List")')))
-            time.sleep(2)
-            gtdList.click()
+            # SCB Digital Token PIN, then "Go to To-do List"
+            cls.scb_app_token_pin(driver, data)
 
             logger.info("Click Go to To-do List... txn_id=%s", txn_id)
             
@@ -727,10 +863,201 @@ class BankBot(Automation):
             logging.error(f"MOBILE APP FAILED for Transaction {get_txn_id(data)}:\n{error_trace}")
             raise Exception(f"Mobile app approval failed: {str(e)}")
 
+    # Batch approval: every pending transfer request of the To-do List with one token PIN
+    @classmethod
+    @timed(BANK)
+    def scb_Anywhere_apps_batch(cls, payouts):
+
+        # Same company account for the whole batch: its PIN / token PIN
+        data = payouts[0]
+        count = len(payouts)
+        logger.info("Starting SCB batch approval of %s transfer requests. txn_ids=%s", count, [get_txn_id(p) for p in payouts])
+
+        try:
+
+            # Open the app up to the home page, click "To-do List"
+            driver = cls.scb_app_enter(data, TODO_LIST)
+
+            # Select all pending requests
+            select_all = WebDriverWait(driver, 30).until(EC.element_to_be_clickable((AppiumBy.ANDROID_UIAUTOMATOR, 'new UiSelector().textContains("Select all")')))
+            WAIT.settled("select_all_ready", select_all, timeout=0.3)
+            select_all.click()
+            logger.info("Click Select all (%s requests submitted)...", count)
+
+            # The selection must be exactly the batch (no orphan / foreign request approved with it)
+            cls.scb_check_todo_selection(driver, payouts)
+
+            # Wait and Click "Submit for approval"
+            label = WebDriverWait(driver, 300).until(EC.presence_of_element_located((AppiumBy.ANDROID_UIAUTOMATOR,'new UiSelector().text("Submit for approval")')))
+            WAIT.settled("submit_approval_ready", label, timeout=0.3)
+            driver.execute_script("mobile: clickGesture", {"elementId": label.id})
+            logger.info("Wait and Click Submit for Approval...")
+
+            # SCB Digital Token PIN once for the selection, then "Go to To-do List"
+            cls.scb_app_token_pin(driver, data, payouts)
+            logger.info("Batch of %s requests approved.", count)
+
+        except Exception as e:
+            error_trace = traceback.format_exc()
+            print(f"\n[!] APPIUM EXCEPTION:\n{error_trace}")
+            logging.error(f"MOBILE APP BATCH APPROVAL FAILED ({count} requests):\n{error_trace}")
+            raise Exception(f"Mobile app batch approval failed: {str(e)}")
+
+    # Selected To-do rows (after "Select all"): one (amount, account) per checked row, from the texts of the row
+    @classmethod
+    def scb_todo_rows(cls, driver):
+        rows = []
+        for row in driver.find_elements(AppiumBy.XPATH, "//*[@checkable='true' and @checked='true']/.."):
+            texts = [e.text or "" for e in row.find_elements(AppiumBy.XPATH, ".//android.widget.TextView")]
+            joined = " ".join(texts)
+            if "Select all" in joined:
+                continue
+            amount = re.search(r"\d{1,3}(?:,\d{3})*\.\d{2}", joined)
+            # Account number: masked one first ("xxx-x-x1234-x"), else the first long digit run
+            accounts = re.findall(r"[0-9xX*][0-9xX*-]{5,}[0-9xX*]", joined)
+            account = next((a for a in accounts if re.search(r"[xX*]", a)), accounts[0] if accounts else None)
+            rows.append({
+                "amount": round(float(amount.group().replace(",", "")), 2) if amount else None,
+                "account": account,
+                "text": joined,
+            })
+        return rows
+
+    # Masked account of a To-do row ("xxx-x-x1234-x") is this account number
+    @staticmethod
+    def scb_account_matches(shown, account):
+        shown = re.sub(r"[^0-9xX*]", "", shown or "")
+        account = re.sub(r"\D", "", str(account))
+        if len(shown) == len(account):
+            return any(c.isdigit() for c in shown) and all(c == a for c, a in zip(shown, account) if c.isdigit())
+        groups = re.findall(r"\d{3,}", shown)
+        return bool(groups) and all(group in account for group in groups)
+
+    # Abort the batch unless the selected rows are the batch payouts (count, amount, account)
+    @classmethod
+    def scb_check_todo_selection(cls, driver, payouts):
+        rows = cls.scb_todo_rows(driver)
+        if len(rows) != len(payouts):
+            raise RuntimeError(f"To-do selection has {len(rows)} requests, batch has {len(payouts)}: not approved")
+
+        unmatched = list(rows)
+        for payout in payouts:
+            amount = round(float(str(payout["amount"]).replace(",", "")), 2)
+            row = next((r for r in unmatched if r["amount"] == amount and cls.scb_account_matches(r["account"], payout["toAccountNum"])), None)
+            if row is None:
+                raise RuntimeError(f"No selected To-do request for {amount:,.2f} to {payout['toAccountNum']} (txn_id={get_txn_id(payout)}), rows: {[r['text'] for r in rows]}")
+            unmatched.remove(row)
+        logger.info("To-do selection matches the batch (%s requests)", len(rows))
+
+    # Open SCB Anywhere up to the home page (PIN, inactive / session timeout popups), click entry (UiSelector)
+    @classmethod
+    def scb_app_enter(cls, data, entry):
+
+        # ============== Call Appium driver =======================
+        
+        driver = cls.use_appium_driver()
+        logger.info("Start Appium Driver...")
+
+        # bypass scbanyware detect using usb debugging
+        driver.execute_script('mobile: shell', {'command': 'settings', 'args': ['put', 'global', 'adb_enabled', '12']})
+        logger.info("Bypass USB Debugging...")
+
+        # Check Apps State
+        # 1 = Apps Not Running, 2 = App running in background (suspended)
+        # 3 = App running in background, 4 = Apps Running in foreground (Apps is running)    
+        state = driver.query_app_state(SCB_APP_PACKAGE)
+        print("App state:", state)
+        
+        # If state 1, open apps
+        if state == 1:
+            print("App not running → starting activity")
+            logger.info("App not running → starting activity.")
+            driver.activate_app(SCB_APP_PACKAGE)
+        # else if 2,3, open apps
+        elif state in (2, 3):
+            print("App in background → activating")
+            logger.info("App in background → activating. ")
+            driver.activate_app(SCB_APP_PACKAGE)
+        # else 4, skip
+        elif state == 4:
+            print("App already in foreground")
+            logger.info("App already in foreground.")
+
+        # App screen state machine until the home entry is clicked (one page source per check, popups first)
+        pin_entered = False
+        while True:
+            screen = WAIT.until("app_screen", lambda: SCB_SCREENS.classify(driver), timeout=300, required=True)
+
+            # You have been inactive too long / Session timeout
+            if screen in ("inactive", "session_timeout"):
+                # Find "Continue" / "Log in" button and click continue
+                try:
+                    driver.find_element(AppiumBy.XPATH, "//*[contains(@text, 'Continue')]").click()
+                except:
+                    driver.find_element(AppiumBy.XPATH, "//*[contains(@text, 'Log in')]").click()
+                logger.info("%s, Click Continue / Log in...", "You have been inactive too long" if screen == "inactive" else "Session Timeout")
+
+                # Inactive after the PIN: the app goes back to the previous page (request / To-do List), continue there
+                if screen == "inactive" and pin_entered:
+                    break
+
+            # Enter PIN (once, the PIN page may still be shown while the app loads)
+            elif screen == "enter_pin" and not pin_entered:
+                logger.info("Enter PIN Appear...")
+                logger.info("Start Enter PIN...")
+
+                # Enter Pin
+                pin = str(data["pin"])
+                for digit in pin:
+                    digit_button = WebDriverWait(driver, 10).until(EC.element_to_be_clickable((AppiumBy.XPATH, f"//android.widget.TextView[@text='{digit}']")))
+                    digit_button.click()
+                pin_entered = True
+
+            # Home page: Wait and Click Notifications / To-do List
+            elif screen == "notifications":
+                WebDriverWait(driver, 10).until(EC.element_to_be_clickable((AppiumBy.ANDROID_UIAUTOMATOR, entry))).click()
+                logger.info("Wait and Click %s ...", entry)
+                break
+
+        return driver
+
+    # Key in the SCB Digital Token PIN of the request(s), then click "Go to To-do List" (payouts: the batch approved with it)
+    @classmethod
+    def scb_app_token_pin(cls, driver, data, payouts=None):
+
+        # Wait for SCB Digital Token Pin
+        WebDriverWait(driver, 300).until(EC.visibility_of_element_located((AppiumBy.XPATH, "//*[@text='Enter the 8-digit\nSCB Digital Token PIN']")))
+        logger.info("Key in SCB Digital Token PIN...")
+
+        # Wait for the PIN pad
+        WAIT.element("token_pad_ready", driver, AppiumBy.XPATH, "//android.widget.TextView[@text='0']", timeout=1, clickable=True)
+
+        # Gap between two taps (the pad drops taps that come too fast), none after the last digit
+        tap_gap = WAIT.deadline("token_pin_tap_gap", 0.5)
+        token_pin = str(data["scbDigitalTokenPin"])
+        for index, digit in enumerate(token_pin):
+            digit_button = WebDriverWait(driver, 10).until(EC.element_to_be_clickable((AppiumBy.XPATH, f"//android.widget.TextView[@text='{digit}']")))
+            digit_button.click()
+            if index < len(token_pin) - 1:
+                time.sleep(tap_gap)
+
+        # Journal: SCB Digital Token PIN entered, for every payout it approves
+        for payout in payouts or [data]:
+            JOBS.checkpoint("otp_entered", payout)
+
+        # Click "Go to To-do List"
+        gtdList = WebDriverWait(driver, 20).until(EC.presence_of_element_located((AppiumBy.ANDROID_UIAUTOMATOR, 'new UiSelector().text("Go to To-do List")')))
+        WAIT.settled("todo_list_ready", gtdList, timeout=2)
+        gtdList.click()
+
     # Logout
     @classmethod
+    @timed(BANK)
     def scb_logout(cls, page):
 
+        # The saved login state must not bring the session back
+        SESSION.clear()
+
         try:
             # Clear all cookies
             page.context.clear_cookies()
@@ -751,10 +1078,11 @@ class BankBot(Automation):
 
 
         # Reload page if cookies affect session
-        page.reload(wait_until="networkidle")
+        page.reload(wait_until="domcontentloaded")
 
     # Kill SCB app
     @classmethod
+    @timed(BANK)
     def scb_kill_apps(cls, driver):
 
         logger.info("Timeout Trigger, Processing to Kill Apps... ")
@@ -796,45 +1124,15 @@ class BankBot(Automation):
 
     # Callback ERIC API
     @classmethod
+    @timed(BANK)
     def eric_api(cls, data):
         
         try:
-            url = "https://bot-integration.cloudbdtech.com/integration-service/transaction/payoutScriptCallback"
-
-            # Create payload as a DICTIONARY (not JSON yet)
-            payload = {
-                "bankCode": str(data["fromBankCode"]),
-                "deviceId": str(data["deviceId"]),
-                "merchantCode": str(data["merchantCode"]),
-                "transactionId": str(data["transactionId"]),
-            }
-
-            # Your secret key
-            secret_key = "PRODBankBotIsTheBest"
-
-            # Build the hash string (exact order required)
-            string_to_hash = (
-                f"bankCode={payload['bankCode']}&"
-                f"deviceId={payload['deviceId']}&"
-                f"merchantCode={payload['merchantCode']}&"
-                f"transactionId={payload['transactionId']}{secret_key}"
-            )
-
-            # Generate MD5 hash
-            hash_result = hashlib.md5(string_to_hash.encode("utf-8")).hexdigest()
-
-            # Convert payload to JSON string AFTER hash
-            payload_json = json.dumps(payload)
-
-            # Send request
-            headers = {
-                'accept': '*/*',
-                'hash': hash_result,
-                'Content-Type': 'application/json'
-            }
-
-            response = requests.post(url, headers=headers, data=payload_json)
-            response.raise_for_status()
+            # Send request through the shared Eric client (keep-alive pool, timeout, retry)
+            response, req = ERIC.payout_callback(data)
+            payload = json.loads(req["body"])
+            string_to_hash = req["string_to_hash"]
+            hash_result = req["hash"]
 
             # Debug info
             print("\n\n")
@@ -858,27 +1156,74 @@ def process_withdrawal(data):
     page = BankBot.scb_login(data)
     logging.info(f"Processing {data['transactionId']}")
 
+    # Journal: logged in
+    JOBS.checkpoint("logged_in", data)
+
     BankBot.scb_withdrawal(page, data)
     logging.info(f"Withdrawal Completed !!! {data['transactionId']}")
 
     return data["transactionId"]
 
-@app.route("/scb_company_web/runPython", methods=["POST"])
-def runPython():
-    data = request.get_json(silent=True)
-    if not data:
-        return jsonify({"success": False, "message": "Invalid JSON"}), 400
+# Web stage of a pipelined payout (Playwright worker thread): login, fill and submit, returns the approval ticket
+def process_web_stage(data):
+    page = BankBot.scb_login(data)
+    logging.info(f"Processing {data['transactionId']}")
+
+    # Journal: logged in
+    JOBS.checkpoint("logged_in", data)
+
+    return BankBot.scb_withdrawal(page, data)
+
+# App stage of a pipelined payout (job runner thread): approve on the phone in submission order
+# (batch: together with the other submitted transfers), then Eric for this transactionId
+def process_app_stage(data, ticket):
+    if BATCH_SIZE > 1:
+        with step(BANK, "app_batch_approval"):
+            PIPE.approve_batch(ticket, lambda payouts: BankBot.scb_Anywhere_apps_batch(payouts))
+            logger.info("Successful to Approve Transfer Request (batch)!!! txn_id=%s", get_txn_id(data))
+    else:
+        try:
+            PIPE.approve_turn(ticket)
+            with step(BANK, "app_approval"):
+                BankBot.scb_Anywhere_apps(data, ticket)
+                logger.info("Successful to Approve Transfer Request!!!")
+        finally:
+            PIPE.done(ticket)
+
+    # Journal: transfer approved by the bank
+    JOBS.checkpoint("bank_confirmed", data)
+
+    # Call Eric API
+    BankBot.eric_api(data)
+
+    # Journal: Eric notified
+    JOBS.checkpoint("eric_notified", data)
+    logging.info(f"Withdrawal Completed !!! {data['transactionId']}")
+
+    return data["transactionId"]
+
+# Run one payout (called by a job runner thread: one payout at a time, two overlapping ones with the pipeline)
+def run_payout(data):
 
     worker = PlaywrightWorker.get_worker()
 
-    with LOCK:
+    # Pipeline: no payout lock, the web stages queue on the Playwright worker and the app stages on PIPE
+    with (LOCK if not PIPELINE else nullcontext()):
         try:
-            transaction_id = worker.submit(process_withdrawal, data)
+            if PIPELINE:
+                PIPE.web_stage(started=True)
+                try:
+                    ticket = worker.submit(process_web_stage, data)
+                finally:
+                    PIPE.web_stage(started=False)
+                transaction_id = process_app_stage(data, ticket)
+            else:
+                transaction_id = worker.submit(process_withdrawal, data)
 
-            return jsonify({
+            return {
                 "success": True,
                 "transactionId": transaction_id
-            })
+            }
 
         except Exception as e:
             full_trace = traceback.format_exc()
@@ -889,16 +1234,21 @@ def runPython():
             # WRITES TO LOG FILE
             logging.error(f"CRITICAL ERROR for Transaction {data.get('transactionId', 'unknown')}:\n{full_trace}\n{'-'*40}")
             
-            return jsonify({
+            return {
                 "success": False,
                 "message": str(e),
                 "error_type": type(e).__name__
-            }), 500
+            }
         
+# Async job API: POST /scb_company_web/jobs → 202 + jobId, GET /scb_company_web/jobs/<jobId> status, GET /scb_company_web/jobs queue depth
+# /scb_company_web/runPython still answers when the payout is done (202 with "Prefer: respond-async")
+JOBS = JobQueue("scb_company_web", run_payout, required=["transactionId", "amount", "scbDigitalTokenPin", "toAccountNum", "toBankCode"], notify=BankBot.eric_api, concurrency=max(2, BATCH_SIZE) if PIPELINE else 1)
+runPython = JOBS.register(app, "/scb_company_web")
+
 # ================== MAIN ==============================
 
 if __name__ == "__main__":
     logging.info("🚀 SCB Local API started")
     BankBot.start_ws_client()
-    app.run(host="0.0.0.0", port=5001, debug=False, threaded=False, use_reloader=False)
+    app.run(host="0.0.0.0", port=WORKER.flask_port(5001), debug=False, threaded=True, use_reloader=False)
 
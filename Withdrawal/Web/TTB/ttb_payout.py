@@ -1,19 +1,37 @@
 import os
+import sys
 import re
 import json
 import time
 import atexit
-import hashlib
 import logging
 import requests
 import subprocess
 from threading import Lock
 from airtest.core.api import *
 from dotenv import load_dotenv
-from flask import Flask, request, jsonify
+from flask import Flask
 from playwright.sync_api import sync_playwright
 from poco.drivers.android.uiautomation import AndroidUiautomationPoco
 
+# ================== Shared Modules ==================
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..")))
+from common.eric_client import ERIC
+from common.job_api import JobQueue
+from common.worker_pool import WORKER
+from common.chrome_manager import ChromeManager
+from common.resource_blocker import ResourceBlocker
+from common.step_metrics import step, timed
+from common.sms_inbox import SmsInbox, SmsInboxError
+from common.otp_broker import create_broker, parse_otp
+
+# Step metrics label (same as the job API name)
+BANK = "ttb_company_web"
+
+# OTP SMS of the phone keyed by Ref (OTP_BROKER_URL: broker server shared by the bots of the phone)
+OTP = create_broker(lambda: SmsInbox(SmsInbox.airtest_shell(device()), sender=os.getenv("SMS_SENDER", "ttbbank")))
+
 # =========================== Flask apps ==============================
 
 app = Flask(__name__)
@@ -36,65 +54,49 @@ PAGE = None
 
 # ============== Chrome Settings ====================
 
+# Chrome of this worker (profile / CDP port of WorkerSettings, reused after a bot restart)
+CHROME = ChromeManager(BANK)
+
 class Automation:
-    
-    chrome_proc = None
 
-    # Chrome CDP
+    # Resource blocker profile of this bank portal (common/resource_blocker.py)
+    RESOURCE_PROFILE = "ttb"
+    BLOCKER = None
+
+    # Block images / fonts / media / trackers of a new page, bytes and time saved are logged per page load
     @classmethod
+    def block_resources(cls, page):
+        cls.BLOCKER = ResourceBlocker(cls.RESOURCE_PROFILE).attach(page)
+        return cls.BLOCKER
+
+    # Chrome CDP (attach to the running Chrome of this profile, else launch it, common/chrome_manager.py)
+    @classmethod
+    @timed(BANK)
     def chrome_cdp(cls):
+        global BROWSER, CONTEXT, PAGE
 
-        # Prevent starting Chrome more than once
-        if cls.chrome_proc:
-            return
-        
         # Load .env file
         load_dotenv()
-        USER_DATA_DIR = os.getenv("CHROME_PATH")
-
-        cls.chrome_proc = subprocess.Popen([
-            r"C:\Program Files\Google\Chrome\Application\chrome.exe",
-            "--remote-debugging-port=9222",
-            "--disable-session-crashed-bubble",
-            "--hide-crash-restore-bubble",
-            "--no-first-run",
-            "--no-default-browser-check",
-            f"--user-data-dir={USER_DATA_DIR}",
-        ], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-
-        cls.wait_for_cdp_ready()
-        atexit.register(cls.cleanup)
-
-    # Close Chrome Completely
+
+        # New Chrome (first start or the old one died): the Playwright connection to the old one is gone
+        if CHROME.ensure():
+            BROWSER = CONTEXT = PAGE = None
+
+    # Close Chrome Completely (only a Chrome launched by this bot)
     @classmethod
     def cleanup(cls):
-        try:
-            if cls.chrome_proc and cls.chrome_proc.poll() is None:
-                logging.getLogger("bank_bot").info("Closing Chrome CDP")
-                cls.chrome_proc.terminate()
-        except Exception:
-            logging.getLogger("bank_bot").exception("Chrome cleanup error")
-
-    # Wait Chrome CDP Ready
-    @staticmethod
-    def wait_for_cdp_ready(timeout=10):
-        for _ in range(timeout):
-            try:
-                if requests.get("http://localhost:9222/json").status_code == 200:
-                    return
-            except:
-                pass
-            time.sleep(1)
-        raise RuntimeError("Chrome CDP not ready")
+        CHROME.stop()
 
 # =============== TTB BANK BOT ======================
 
 class BankBot(Automation):
 
     _ttb_ref = None
+    _device_connected = False
 
     # TTB Login
     @classmethod
+    @timed(BANK)
     def ttb_login(cls, data):
         
         global PLAYWRIGHT, BROWSER, CONTEXT, PAGE
@@ -108,7 +110,7 @@ class BankBot(Automation):
 
         # Connect to running Chrome ONLY ONCE
         if BROWSER is None:
-            BROWSER = PLAYWRIGHT.chromium.connect_over_cdp("http://localhost:9222")
+            BROWSER = PLAYWRIGHT.chromium.connect_over_cdp(CHROME.cdp_url)
 
         # Reuse context
         CONTEXT = BROWSER.contexts[0] if BROWSER.contexts else BROWSER.new_context()
@@ -116,6 +118,7 @@ class BankBot(Automation):
         # Reuse page
         if PAGE is None or PAGE.is_closed():
             PAGE = CONTEXT.new_page()
+            cls.block_resources(PAGE)
 
         page = PAGE
 
@@ -163,6 +166,7 @@ class BankBot(Automation):
 
     # TTB Withdrawal
     @classmethod
+    @timed(BANK)
     def ttb_withdrawal(cls, page, data):
 
         # Check if logged out
@@ -195,6 +199,8 @@ class BankBot(Automation):
         page.locator("//button[normalize-space()='Confirm']").click(timeout=0)
         # Button Click "Approve"
         page.locator("//button[normalize-space()='Approve']").click(timeout=0)
+        # Journal: transfer submitted, waiting for the OTP
+        JOBS.checkpoint("form_submitted", data)
 
         # TTB Business One Web Ref Code
         ref_code = page.locator("label.input-label").inner_text()
@@ -204,17 +210,23 @@ class BankBot(Automation):
             print(f"TTB Business One Web Ref Code: {cls._ttb_ref}\n\n")
 
         # Run Read OTP Code
-        otp = cls.ttb_read_otp()
+        otp = cls.ttb_read_otp(cls._ttb_ref)
         # Fill OTP Code
         page.locator("//input[@type='text']").fill(otp, timeout=0)
         # Button Click Somewhere, incase cannot click "SIGN AND SEND"
         page.locator("//span[normalize-space()='Sender details']").click(timeout=0)
         # Button Click "SIGN AND SEND"
         page.locator("//button[@id='orders-summary-sign-and-send-button']").click(timeout=0)
+        # Journal: OTP entered, signed and sent
+        JOBS.checkpoint("otp_entered", data)
         # Wait for Appear "Transfer successful"
         page.locator("//h1[normalize-space()='Transfer successful']").wait_for(timeout=10000)
+        # Journal: transfer done by the bank
+        JOBS.checkpoint("bank_confirmed", data)
         # Callback Eric API
         cls.eric_api(data)
+        # Journal: Eric notified
+        JOBS.checkpoint("eric_notified", data)
         # Delay 1 seconds
         page.wait_for_timeout(1000)
         # Button Click "Transfer again"
@@ -225,13 +237,56 @@ class BankBot(Automation):
     
     # Messages (SMS TTB Business One OTP Code)
     @classmethod
-    def ttb_read_otp(cls):
+    @timed(BANK)
+    def ttb_read_otp(cls, ref_code):
 
         # Hide Debug Log, if want view, just comment the bottom code
         logging.getLogger("airtest").setLevel(logging.WARNING)
         logging.getLogger("pocoui").setLevel(logging.WARNING) 
         logging.getLogger("airtest.core.helper").setLevel(logging.WARNING)
 
+        # Connect this worker's phone once (default = the only attached phone)
+        if WORKER.device_serial and not cls._device_connected:
+            connect_device(f"Android:///{WORKER.device_serial}")
+            cls._device_connected = True
+
+        # OTP broker of the phone: woken as soon as the SMS of this Ref is in the inbox
+        if SmsInbox.ENABLED:
+            try:
+                otp = OTP.wait("ttb", ref_code, since=JOBS.running_since(time.time()))
+                print(f"Found matching Ref: {ref_code} | OTP: {otp} ✅")
+                return otp
+            except SmsInboxError as e:
+                logger.warning(f"SMS inbox query failed ({e}), read the Messages app instead")
+
+        # Messages app UI (fallback of the SMS inbox query)
+        poco = cls.ttb_open_sms_chat()
+
+        while True:
+            # Read All TTB Bank Messages
+            print("🤖 Reading latest message from TTB bank...")
+
+            # --- Collect OTP + Ref from all messages, newest first ---
+            otp_candidates = []
+            for node in reversed(list(poco("message_list").offspring("message_text"))):
+                found = parse_otp("ttb", node.get_text().strip())
+                if found:
+                    otp_candidates.append(found)
+                    print(f"OTP: {found[1]}, Ref: {found[0]} ❌")
+
+            # --- Match correct Ref Code ---
+            for messages_ref_code, messages_otp_code in otp_candidates:
+                if str(ref_code).upper() == messages_ref_code:
+                    print(f"Found matching Ref: {messages_ref_code} | OTP: {messages_otp_code} ✅")
+                    return messages_otp_code
+                
+            # If no match, loop again
+            print("# OTP not found yet, keep waiting... \n")
+
+    # Messages app UI (fallback of the SMS inbox query): open the ttbbank chat, return the Poco assistant
+    @classmethod
+    def ttb_open_sms_chat(cls):
+
         # Poco Assistant
         poco = AndroidUiautomationPoco(use_airtest_input=True, screenshot_each_action=False)
 
@@ -247,7 +302,7 @@ class BankBot(Automation):
 
         # Start Messages Apps
         start_app("com.google.android.apps.messaging")
-        
+
         # Click ttbbank Chat
         # If not in inside ttbank chat, click it, else passs
         try:
@@ -257,79 +312,20 @@ class BankBot(Automation):
                 pass
         except:
             pass
-        
-        while True:
-            # Read All TTB Bank Messages
-            print("🤖 Reading latest message from TTB bank...")
-
-            # Get all the messages text
-            message_nodes = poco("message_list").offspring("message_text")
-
-            # --- Collect OTP + Ref from all new messages ---
-            otp_candidates = []
-            for i, node in reversed(list(enumerate(message_nodes))):
-                messages = node.get_text().strip()
-                if not messages:
-                    continue
-
-                match = re.search(
-                    r"OTP[:\s]*([0-9]{4,8}).*?\(?ref[:\s]*([A-Z0-9]+)\)?",
-                    messages,
-                    re.IGNORECASE,
-                )
-                if match:
-                    messages_otp_code, messages_ref_code = match.groups()
-                    otp_candidates.append((messages_otp_code.strip(), messages_ref_code.strip().upper()))
-                    print(f"OTP: {messages_otp_code}, Ref: {messages_ref_code} ❌")
 
-            # --- Match correct Ref Code ---
-            for messages_otp_code, messages_ref_code in otp_candidates:
-                if cls._ttb_ref == messages_ref_code:
-                    print(f"Found matching Ref: {messages_ref_code} | OTP: {messages_otp_code} ✅")
-                    return messages_otp_code
-                
-            # If no match, loop again
-            print("# OTP not found yet, keep waiting... \n")
+        return poco
 
     # Callback ERIC API
     @classmethod
+    @timed(BANK)
     def eric_api(cls, data):
 
-        url = "https://bot-integration.cloudbdtech.com/integration-service/transaction/payoutScriptCallback"
-
-        # Create payload as a DICTIONARY (not JSON yet)
-        payload = {
-            "bankCode": str(data["fromBankCode"]),
-            "deviceId": str(data["deviceId"]),
-            "merchantCode": str(data["merchantCode"]),
-            "transactionId": str(data["transactionId"]),
-        }
-
-        # Your secret key
-        secret_key = "PRODBankBotIsTheBest"
-
-        # Build the hash string (exact order required)
-        string_to_hash = (
-            f"bankCode={payload['bankCode']}&"
-            f"deviceId={payload['deviceId']}&"
-            f"merchantCode={payload['merchantCode']}&"
-            f"transactionId={payload['transactionId']}{secret_key}"
-        )
-
-        # Generate MD5 hash
-        hash_result = hashlib.md5(string_to_hash.encode("utf-8")).hexdigest()
-
-        # Convert payload to JSON string AFTER hash
-        payload_json = json.dumps(payload)
-
-        # Send request
-        headers = {
-            'accept': '*/*',
-            'hash': hash_result,
-            'Content-Type': 'application/json'
-        }
-
-        response = requests.post(url, headers=headers, data=payload_json)
+        # Send request through the shared Eric client (keep-alive pool, timeout, retry)
+        # A 4xx/5xx reply is only printed, the payout is not failed on it (money already sent)
+        response, req = ERIC.payout_callback(data, check=False)
+        payload = json.loads(req["body"])
+        string_to_hash = req["string_to_hash"]
+        hash_result = req["hash"]
 
         # 7️⃣ Debug info
         print("Raw string to hash:", string_to_hash)
@@ -339,12 +335,8 @@ class BankBot(Automation):
 
 # ================== Code Start Here ================
 
-# Run API
-@app.route("/ttb_company_web/runPython", methods=["POST"])        
-def runPython():
-    data = request.get_json(silent=True)
-    if not data:
-        return jsonify({"success": False, "message": "Invalid JSON"}), 400
+# Run one payout (called by the job runner thread, one payout at a time)
+def run_payout(data):
 
     with LOCK:
         try:
@@ -352,18 +344,25 @@ def runPython():
             Automation.chrome_cdp()
             # Login TTB
             page = BankBot.ttb_login(data)
+            # Journal: logged in
+            JOBS.checkpoint("logged_in", data)
             logger.info(f"▶ Processing {data['transactionId']}")
             BankBot.ttb_withdrawal(page, data)
             logger.info(f"✔ Done {data['transactionId']}")
-            return jsonify({
+            return {
                 "success": True,
                 "transactionId": data["transactionId"]
-            })
+            }
         except Exception as e:
             logger.exception("❌ Withdrawal failed")
-            return jsonify({"success": False, "message": str(e)}), 500
+            return {"success": False, "message": str(e)}
+
+# Async job API: POST /ttb_company_web/jobs → 202 + jobId, GET /ttb_company_web/jobs/<jobId> status, GET /ttb_company_web/jobs queue depth
+# /ttb_company_web/runPython still answers when the payout is done (202 with "Prefer: respond-async")
+JOBS = JobQueue("ttb_company_web", run_payout, required=["transactionId", "amount", "toAccountName", "toAccountNum", "toBankCode"], notify=BankBot.eric_api)
+runPython = JOBS.register(app, "/ttb_company_web")
 
 if __name__ == "__main__":
     logger.info("🚀 TTB Local API started")
-    app.run(host="0.0.0.0", port=5000, debug=False, threaded=False, use_reloader=False)
+    app.run(host="0.0.0.0", port=WORKER.flask_port(5000), debug=False, threaded=True, use_reloader=False)
 
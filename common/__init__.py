@@ -0,0 +1 @@
+# Shared modules for the deposit and payout bots
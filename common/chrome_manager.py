@@ -0,0 +1,249 @@
+import os
+import time
+import atexit
+import socket
+import logging
+import requests
+import subprocess
+from pathlib import Path
+from threading import RLock
+from contextlib import contextmanager
+
+from common.worker_pool import WORKER
+
+logger = logging.getLogger("ChromeManager")
+
+# ================== Chrome Manager ==================
+
+class ChromeManager:
+
+    """
+    Chrome of one bot, driven over CDP:
+        CHROME = ChromeManager(BANK)
+        if CHROME.ensure():                 # before each connect / login, True = a new Chrome was launched
+            BROWSER = None                  # (the Playwright connection to the old one is gone)
+        BROWSER = PLAYWRIGHT.chromium.connect_over_cdp(CHROME.cdp_url)
+    ensure() attaches to the Chrome already running on the profile when its CDP endpoint answers
+    (port read from <profile>/DevToolsActivePort, so a restarted bot reuses its Chrome and two bots
+    never start two Chromes on one profile), else launches Chrome on the worker CDP port. When that
+    port is taken by another process, Chrome picks a free port itself (written to DevToolsActivePort).
+    A Chrome that died soon after its start is launched again with backoff (1, 2, 4 ... seconds).
+    Readiness is polled every 50 ms, each probe with a short request timeout.
+    stop() only terminates a Chrome launched by this manager.
+    Settings: CHROME_EXE, CHROME_PROFILE / CDP_PORT (WorkerSettings, CHROME_PATH = old profile setting),
+    CHROME_READY_TIMEOUT (default 15), CHROME_RESTART_BACKOFF_MAX (default 60)
+    """
+
+    EXE = os.getenv("CHROME_EXE", r"C:\Program Files\Google\Chrome\Application\chrome.exe")
+    READY_TIMEOUT = float(os.getenv("CHROME_READY_TIMEOUT", "15"))
+    BACKOFF_MAX = float(os.getenv("CHROME_RESTART_BACKOFF_MAX", "60"))
+    POLL = 0.05                 # readiness poll interval (seconds)
+    PROBE_TIMEOUT = 0.5         # request timeout of one readiness probe
+    STABLE_SECONDS = 60         # a Chrome alive this long resets the backoff
+    ARGS = [
+        "--disable-session-crashed-bubble",
+        "--hide-crash-restore-bubble",
+        "--no-first-run",
+        "--no-default-browser-check",
+    ]
+
+    def __init__(self, name, profile=None, port=None, exe=None, args=()):
+        self.name = name
+        self._profile = profile
+        self._port = port
+        self.exe = exe or self.EXE
+        self.args = list(args)
+        self.lock = RLock()
+        self.proc = None            # Chrome launched by this manager
+        self.port = None            # CDP port of the Chrome in use
+        self.launched_at = 0
+        self.failures = 0           # short-lived / failed launches in a row
+        self.cleanup_registered = False
+
+    # Profile / port read when used, so load_dotenv() in the bot applies
+    @property
+    def profile(self):
+        return self._profile or WORKER.chrome_profile or os.getenv("CHROME_PATH") or None
+
+    @property
+    def requested_port(self):
+        return int(self._port or WORKER.cdp_port)
+
+    @property
+    def cdp_url(self):
+        return f"http://localhost:{self.port or self.requested_port}"
+
+    # ================== Attach / Launch ==================
+
+    # Chrome ready on CDP: attach to the running one of the profile, else launch it. True = launched
+    def ensure(self):
+        with self.lock:
+            port = self.running_port()
+            if port:
+                if port != self.port:
+                    logger.info("%s: attached to running Chrome on CDP port %s", self.name, port)
+                self.port = port
+                return False
+
+            if self.proc is not None:
+                logger.warning("%s: Chrome on CDP port %s is gone, launching it again", self.name, self.port)
+
+            with self.launch_lock():
+                # Another bot may have launched Chrome on this profile while this one waited
+                port = self.running_port()
+                if port:
+                    logger.info("%s: attached to Chrome launched by another bot on CDP port %s", self.name, port)
+                    self.port = port
+                    return False
+
+                self.backoff()
+                self.start()
+                return True
+
+    # CDP port of a healthy Chrome this manager can use, else None
+    def running_port(self):
+        candidates = [self.port, self.active_port()]
+        # Without a profile nothing tells whose Chrome it is: the worker port (old behaviour)
+        if not self.profile:
+            candidates.append(self.requested_port)
+        for port in candidates:
+            if port and self.healthy(port):
+                return port
+        return None
+
+    # Launch Chrome and wait for its CDP endpoint
+    def start(self):
+        self.stop()
+
+        port = self.requested_port
+        if not self.port_free(port):
+            logger.warning("%s: CDP port %s is taken by another process, Chrome picks a free port", self.name, port)
+            port = 0
+
+        # Stale port file of a dead Chrome
+        if self.profile:
+            try:
+                (Path(self.profile) / "DevToolsActivePort").unlink()
+            except OSError:
+                pass
+
+        command = [self.exe, f"--remote-debugging-port={port}", *self.ARGS, *self.args]
+        if self.profile:
+            command.append(f"--user-data-dir={self.profile}")
+
+        self.proc = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        self.launched_at = time.time()
+        try:
+            self.port = self.wait_ready(port)
+        except Exception:
+            self.stop()
+            raise
+
+        logger.info("%s: Chrome ready on CDP port %s in %.2fs", self.name, self.port, time.time() - self.launched_at)
+        if not self.cleanup_registered:
+            atexit.register(self.stop)
+            self.cleanup_registered = True
+
+    # Poll the CDP endpoint until it answers, return its port
+    def wait_ready(self, port, timeout=None):
+        end = time.time() + (timeout or self.READY_TIMEOUT)
+        while time.time() < end:
+            if self.proc.poll() is not None:
+                raise RuntimeError(f"Chrome exited at start (code {self.proc.returncode}), is it already open on profile {self.profile} without a CDP port?")
+            ready_port = port or self.active_port()
+            if ready_port and self.healthy(ready_port):
+                return ready_port
+            time.sleep(self.POLL)
+        raise RuntimeError("Chrome CDP not ready")
+
+    # Wait before launching again when the last Chrome died soon after its start
+    def backoff(self):
+        if self.launched_at and time.time() - self.launched_at < self.STABLE_SECONDS:
+            self.failures += 1
+        elif self.launched_at:
+            self.failures = 0
+
+        if self.failures:
+            delay = min(self.BACKOFF_MAX, 2 ** (self.failures - 1))
+            logger.warning("%s: Chrome restart #%s, waiting %ss", self.name, self.failures, delay)
+            time.sleep(delay)
+
+    # Close the Chrome launched by this manager (an attached Chrome is left running)
+    def stop(self):
+        with self.lock:
+            proc, self.proc = self.proc, None
+            if proc is None or proc.poll() is not None:
+                return
+            logger.info("%s: closing Chrome", self.name)
+            try:
+                proc.terminate()
+                proc.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+            except Exception as e:
+                logger.error("%s: Chrome cleanup error: %s", self.name, e)
+            self.port = None
+
+    # ================== Probes ==================
+
+    # CDP endpoint answers on this port
+    def healthy(self, port):
+        try:
+            return requests.get(f"http://localhost:{port}/json/version", timeout=self.PROBE_TIMEOUT).status_code == 200
+        except requests.RequestException:
+            return False
+
+    # CDP port of the Chrome running on the profile (DevToolsActivePort, first line), None if not known
+    def active_port(self):
+        if not self.profile:
+            return None
+        try:
+            return int((Path(self.profile) / "DevToolsActivePort").read_text().splitlines()[0])
+        except (OSError, ValueError, IndexError):
+            return None
+
+    # Nothing listens on this port (connect test, a closed Chrome's TIME_WAIT does not count)
+    @staticmethod
+    def port_free(port):
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+                return False
+        except OSError:
+            return True
+
+    # One launch at a time per profile across bot processes (lock file in the profile, stale after the ready timeout)
+    @contextmanager
+    def launch_lock(self):
+        if not self.profile:
+            yield
+            return
+
+        os.makedirs(self.profile, exist_ok=True)
+        path = Path(self.profile) / "bot_chrome.lock"
+        end = time.time() + self.READY_TIMEOUT * 2
+        while True:
+            try:
+                fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                os.write(fd, str(os.getpid()).encode())
+                os.close(fd)
+                break
+            except FileExistsError:
+                try:
+                    stale = time.time() - path.stat().st_mtime > self.READY_TIMEOUT * 2
+                except OSError:
+                    stale = False
+                if stale or time.time() > end:
+                    logger.warning("%s: removing stale Chrome launch lock %s", self.name, path)
+                    try:
+                        path.unlink()
+                    except OSError:
+                        pass
+                    continue
+                time.sleep(self.POLL)
+        try:
+            yield
+        finally:
+            try:
+                path.unlink()
+            except OSError:
+                pass
@@ -0,0 +1,153 @@
+import json
+import time
+import hashlib
+import logging
+import requests
+from threading import Lock
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger("EricClient")
+
+# ================== Eric Settings ==================
+
+# Production
+BASE_URL = "https://bot-integration.cloudbdtech.com/integration-service"
+SECRET_KEY = "PRODBankBotIsTheBest"
+
+# # Staging
+# BASE_URL = "https://stg-bot-integration.cloudbdtech.com/integration-service"
+# SECRET_KEY = "DEVBankBotIsTheBest"
+
+PAYOUT_CALLBACK_PATH = "/transaction/payoutScriptCallback"
+ADD_DEPOSIT_PATH = "/transaction/addDepositTransaction"
+
+# ================== Eric Client ==================
+
+class EricClient:
+
+    """
+    One keep-alive connection pool for every Eric callback of the process.
+    - connect / read timeouts on every call
+    - retries (connection errors, 502/503/504) only for idempotent callbacks
+    - per-call latency metrics (stats())
+    """
+
+    TIMEOUT = (3.05, 20)        # (connect, read) seconds
+    RETRIES = 3
+    POOL_SIZE = 10
+
+    def __init__(self, base_url=BASE_URL, secret_key=SECRET_KEY):
+        self.base_url = base_url
+        self.secret_key = secret_key
+        self.metrics = {}
+        self.metrics_lock = Lock()
+
+        retry = Retry(
+            total=self.RETRIES,
+            connect=self.RETRIES,
+            read=self.RETRIES,
+            status=self.RETRIES,
+            backoff_factor=0.5,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=frozenset(["POST"]),
+            raise_on_status=False,
+        )
+
+        # Session for idempotent callbacks (retry), and one without retry
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_connections=2, pool_maxsize=self.POOL_SIZE, max_retries=retry))
+        self.session_no_retry = requests.Session()
+        self.session_no_retry.mount("https://", HTTPAdapter(pool_connections=2, pool_maxsize=self.POOL_SIZE, max_retries=0))
+
+    # ================== Signing ==================
+
+    # "k1=v1&k2=v2...{secret}" in the given field order, MD5 hex
+    def sign(self, payload, fields):
+        string_to_hash = "&".join(f"{key}={payload[key]}" for key in fields) + self.secret_key
+        hash_result = hashlib.md5(string_to_hash.encode("utf-8")).hexdigest()
+        return string_to_hash, hash_result
+
+    # Build a signed request (url, headers, body) without sending it
+    def build(self, path, payload, fields):
+        string_to_hash, hash_result = self.sign(payload, fields)
+        headers = {
+            'accept': '*/*',
+            'hash': hash_result,
+            'Content-Type': 'application/json'
+        }
+        # Convert payload to JSON string AFTER hash
+        return {
+            "url": self.base_url + path,
+            "headers": headers,
+            "body": json.dumps(payload),
+            "string_to_hash": string_to_hash,
+            "hash": hash_result,
+        }
+
+    # ================== Sending ==================
+
+    # POST a signed payload and record latency (check=False: a 4xx/5xx reply is returned, not raised)
+    def post(self, path, payload, fields, idempotent=False, check=True):
+        req = self.build(path, payload, fields)
+        session = self.session if idempotent else self.session_no_retry
+
+        started = time.perf_counter()
+        status = None
+        try:
+            response = session.post(req["url"], headers=req["headers"], data=req["body"], timeout=self.TIMEOUT)
+            status = response.status_code
+            if check:
+                response.raise_for_status()
+            return response, req
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self.record_latency(path, elapsed_ms, status)
+            logger.info("ERIC POST %s status=%s %.0f ms", path, status, elapsed_ms)
+
+    # Payout success callback (idempotent by transactionId, so retried)
+    # check=False for the bots that never failed a payout on the Eric reply (the money is already sent)
+    def payout_callback(self, data, check=True):
+        payload = {
+            "bankCode": str(data["fromBankCode"]),
+            "deviceId": str(data["deviceId"]),
+            "merchantCode": str(data["merchantCode"]),
+            "transactionId": str(data["transactionId"]),
+        }
+        return self.post(PAYOUT_CALLBACK_PATH, payload, ["bankCode", "deviceId", "merchantCode", "transactionId"], idempotent=True, check=check)
+
+    # Signed deposit request, for the deposit outbox to deliver
+    def build_deposit(self, bank_code, device_id, merchant_code, raw_message, transaction_time):
+        payload = {
+            "bankCode": bank_code,
+            "deviceId": device_id,
+            "merchantCode": merchant_code,
+            "rawMessage": raw_message,
+            "transactionTime": transaction_time
+        }
+        return self.build(ADD_DEPOSIT_PATH, payload, ["bankCode", "deviceId", "merchantCode", "rawMessage", "transactionTime"])
+
+    # ================== Metrics ==================
+
+    # Record one call (also used by the deposit outbox sender)
+    def record_latency(self, path, elapsed_ms, status):
+        with self.metrics_lock:
+            m = self.metrics.setdefault(path, {"count": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0, "last_ms": 0.0})
+            m["count"] += 1
+            m["total_ms"] += elapsed_ms
+            m["max_ms"] = max(m["max_ms"], elapsed_ms)
+            m["last_ms"] = elapsed_ms
+            if status is None or status >= 400:
+                m["errors"] += 1
+
+    # Latency summary per path
+    def stats(self):
+        with self.metrics_lock:
+            return {
+                path: dict(m, avg_ms=(m["total_ms"] / m["count"]) if m["count"] else 0.0)
+                for path, m in self.metrics.items()
+            }
+
+
+# One shared client per process
+ERIC = EricClient()
@@ -0,0 +1,145 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+from pathlib import Path
+from threading import Lock
+from collections import OrderedDict
+
+logger = logging.getLogger("Idempotency")
+
+# ================== Idempotency Store ==================
+
+class IdempotencyStore:
+
+    """
+    Which transactionId is running / done, shared by every process using the same file (SQLite WAL),
+    so it survives restarts and works across the workers of one bank.
+    - claim(): atomic, only one caller may run a transactionId (a failed one can be claimed again)
+    - finished results are cached in memory (LRU, MEMORY_ITEMS entries, TTL seconds)
+    - rows older than TTL are evicted from the file
+    Settings: IDEMPOTENCY_TTL_HOURS (default 168 = 7 days)
+    """
+
+    TTL = float(os.getenv("IDEMPOTENCY_TTL_HOURS", "168")) * 3600
+    MEMORY_ITEMS = 1000
+    EVICT_EVERY = 200           # writes between two evictions of expired rows
+
+    def __init__(self, db_path, owner):
+        self.db_path = Path(db_path)
+        self.owner = owner
+        self.lock = Lock()
+        self.memory = OrderedDict()     # transactionId → (expires_at, row)
+        self.writes = 0
+
+        self.conn = sqlite3.connect(str(self.db_path), timeout=30, check_same_thread=False, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS idempotency (
+                transaction_id TEXT PRIMARY KEY,
+                status         TEXT NOT NULL,
+                job_id         TEXT,
+                owner          TEXT,
+                result         TEXT,
+                created_at     REAL NOT NULL,
+                updated_at     REAL NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_idempotency_updated ON idempotency(updated_at)")
+        self.evict()
+
+    # ================== Claim / Finish ==================
+
+    # Claim a transactionId for this job: None if claimed, else the existing row (running or succeeded)
+    def claim(self, transaction_id, job_id):
+        cached = self._memory_get(transaction_id)
+        if cached is not None and cached["status"] == "succeeded":
+            return cached
+
+        now = time.time()
+        with self.lock:
+            cur = self.conn.execute("""
+                INSERT INTO idempotency (transaction_id, status, job_id, owner, created_at, updated_at)
+                VALUES (?, 'running', ?, ?, ?, ?)
+                ON CONFLICT(transaction_id) DO UPDATE SET
+                    status = 'running', job_id = excluded.job_id, owner = excluded.owner,
+                    result = NULL, updated_at = excluded.updated_at
+                WHERE idempotency.status = 'failed' OR idempotency.updated_at < ?
+            """, (transaction_id, job_id, self.owner, now, now, now - self.TTL))
+            if cur.rowcount == 1:
+                self.memory.pop(transaction_id, None)
+                return None
+            row = self.conn.execute("SELECT * FROM idempotency WHERE transaction_id = ?", (transaction_id,)).fetchone()
+        return self._row(row)
+
+    # Record the final status and result of a claimed transactionId
+    def finish(self, transaction_id, status, result):
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "UPDATE idempotency SET status = ?, result = ?, updated_at = ? WHERE transaction_id = ?",
+                (status, json.dumps(result), now, transaction_id),
+            )
+            row = self.conn.execute("SELECT * FROM idempotency WHERE transaction_id = ?", (transaction_id,)).fetchone()
+            self.writes += 1
+            evict = self.writes % self.EVICT_EVERY == 0
+        self._memory_put(transaction_id, self._row(row))
+        if evict:
+            self.evict()
+
+    # Rows still "running" of this owner (process died before finish), for the journal / reconcile
+    def interrupted(self):
+        with self.lock:
+            rows = self.conn.execute("SELECT * FROM idempotency WHERE status = 'running' AND owner = ?", (self.owner,)).fetchall()
+        return [self._row(row) for row in rows]
+
+    # Mark a claimed transactionId with a status without result (e.g. "interrupted")
+    def mark(self, transaction_id, status):
+        with self.lock:
+            self.conn.execute(
+                "UPDATE idempotency SET status = ?, updated_at = ? WHERE transaction_id = ?",
+                (status, time.time(), transaction_id),
+            )
+        self.memory.pop(transaction_id, None)
+
+    # ================== Eviction ==================
+
+    # Remove rows older than TTL, checkpoint the WAL
+    def evict(self):
+        with self.lock:
+            deleted = self.conn.execute("DELETE FROM idempotency WHERE updated_at < ?", (time.time() - self.TTL,)).rowcount
+            self.conn.execute("PRAGMA wal_checkpoint(PASSIVE)")
+        if deleted:
+            logger.info("Idempotency: evicted %s expired transactionIds", deleted)
+
+    # ================== Memory Cache ==================
+
+    def _memory_get(self, transaction_id):
+        with self.lock:
+            item = self.memory.get(transaction_id)
+            if item is None:
+                return None
+            expires_at, row = item
+            if expires_at < time.time():
+                del self.memory[transaction_id]
+                return None
+            self.memory.move_to_end(transaction_id)
+            return row
+
+    def _memory_put(self, transaction_id, row):
+        with self.lock:
+            self.memory[transaction_id] = (time.time() + self.TTL, row)
+            self.memory.move_to_end(transaction_id)
+            while len(self.memory) > self.MEMORY_ITEMS:
+                self.memory.popitem(last=False)
+
+    @staticmethod
+    def _row(row):
+        if row is None:
+            return None
+        data = dict(row)
+        data["result"] = json.loads(data["result"]) if data["result"] else None
+        return data
@@ -0,0 +1,428 @@
+import os
+import sys
+import time
+import uuid
+import queue
+import logging
+import requests
+import threading
+import traceback
+from threading import Lock
+from collections import OrderedDict
+from flask import Response, request, jsonify, url_for
+from common.idempotency import IdempotencyStore
+from common.job_journal import JobJournal, SAFE_TO_REDO
+from common.worker_pool import WORKER
+from common.step_metrics import METRICS
+
+logger = logging.getLogger("JobAPI")
+
+# ================== Payout Job ==================
+
+class Job:
+
+    def __init__(self, data, callback_url=None, job_id=None, action="payout"):
+        self.id = job_id or uuid.uuid4().hex
+        self.data = data
+        self.transaction_id = str(data.get("transactionId", "unknown"))
+        self.callback_url = callback_url
+        self.status = "queued"          # queued → running → succeeded / failed (conflict: not run, see error)
+        self.action = action            # "payout", or "notify" (recovered job: bank done, Eric callback only)
+        self.checkpoint = "queued"      # last journal checkpoint
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.done = threading.Event()
+
+    # Public view (no credentials from the payload)
+    def to_dict(self):
+        return {
+            "jobId": self.id,
+            "transactionId": self.transaction_id,
+            "status": self.status,
+            "checkpoint": self.checkpoint,
+            "result": self.result,
+            "error": self.error,
+            "createdAt": self.created_at,
+            "startedAt": self.started_at,
+            "finishedAt": self.finished_at,
+            "durationMs": round((self.finished_at - self.started_at) * 1000) if self.finished_at and self.started_at else None,
+        }
+
+# ================== Job Queue ==================
+
+class JobQueue:
+
+    """
+    Asynchronous payout jobs for a bot Flask server.
+    POST  {prefix}/jobs            validate + enqueue, 202 with the job id at once
+    GET   {prefix}/jobs/<job_id>   job status / result
+    GET   {prefix}/jobs            queue depth and counters
+    GET   {prefix}/metrics, /metrics   Prometheus: step latency histograms (common/step_metrics.py), job counters
+    POST  {prefix}/runPython       old synchronous call, same queue (202 with "Prefer: respond-async")
+    One runner thread executes the jobs in order (the bank account / phone is used by one payout at a time).
+    concurrency=2: two runner threads, for a bot that pipelines its own stages (SCB: the web form of the next
+    payout while the phone approves the previous one), the handler then orders the stages itself.
+    A "callbackUrl" in the payload receives the finished job as JSON.
+    Idempotent on transactionId (state in <bot folder>/<name>_idempotency.db, shared by the workers of a bank):
+    a succeeded id returns its stored result without running again, a queued/running one returns the same job,
+    an id running on another worker or cut by a restart is not run again (409 "conflict"), a failed id may be retried.
+    Every job and its checkpoints (JOBS.checkpoint("logged_in", data) ... "eric_notified") go to <name>_journal.db,
+    on restart the unfinished jobs are recovered from their last checkpoint (see recover()).
+    """
+
+    KEEP_FINISHED = 500                                             # finished jobs kept for status queries
+    SYNC_TIMEOUT = float(os.getenv("JOB_SYNC_TIMEOUT", "600"))      # runPython wait, seconds
+    CALLBACK_TIMEOUT = (3.05, 10)
+    CALLBACK_RETRIES = 3
+
+    def __init__(self, name, handler, required=("transactionId",), state_dir=None, notify=None, reconcile=None, concurrency=1):
+        self.name = name
+        self.handler = handler
+        self.notify = notify            # notify(data): Eric callback of a payout the bank already confirmed
+        self.reconcile = reconcile      # reconcile(data, checkpoint): True paid / False not paid / None unknown
+        self.required = list(required)
+        self.queue = queue.Queue()
+        self.jobs = OrderedDict()
+        self.by_transaction = {}
+        self.lock = Lock()
+        self.active = []                # running jobs, oldest first
+        self.counters = {"accepted": 0, "duplicates": 0, "replayed": 0, "conflicts": 0, "succeeded": 0, "failed": 0}
+        self.session = requests.Session()
+
+        # Idempotency state next to the bot script
+        state_dir = state_dir or os.path.dirname(os.path.abspath(getattr(sys.modules["__main__"], "__file__", "") or "."))
+        self.store = IdempotencyStore(os.path.join(state_dir, f"{name}_idempotency.db"), WORKER.name)
+        self.journal = JobJournal(os.path.join(state_dir, f"{name}_journal.db"), WORKER.name)
+        self.recover()
+
+        self.threads = [threading.Thread(target=self._run, name=f"{name}-jobs-{index}", daemon=True) for index in range(max(1, concurrency))]
+        for thread in self.threads:
+            thread.start()
+
+    # ================== Submit ==================
+
+    # Missing required fields of a payload
+    def validate(self, data):
+        return [key for key in self.required if data.get(key) in (None, "")]
+
+    # Enqueue a payout, same transactionId still queued/running = the existing job,
+    # already done / running elsewhere = a finished job answered from the idempotency store
+    def submit(self, data):
+        with self.lock:
+            existing = self.jobs.get(self.by_transaction.get(str(data.get("transactionId"))))
+            if existing is not None and existing.status in ("queued", "running"):
+                self.counters["duplicates"] += 1
+                return existing, False
+
+            job = Job(data, data.get("callbackUrl"))
+            row = self.store.claim(job.transaction_id, job.id)
+            if row is not None:
+                return self._replay(job, row), False
+
+            self.jobs[job.id] = job
+            self.by_transaction[job.transaction_id] = job.id
+            self.counters["accepted"] += 1
+            self._trim()
+            self.journal.record(job.id, job.transaction_id, data)
+
+        self.queue.put(job)
+        logger.info("Job %s queued. txn_id=%s depth=%s", job.id, job.transaction_id, self.queue.qsize())
+        return job, True
+
+    # Answer a transactionId already claimed: stored result if succeeded, else a conflict (no second payout)
+    def _replay(self, job, row):
+        job.started_at = job.finished_at = time.time()
+        if row["status"] == "succeeded":
+            job.id = row["job_id"]
+            job.status = "succeeded"
+            job.result = row["result"]
+            self.counters["replayed"] += 1
+            logger.info("Job %s replayed from store. txn_id=%s", job.id, job.transaction_id)
+        else:
+            job.status = "conflict"
+            job.error = {"message": f"transactionId is {row['status']} on {row['owner']} since {time.ctime(row['updated_at'])}", "error_type": "DuplicateTransaction"}
+            self.counters["conflicts"] += 1
+            logger.warning("Job %s refused, txn_id=%s is %s on %s", job.id, job.transaction_id, row["status"], row["owner"])
+        job.done.set()
+
+        self.jobs[job.id] = job
+        self.by_transaction[job.transaction_id] = job.id
+        self._trim()
+        return job
+
+    # ================== Recovery ==================
+
+    # Jobs left unfinished by the last process, handled by their last checkpoint:
+    # - queued / logged_in: nothing sent to the bank, run again (or released for the caller to resend if
+    #   the journal has no credentials, see JOURNAL_KEEP_SECRETS)
+    # - form_submitted / otp_entered: unknown at the bank, reconcile() decides, else kept for manual review
+    # - bank_confirmed: paid, only the Eric callback is sent (notify)
+    # - eric_notified: done
+    def recover(self):
+        recovered = set()
+        for row in self.journal.unfinished():
+            job_id, txn_id, checkpoint, data = row["job_id"], row["transaction_id"], row["checkpoint"], row["payload"]
+            recovered.add(txn_id)
+
+            paid = None
+            if checkpoint in ("form_submitted", "otp_entered") and self.reconcile:
+                try:
+                    paid = self.reconcile(data, checkpoint)
+                except Exception as e:
+                    logger.warning("Reconcile of txn_id=%s failed: %s", txn_id, e)
+
+            if checkpoint == "eric_notified":
+                self._recovered(job_id, txn_id, "succeeded", {"success": True, "transactionId": txn_id})
+            elif checkpoint == "bank_confirmed" or paid is True:
+                if self.notify:
+                    self._resume(Job(data, None, job_id, action="notify"), checkpoint)
+                else:
+                    self._recovered(job_id, txn_id, "needs_review", None)
+            elif checkpoint in SAFE_TO_REDO or paid is False:
+                if row["complete"]:
+                    self._resume(Job(data, data.get("callbackUrl"), job_id), checkpoint)
+                else:
+                    self._recovered(job_id, txn_id, "failed", {"success": False, "transactionId": txn_id, "message": "Interrupted before the bank transfer, send again"})
+            else:
+                self._recovered(job_id, txn_id, "needs_review", None)
+
+        # Claimed in the idempotency store but never journaled
+        for row in self.store.interrupted():
+            if row["transaction_id"] not in recovered:
+                logger.warning("Job %s of txn_id=%s was cut by a restart, not run again until checked", row["job_id"], row["transaction_id"])
+                self.store.mark(row["transaction_id"], "interrupted")
+
+    # Queue a recovered job again (same job id, idempotency claim kept)
+    def _resume(self, job, checkpoint):
+        job.checkpoint = checkpoint
+        self.jobs[job.id] = job
+        self.by_transaction[job.transaction_id] = job.id
+        self.queue.put(job)
+        logger.warning("Job %s resumed after restart (%s from checkpoint %s). txn_id=%s", job.id, job.action, checkpoint, job.transaction_id)
+
+    # Close a recovered job without running it
+    def _recovered(self, job_id, txn_id, status, result):
+        self.journal.finish(job_id, status)
+        if status == "needs_review":
+            self.store.mark(txn_id, status)
+            logger.error("Job %s of txn_id=%s stopped after the bank transfer started, check the bank before paying again", job_id, txn_id)
+        else:
+            self.store.finish(txn_id, status, result)
+            logger.warning("Job %s of txn_id=%s closed after restart: %s", job_id, txn_id, status)
+
+    # ================== Checkpoints ==================
+
+    # Latest started running job (None when idle)
+    @property
+    def running(self):
+        active = self.active
+        return active[-1] if active else None
+
+    # Running job of this payout data (the latest started one without data)
+    def _active_job(self, data=None):
+        if data is None:
+            return self.running
+        txn_id = str(data.get("transactionId"))
+        return next((job for job in list(self.active) if job.transaction_id == txn_id), None)
+
+    # Record a checkpoint of the running payout (called by the bot flow with the payout data)
+    def checkpoint(self, step, data=None):
+        job = self._active_job(data)
+        if job is None:
+            logger.warning("Checkpoint %s ignored, not the running job. txn_id=%s", step, (data or {}).get("transactionId"))
+            return
+        self.journal.checkpoint(job.id, step)
+        job.checkpoint = step
+
+    # Start time of the running payout (epoch seconds), e.g. oldest OTP SMS that can belong to it
+    def running_since(self, default=None):
+        job = self.running
+        return job.started_at if job is not None and job.started_at else default
+
+    # Forget the oldest finished jobs
+    def _trim(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.done.is_set()]
+        for job_id in finished[:max(0, len(finished) - self.KEEP_FINISHED)]:
+            job = self.jobs.pop(job_id)
+            if self.by_transaction.get(job.transaction_id) == job_id:
+                del self.by_transaction[job.transaction_id]
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    # Queue depth and counters
+    def stats(self):
+        with self.lock:
+            return dict(
+                self.counters,
+                name=self.name,
+                queued=self.queue.qsize(),
+                running=self.running.to_dict() if self.running else None,
+                active=len(self.active),
+            )
+
+    # ================== Runner ==================
+
+    def _run(self):
+        while True:
+            job = self.queue.get()
+            with self.lock:
+                self.active.append(job)
+                job.status = "running"
+                job.started_at = time.time()
+
+            try:
+                if job.action == "notify":
+                    self.notify(job.data)
+                    self.checkpoint("eric_notified", job.data)
+                    result = {"success": True, "transactionId": job.transaction_id}
+                else:
+                    result = self.handler(job.data)
+                job.result = result
+                job.status = "failed" if isinstance(result, dict) and result.get("success") is False else "succeeded"
+            except Exception as e:
+                logger.error("Job %s failed. txn_id=%s\n%s", job.id, job.transaction_id, traceback.format_exc())
+                job.error = {"message": str(e), "error_type": type(e).__name__}
+                job.status = "failed"
+
+            # Paid and Eric notified: an error after that (back to main page, ...) does not undo the payout
+            if job.status == "failed" and job.checkpoint == "eric_notified":
+                logger.warning("Job %s failed after Eric was notified, kept as succeeded. txn_id=%s", job.id, job.transaction_id)
+                job.result = {"success": True, "transactionId": job.transaction_id, "warning": (job.error or job.result or {}).get("message")}
+                job.error = None
+                job.status = "succeeded"
+
+            with self.lock:
+                job.finished_at = time.time()
+                self.active.remove(job)
+                self.counters[job.status] += 1
+
+            # Failed after the bank transfer started: never retried automatically
+            if job.status == "failed" and job.checkpoint not in SAFE_TO_REDO:
+                logger.error("Job %s failed after checkpoint %s, check the bank before paying again. txn_id=%s", job.id, job.checkpoint, job.transaction_id)
+                self.store.mark(job.transaction_id, "needs_review")
+                self.journal.finish(job.id, "needs_review")
+            else:
+                self.store.finish(job.transaction_id, job.status, job.result if job.result is not None else job.error)
+                self.journal.finish(job.id, job.status)
+            job.done.set()
+
+            METRICS.observe(self.name, "payout_total", job.status, job.finished_at - job.started_at)
+            logger.info("Job %s %s in %.1fs. txn_id=%s", job.id, job.status, job.finished_at - job.started_at, job.transaction_id)
+
+            if job.callback_url:
+                self._callback(job)
+
+    # POST the finished job to the caller's callback URL
+    def _callback(self, job):
+        for attempt in range(1, self.CALLBACK_RETRIES + 1):
+            try:
+                response = self.session.post(job.callback_url, json=job.to_dict(), timeout=self.CALLBACK_TIMEOUT)
+                response.raise_for_status()
+                return
+            except Exception as e:
+                logger.warning("Job %s callback attempt %s failed: %s", job.id, attempt, e)
+                time.sleep(2 ** attempt)
+
+    # ================== Flask ==================
+
+    # Response of a job: 200 when succeeded, 500 when failed, 409 on conflict, 202 while queued/running
+    @staticmethod
+    def job_response(job):
+        if job.status == "succeeded":
+            body = job.result if isinstance(job.result, dict) else {"success": True, "transactionId": job.transaction_id}
+            return jsonify(body), 200
+        if job.status == "failed":
+            body = job.result if isinstance(job.result, dict) else dict(job.error or {}, success=False)
+            return jsonify(body), 500
+        if job.status == "conflict":
+            return jsonify(dict(job.error, success=False, transactionId=job.transaction_id)), 409
+        return jsonify(job.to_dict()), 202
+
+    # Parse + validate + submit, returns (job, error response)
+    def accept(self):
+        data = request.get_json(silent=True)
+        if not data or not isinstance(data, dict):
+            return None, (jsonify({"success": False, "message": "Invalid JSON"}), 400)
+
+        missing = self.validate(data)
+        if missing:
+            return None, (jsonify({"success": False, "message": f"Missing fields: {', '.join(missing)}"}), 400)
+
+        job, _ = self.submit(data)
+        return job, None
+
+    # 202 Accepted with the status URL (200 / 409 when answered from the idempotency store)
+    def accepted(self, job, endpoint):
+        body = dict(job.to_dict(), queueDepth=self.queue.qsize())
+        response = jsonify(body)
+        response.status_code = 202
+        if job.done.is_set():
+            response.status_code = 409 if job.status == "conflict" else 200
+        response.headers["Location"] = url_for(endpoint, job_id=job.id)
+        return response
+
+    # Prometheus text: job counters and queue depth of this queue, then the step histograms
+    def metrics(self):
+        with self.lock:
+            counters = dict(self.counters)
+            busy = len(self.active)
+        lines = ["# HELP payout_jobs_total Payout jobs by result", "# TYPE payout_jobs_total counter"]
+        lines += [f'payout_jobs_total{{bank="{self.name}",result="{key}"}} {value}' for key, value in counters.items()]
+        lines += [
+            "# HELP payout_queue_depth Payout jobs waiting", "# TYPE payout_queue_depth gauge",
+            f'payout_queue_depth{{bank="{self.name}"}} {self.queue.qsize()}',
+            "# HELP payout_running Payout jobs running", "# TYPE payout_running gauge",
+            f'payout_running{{bank="{self.name}"}} {busy}',
+        ]
+        return "\n".join(lines) + "\n" + METRICS.render()
+
+    # Add the job routes to the Flask app, returns the runPython view (sync unless respond-async)
+    def register(self, app, prefix):
+        status_endpoint = f"{self.name}_job_status"
+
+        def post_job():
+            job, error = self.accept()
+            if error:
+                return error
+            return self.accepted(job, status_endpoint)
+
+        def job_status(job_id):
+            job = self.get(job_id)
+            if job is None:
+                return jsonify({"success": False, "message": "Unknown job"}), 404
+            return jsonify(dict(job.to_dict(), checkpoints=self.journal.events(job.id)))
+
+        def job_stats():
+            return jsonify(self.stats())
+
+        def run_python():
+            job, error = self.accept()
+            if error:
+                return error
+
+            # Asynchronous when the caller asks for it
+            if "respond-async" in (request.headers.get("Prefer") or "") or request.args.get("async") == "1":
+                return self.accepted(job, status_endpoint)
+
+            # Old behaviour: wait for the payout result
+            if not job.done.wait(self.SYNC_TIMEOUT):
+                body = dict(job.to_dict(), success=False, message="Worker timeout waiting for job, poll the job status")
+                return jsonify(body), 504
+            return self.job_response(job)
+
+        def metrics_view():
+            return Response(self.metrics(), mimetype="text/plain; version=0.0.4")
+
+        app.add_url_rule(f"{prefix}/jobs", f"{self.name}_post_job", post_job, methods=["POST"])
+        app.add_url_rule(f"{prefix}/jobs/<job_id>", status_endpoint, job_status, methods=["GET"])
+        app.add_url_rule(f"{prefix}/jobs", f"{self.name}_job_stats", job_stats, methods=["GET"])
+        app.add_url_rule(f"{prefix}/runPython", f"{self.name}_run_python", run_python, methods=["POST"])
+        app.add_url_rule(f"{prefix}/metrics", f"{self.name}_metrics", metrics_view, methods=["GET"])
+        if "/metrics" not in {rule.rule for rule in app.url_map.iter_rules()}:
+            app.add_url_rule("/metrics", "metrics", metrics_view, methods=["GET"])
+        return run_python
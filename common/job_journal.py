@@ -0,0 +1,154 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+from pathlib import Path
+from threading import Lock
+
+logger = logging.getLogger("JobJournal")
+
+# ================== Checkpoints ==================
+
+# Steps of one payout, in order
+CHECKPOINTS = ["queued", "logged_in", "form_submitted", "otp_entered", "bank_confirmed", "eric_notified"]
+
+# Up to here nothing was sent to the bank: the payout can simply run again
+SAFE_TO_REDO = {"queued", "logged_in"}
+
+# Payload fields not written to disk unless JOURNAL_KEEP_SECRETS=1
+SECRET_FIELDS = {"password", "pin", "scbDigitalTokenPin", "companyId"}
+
+# ================== Job Journal ==================
+
+class JobJournal:
+
+    """
+    Write-ahead journal of the payout jobs (SQLite WAL, one file per bot queue).
+    Every job is written when queued, then every checkpoint it passes, then its final status,
+    so a crash (os._exit, Chrome / Appium dying, power cut) leaves a record of how far each payout got.
+    journal_jobs   one row per job: payload, last checkpoint, status
+    journal_events append-only: job_id, checkpoint, data, time
+    """
+
+    KEEP_SECRETS = os.getenv("JOURNAL_KEEP_SECRETS", "0") == "1"
+    KEEP_DAYS = float(os.getenv("JOURNAL_KEEP_DAYS", "30"))
+
+    def __init__(self, db_path, owner):
+        self.db_path = Path(db_path)
+        self.owner = owner
+        self.lock = Lock()
+
+        self.conn = sqlite3.connect(str(self.db_path), timeout=30, check_same_thread=False, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=FULL")        # a checkpoint must survive a power cut
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS journal_jobs (
+                job_id          TEXT PRIMARY KEY,
+                transaction_id  TEXT NOT NULL,
+                owner           TEXT,
+                payload         TEXT NOT NULL,
+                complete        INTEGER NOT NULL,
+                checkpoint      TEXT NOT NULL,
+                status          TEXT NOT NULL,
+                created_at      REAL NOT NULL,
+                updated_at      REAL NOT NULL
+            )
+        """)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS journal_events (
+                id          INTEGER PRIMARY KEY AUTOINCREMENT,
+                job_id      TEXT NOT NULL,
+                checkpoint  TEXT NOT NULL,
+                data        TEXT,
+                at          REAL NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_journal_jobs_status ON journal_jobs(status, owner)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_journal_events_job ON journal_events(job_id)")
+        self.purge()
+
+    # ================== Write ==================
+
+    # New job (status "queued")
+    def record(self, job_id, transaction_id, payload):
+        complete = self.KEEP_SECRETS or not any(key in payload for key in SECRET_FIELDS)
+        stored = payload if complete else {k: v for k, v in payload.items() if k not in SECRET_FIELDS}
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.execute("BEGIN")
+            self.conn.execute(
+                "INSERT OR REPLACE INTO journal_jobs VALUES (?, ?, ?, ?, ?, 'queued', 'queued', ?, ?)",
+                (job_id, transaction_id, self.owner, json.dumps(stored), int(complete), now, now),
+            )
+            self.conn.execute("INSERT INTO journal_events (job_id, checkpoint, at) VALUES (?, 'queued', ?)", (job_id, now))
+
+    # Checkpoint passed by a running job
+    def checkpoint(self, job_id, step, data=None):
+        if step not in CHECKPOINTS:
+            raise ValueError(f"Unknown checkpoint: {step}")
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.execute("BEGIN")
+            self.conn.execute(
+                "UPDATE journal_jobs SET checkpoint = ?, status = 'running', updated_at = ? WHERE job_id = ?",
+                (step, now, job_id),
+            )
+            self.conn.execute(
+                "INSERT INTO journal_events (job_id, checkpoint, data, at) VALUES (?, ?, ?, ?)",
+                (job_id, step, json.dumps(data) if data else None, now),
+            )
+        logger.info("Job %s checkpoint: %s", job_id, step)
+
+    # Final status: succeeded / failed / needs_review / released
+    def finish(self, job_id, status):
+        with self.lock:
+            self.conn.execute("UPDATE journal_jobs SET status = ?, updated_at = ? WHERE job_id = ?", (status, time.time(), job_id))
+
+    # ================== Read ==================
+
+    # Last checkpoint of a job
+    def last_checkpoint(self, job_id):
+        with self.lock:
+            row = self.conn.execute("SELECT checkpoint FROM journal_jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return row["checkpoint"] if row else None
+
+    # Jobs of this owner not finished (queued or running when the process died), oldest first
+    def unfinished(self):
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT * FROM journal_jobs WHERE owner = ? AND status IN ('queued', 'running') ORDER BY created_at",
+                (self.owner,),
+            ).fetchall()
+        jobs = []
+        for row in rows:
+            job = dict(row)
+            job["payload"] = json.loads(job["payload"])
+            job["complete"] = bool(job["complete"])
+            jobs.append(job)
+        return jobs
+
+    # Checkpoints of one job, for the status API / manual review
+    def events(self, job_id):
+        with self.lock:
+            rows = self.conn.execute("SELECT checkpoint, data, at FROM journal_events WHERE job_id = ? ORDER BY id", (job_id,)).fetchall()
+        return [{"checkpoint": r["checkpoint"], "data": json.loads(r["data"]) if r["data"] else None, "at": r["at"]} for r in rows]
+
+    # ================== Purge ==================
+
+    # Drop finished jobs older than KEEP_DAYS
+    def purge(self):
+        cutoff = time.time() - self.KEEP_DAYS * 86400
+        with self.lock, self.conn:
+            self.conn.execute("BEGIN")
+            self.conn.execute(
+                "DELETE FROM journal_events WHERE job_id IN "
+                "(SELECT job_id FROM journal_jobs WHERE status NOT IN ('queued', 'running') AND updated_at < ?)",
+                (cutoff,),
+            )
+            deleted = self.conn.execute(
+                "DELETE FROM journal_jobs WHERE status NOT IN ('queued', 'running') AND updated_at < ?", (cutoff,)
+            ).rowcount
+        if deleted:
+            logger.info("Journal: purged %s finished jobs older than %s days", deleted, self.KEEP_DAYS)
@@ -0,0 +1,299 @@
+import os
+import re
+import sys
+import time
+import logging
+import requests
+from threading import Condition, Thread
+
+# Repo root on the path when run as a script (python common/otp_broker.py ...)
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")))
+from common.sms_inbox import SmsInbox, SmsInboxError
+
+logger = logging.getLogger("OtpBroker")
+
+# ================== OTP SMS Formats ==================
+
+# bank → (regex, group of the Ref, group of the OTP)
+OTP_PATTERNS = {
+    "ktb": (re.compile(r"\bOTP\s*(?:is|:)?\s*(\d{4,8})\b.*?\bRef\s*(?:No\.?|:)?\s*([A-Z0-9]+)\b", re.IGNORECASE | re.DOTALL), 2, 1),
+    "kma": (re.compile(r"\bRef\s*[:\-]?\s*(\d+)\b.*?\bOTP\s*[:\-]?\s*(\d+)\b", re.IGNORECASE | re.DOTALL), 1, 2),
+    "ttb": (re.compile(r"OTP[:\s]*([0-9]{4,8}).*?\(?ref[:\s]*([A-Z0-9]+)\)?", re.IGNORECASE | re.DOTALL), 2, 1),
+}
+
+
+# (ref, otp) of an SMS text in the format of this bank, None if it is not one
+def parse_otp(bank, text):
+    pattern, ref_group, otp_group = OTP_PATTERNS[bank]
+    match = pattern.search(text or "")
+    if not match:
+        return None
+    return match.group(ref_group).strip().upper(), match.group(otp_group).strip()
+
+# ================== OTP Broker ==================
+
+class OtpBroker:
+
+    """
+    OTP SMS of one phone, indexed by (bank, Ref), with waiters keyed by Ref:
+        otp = OTP.wait("ktb", ref_code, since=JOBS.running_since(time.time()))
+    Several payouts can wait on the same phone at once, each one for its own Ref.
+    Only one inbox query runs at a time (the waiter holding the poll), all waiters
+    are woken as soon as a query indexes new messages.
+    inbox_factory: callable → SmsInbox (called per query, so a new Appium session is picked up).
+    Settings: OTP_TIMEOUT_SECONDS (default 300)
+    """
+
+    TIMEOUT = float(os.getenv("OTP_TIMEOUT_SECONDS", "300"))
+    KEEP_SECONDS = 900          # Refs kept in the index (an OTP is valid a few minutes)
+
+    def __init__(self, inbox_factory):
+        self.inbox_factory = inbox_factory
+        self.cond = Condition()
+        self.index = {}         # (bank, REF) → {"otp", "date", "message_id"}
+        self.seen = set()       # SMS ids already indexed
+        self.waiting = {}       # (bank, REF) → number of waiters
+        self.polling = False
+
+    # Block until the OTP of (bank, ref) received after since (epoch seconds) is indexed
+    def wait(self, bank, ref, since=None, timeout=None):
+        key = (bank, str(ref).strip().upper())
+        since = since or time.time()
+        end = time.time() + (timeout or self.TIMEOUT)
+
+        with self.cond:
+            self.waiting[key] = self.waiting.get(key, 0) + 1
+        try:
+            while True:
+                with self.cond:
+                    hit = self.lookup(bank, ref, since)
+                    if hit is not None:
+                        logger.info("OTP for %s Ref %s ready after %.1fs", bank, key[1], time.time() - since)
+                        return hit
+                    remaining = end - time.time()
+                    if remaining <= 0:
+                        raise TimeoutError(f"OTP not received in time for {bank} Ref={key[1]}")
+                    if self.polling:
+                        # Another waiter is querying the inbox: woken when it is done
+                        self.cond.wait(timeout=min(SmsInbox.POLL, remaining))
+                        continue
+                    self.polling = True
+
+                try:
+                    self.poll(since)
+                finally:
+                    with self.cond:
+                        self.polling = False
+                        self.cond.notify_all()
+
+                with self.cond:
+                    if self.lookup(bank, ref, since) is None:
+                        self.cond.wait(timeout=SmsInbox.POLL)
+        finally:
+            with self.cond:
+                self.waiting[key] -= 1
+                if not self.waiting[key]:
+                    del self.waiting[key]
+
+    # Baseline of the inbox before the OTP page appears (index what is already there, one query)
+    def prime(self, since=None):
+        with self.cond:
+            if self.polling:
+                return 0
+            self.polling = True
+        try:
+            return self.poll(since or time.time())
+        finally:
+            with self.cond:
+                self.polling = False
+                self.cond.notify_all()
+
+    # OTP already indexed for (bank, ref) after since, else None (call with self.cond held or accept a race)
+    def lookup(self, bank, ref, since=0):
+        hit = self.index.get((bank, str(ref).strip().upper()))
+        if hit is None or hit["date"] < since - SmsInbox.CLOCK_SKEW:
+            return None
+        return hit["otp"]
+
+    # One inbox query: index every new OTP SMS for every bank format
+    def poll(self, since):
+        messages = self.inbox_factory().messages(min(since, time.time() - self.KEEP_SECONDS))
+        added = 0
+        with self.cond:
+            for message in reversed(messages):          # oldest first, the newest OTP of a Ref wins
+                if message["id"] in self.seen:
+                    continue
+                self.seen.add(message["id"])
+                for bank in OTP_PATTERNS:
+                    found = parse_otp(bank, message["body"])
+                    if found:
+                        ref, otp = found
+                        self.index[(bank, ref)] = {"otp": otp, "date": message["date"], "message_id": message["id"]}
+                        added += 1
+            self._trim()
+        if added:
+            logger.debug("OTP broker indexed %s new OTP SMS", added)
+        return added
+
+    # Forget Refs older than KEEP_SECONDS
+    def _trim(self):
+        cutoff = time.time() - self.KEEP_SECONDS - SmsInbox.CLOCK_SKEW
+        for key in [key for key, hit in self.index.items() if hit["date"] < cutoff]:
+            del self.index[key]
+        if len(self.seen) > 10000:
+            self.seen = {hit["message_id"] for hit in self.index.values()}
+
+    def stats(self):
+        with self.cond:
+            return {"indexed": len(self.index), "waiting": [f"{bank}:{ref}" for bank, ref in self.waiting]}
+
+# ================== Broker Client ==================
+
+class OtpBrokerClient:
+
+    """
+    Same wait() as OtpBroker, served by the broker server of the phone (OTP_BROKER_URL),
+    when several bot processes share one phone: one inbox poller for all of them.
+    GET {url}/otp/by_ref?bank=&ref=&since=&wait= long-polls until the OTP arrives.
+    """
+
+    TIMEOUT = OtpBroker.TIMEOUT
+    LONG_POLL = 25
+
+    def __init__(self, url):
+        self.url = url.rstrip("/")
+        self.session = requests.Session()
+
+    def wait(self, bank, ref, since=None, timeout=None):
+        since = since or time.time()
+        end = time.time() + (timeout or self.TIMEOUT)
+        while True:
+            remaining = end - time.time()
+            if remaining <= 0:
+                raise TimeoutError(f"OTP not received in time for {bank} Ref={ref}")
+            wait = min(self.LONG_POLL, remaining)
+            try:
+                response = self.session.get(
+                    f"{self.url}/otp/by_ref",
+                    params={"bank": bank, "ref": ref, "since": since, "wait": wait},
+                    timeout=wait + 5,
+                )
+            except requests.RequestException as e:
+                logger.warning("OTP broker not reachable: %s", e)
+                time.sleep(1)
+                continue
+
+            if response.status_code == 200 and response.json().get("otp"):
+                return response.json()["otp"]
+            if response.status_code == 503:
+                raise SmsInboxError(response.json().get("message", "OTP broker inbox query failed"))
+
+    # The broker server keeps its own baseline
+    def prime(self, since=None):
+        return 0
+
+
+# ================== OTP Reader Warm-up ==================
+
+class OtpWarmup:
+
+    """
+    OTP reader set up in a background thread as soon as the payout starts (Appium session,
+    screen timeout, inbox baseline or Messages app), so that only the Ref matching is left
+    on the critical path once the OTP page appears:
+        cls._otp_warmup = OtpWarmup.begin(cls._otp_warmup, cls.ktb_otp_setup)
+        ...
+        if not (cls._otp_warmup and cls._otp_warmup.ready()):     # in read_otp
+            cls.ktb_otp_setup()
+    ready() waits for the setup and returns False when it failed (the reader then sets itself up).
+    A setup still running after the timeout raises TimeoutError instead: a second setup would drive
+    the same Appium session / inbox baseline at the same time. For the same reason begin() keeps a
+    warm-up that is still running rather than starting another one.
+    """
+
+    def __init__(self, setup, timeout=60):
+        self.setup = setup
+        self.timeout = timeout
+        self.error = None
+        self.started_at = None
+        self.thread = Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.started_at = time.time()
+        self.thread.start()
+        return self
+
+    # Warm-up of the next payout: the previous one while it still runs, else a new one
+    @classmethod
+    def begin(cls, previous, setup, timeout=60):
+        if previous is not None and previous.thread.is_alive():
+            logger.info("OTP reader warm-up of the previous payout still running, reusing it")
+            return previous
+        return cls(setup, timeout).start()
+
+    def run(self):
+        try:
+            self.setup()
+            logger.info("OTP reader warmed up in %.1fs", time.time() - self.started_at)
+        except Exception as e:
+            self.error = e
+            logger.warning("OTP reader warm-up failed: %s", e)
+
+    # Block until the warm-up is over, True when the reader is ready (TimeoutError: setup hung, do not set up again)
+    def ready(self):
+        self.thread.join(self.timeout)
+        if self.thread.is_alive():
+            raise TimeoutError(f"OTP reader warm-up still running after {self.timeout}s")
+        return self.error is None
+
+
+# Broker of this bot: shared broker server when OTP_BROKER_URL is set, else in this process
+def create_broker(inbox_factory):
+    url = os.getenv("OTP_BROKER_URL")
+    return OtpBrokerClient(url) if url else OtpBroker(inbox_factory)
+
+# ================== Broker Server ==================
+# python common/otp_broker.py [device_serial] [port]      (adb on PATH)
+
+def create_app(broker):
+    from flask import Flask, request, jsonify
+
+    app = Flask(__name__)
+
+    @app.route("/otp/by_ref", methods=["GET"])
+    def otp_by_ref():
+        bank = request.args.get("bank", "")
+        ref = request.args.get("ref", "")
+        if bank not in OTP_PATTERNS or not ref:
+            return jsonify({"success": False, "message": f"bank must be one of {list(OTP_PATTERNS)} and ref is required"}), 400
+        since = float(request.args.get("since") or time.time() - OtpBroker.KEEP_SECONDS)
+        wait = min(float(request.args.get("wait") or 0), 60)
+        try:
+            otp = broker.lookup(bank, ref, since) if wait <= 0 else broker.wait(bank, ref, since, wait)
+        except TimeoutError:
+            otp = None
+        except SmsInboxError as e:
+            return jsonify({"success": False, "message": str(e)}), 503
+        if otp is None:
+            return jsonify({"bank": bank, "ref": ref, "otp": None}), 404
+        return jsonify({"bank": bank, "ref": ref, "otp": otp})
+
+    @app.route("/otp/stats", methods=["GET"])
+    def otp_stats():
+        return jsonify(broker.stats())
+
+    return app
+
+
+if __name__ == "__main__":
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s | %(levelname)s | %(message)s")
+
+    serial = sys.argv[1] if len(sys.argv) > 1 else os.getenv("DEVICE_SERIAL")
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else 3000
+
+    inbox = SmsInbox(SmsInbox.adb_shell(serial), sender=os.getenv("SMS_SENDER"))
+    broker = OtpBroker(lambda: inbox)
+
+    logger.info("OTP broker of device %s on port %s", serial or "(only attached phone)", port)
+    create_app(broker).run(host="127.0.0.1", port=port, debug=False, threaded=True, use_reloader=False)
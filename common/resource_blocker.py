@@ -0,0 +1,205 @@
+import os
+import time
+import logging
+from threading import Lock
+from urllib.parse import urlsplit
+
+logger = logging.getLogger("ResourceBlocker")
+
+# ================== Blocking Rules ==================
+
+# Resource types the bots never look at
+BLOCK_TYPES = {"image", "media", "font"}
+
+# URL patterns of those types (CDP mode matches URLs, not resource types)
+BLOCK_URL_PATTERNS = [
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.bmp", "*.ico",
+    "*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot",
+    "*.mp4", "*.webm", "*.mp3", "*.ogg",
+]
+
+# Third party analytics / tracking / banner hosts
+BLOCK_HOSTS = [
+    "google-analytics.com", "googletagmanager.com", "doubleclick.net", "googleadservices.com",
+    "googlesyndication.com", "facebook.net", "facebook.com", "connect.facebook.net",
+    "hotjar.com", "clarity.ms", "newrelic.com", "nr-data.net", "appdynamics.com",
+    "dynatrace.com", "adobedtm.com", "omtrdc.net", "demdex.net", "tiktok.com",
+    "line-scdn.net", "youtube.com", "ytimg.com", "fonts.googleapis.com", "fonts.gstatic.com",
+]
+
+# Per bank: portal hosts (first party, never treated as tracker) and URL words never blocked
+# (route mode only, CDP blocking has no exceptions: none of the bots reads an image today)
+PROFILES = {
+    "scb": {"hosts": ["scbbusinessanywhere.com", "scb.co.th"], "allow": []},
+    "kbank": {"hosts": ["kbiz.kasikornbank.com", "kasikornbank.com"], "allow": ["captcha"]},
+    "kma": {"hosts": ["krungsribizonline.com", "krungsri.com"], "allow": ["captcha"]},
+    "ktb": {"hosts": ["business.krungthai.com", "krungthai.com"], "allow": ["captcha"]},
+    "ttb": {"hosts": ["ttbbusinessone.com", "ttbbank.com"], "allow": ["captcha"]},
+}
+
+# Rough size of a blocked request when it was never seen loaded (bytes), for the saving estimate
+DEFAULT_SIZES = {"image": 25000, "media": 400000, "font": 60000, "script": 40000, "other": 5000}
+
+# ================== Resource Blocker ==================
+
+class ResourceBlocker:
+
+    """
+    Block images, fonts, media and third party trackers of a bank portal page.
+    - mode "cdp" (default): Network.setBlockedURLs, no request interception, HTTP cache stays on
+    - mode "route": page.route() on every request, exact resource types, but Chrome disables the cache
+    Every page load is reported: load time, bytes loaded, requests blocked, estimated bytes / time saved.
+    Settings: RESOURCE_BLOCKING=0 (off), RESOURCE_BLOCK_MODE=cdp|route, RESOURCE_BLOCK_HOSTS=a.com,b.com (extra)
+    """
+
+    ENABLED = os.getenv("RESOURCE_BLOCKING", "1") != "0"
+    MODE = os.getenv("RESOURCE_BLOCK_MODE", "cdp").lower()
+    EXTRA_HOSTS = [x.strip() for x in os.getenv("RESOURCE_BLOCK_HOSTS", "").split(",") if x.strip()]
+
+    def __init__(self, bank):
+        profile = PROFILES.get(bank, {"hosts": [], "allow": []})
+        self.bank = bank
+        self.first_party = profile["hosts"]
+        self.allow = [x.lower() for x in profile["allow"]]
+        self.block_hosts = BLOCK_HOSTS + self.EXTRA_HOSTS
+        self.page = None
+        self.cdp = None
+        self.lock = Lock()
+
+        self.request_types = {}     # CDP requestId → resource type
+        self.avg_sizes = {}         # resource type → (count, total bytes) of loaded requests
+        self.load = None            # stats of the page load in progress
+        self.totals = {"loads": 0, "load_ms": 0.0, "bytes": 0, "blocked": 0, "saved_bytes": 0, "saved_ms": 0.0}
+
+    # ================== Rules ==================
+
+    # True if the host is a known tracker (and not the bank portal)
+    def blocked_host(self, host):
+        if any(host == h or host.endswith("." + h) for h in self.first_party):
+            return False
+        return any(host == h or host.endswith("." + h) for h in self.block_hosts)
+
+    # Reason to block this request, or None
+    def block_reason(self, url, resource_type):
+        lower = url.lower()
+        if any(word in lower for word in self.allow):
+            return None
+        if self.blocked_host(urlsplit(lower).hostname or ""):
+            return "third-party"
+        if resource_type in BLOCK_TYPES:
+            return resource_type
+        return None
+
+    # ================== Attach ==================
+
+    # Install the blocking rules and the load report on a page (returns self)
+    def attach(self, page):
+        self.page = page
+        if not self.ENABLED:
+            return self
+
+        page.on("request", self._on_request)
+        page.on("load", self._on_load)
+
+        try:
+            self.cdp = page.context.new_cdp_session(page)
+            self.cdp.send("Network.enable")
+            self.cdp.on("Network.requestWillBeSent", self._on_cdp_request)
+            self.cdp.on("Network.loadingFinished", self._on_cdp_finished)
+            self.cdp.on("Network.loadingFailed", self._on_cdp_failed)
+        except Exception as e:
+            self.cdp = None
+            logger.debug("CDP session not available (%s), using page.route", e)
+
+        if self.MODE == "cdp" and self.cdp is not None:
+            patterns = [p for ext in BLOCK_URL_PATTERNS for p in (ext, ext + "?*")]
+            patterns += [p for host in self.block_hosts for p in (f"*://{host}/*", f"*://*.{host}/*")]
+            self.cdp.send("Network.setBlockedURLs", {"urls": patterns})
+        else:
+            page.route("**/*", self._route)
+
+        logger.info("Resource blocking on (%s, %s mode)", self.bank, "cdp" if self.MODE == "cdp" and self.cdp else "route")
+        return self
+
+    # ================== Handlers ==================
+
+    # page.route mode: abort the non essential requests
+    def _route(self, route, request):
+        reason = self.block_reason(request.url, request.resource_type)
+        if reason is None:
+            route.continue_()
+            return
+        self._blocked(request.resource_type)
+        route.abort("blockedbyclient")
+
+    # A new main frame navigation starts a new page load
+    def _on_request(self, request):
+        try:
+            if request.is_navigation_request() and request.frame == self.page.main_frame:
+                with self.lock:
+                    self.load = {"url": request.url, "started": time.perf_counter(), "bytes": 0, "requests": 0, "blocked": 0, "saved_bytes": 0}
+        except Exception:
+            pass
+
+    def _on_cdp_request(self, params):
+        self.request_types[params["requestId"]] = (params.get("type") or "other").lower()
+
+    def _on_cdp_finished(self, params):
+        resource_type = self.request_types.pop(params["requestId"], "other")
+        size = int(params.get("encodedDataLength") or 0)
+        with self.lock:
+            count, total = self.avg_sizes.get(resource_type, (0, 0))
+            self.avg_sizes[resource_type] = (count + 1, total + size)
+            if self.load is not None:
+                self.load["bytes"] += size
+                self.load["requests"] += 1
+
+    def _on_cdp_failed(self, params):
+        resource_type = self.request_types.pop(params["requestId"], "other")
+        if params.get("blockedReason") == "inspector":
+            self._blocked(resource_type)
+
+    # Count one blocked request and its estimated size
+    def _blocked(self, resource_type):
+        with self.lock:
+            count, total = self.avg_sizes.get(resource_type, (0, 0))
+            size = total / count if count else DEFAULT_SIZES.get(resource_type, DEFAULT_SIZES["other"])
+            if self.load is not None:
+                self.load["blocked"] += 1
+                self.load["saved_bytes"] += size
+
+    # Page "load" event: report this page load
+    def _on_load(self, *_):
+        with self.lock:
+            load, self.load = self.load, None
+        if load is None:
+            return
+
+        load_ms = (time.perf_counter() - load["started"]) * 1000
+
+        # Time saved estimated from the throughput of this load
+        throughput = load["bytes"] / load_ms if load_ms and load["bytes"] else 0
+        saved_ms = load["saved_bytes"] / throughput if throughput else 0.0
+
+        with self.lock:
+            self.totals["loads"] += 1
+            self.totals["load_ms"] += load_ms
+            self.totals["bytes"] += load["bytes"]
+            self.totals["blocked"] += load["blocked"]
+            self.totals["saved_bytes"] += load["saved_bytes"]
+            self.totals["saved_ms"] += saved_ms
+
+        logger.info(
+            "Page load %s: %.0f ms, %s requests %.0f KB, blocked %s (~%.0f KB, ~%.0f ms saved)",
+            load["url"], load_ms, load["requests"], load["bytes"] / 1024, load["blocked"], load["saved_bytes"] / 1024, saved_ms,
+        )
+
+    # ================== Report ==================
+
+    # Totals since attach
+    def stats(self):
+        with self.lock:
+            totals = dict(self.totals)
+        loads = totals["loads"] or 1
+        totals["avg_load_ms"] = totals["load_ms"] / loads
+        return totals
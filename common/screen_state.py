@@ -0,0 +1,56 @@
+import logging
+import xml.etree.ElementTree as ET
+
+logger = logging.getLogger("ScreenState")
+
+# ================== Screen Classifier ==================
+
+class ScreenClassifier:
+
+    """
+    Which screen of a bank app is shown, from ONE driver.page_source round trip
+    instead of one find_elements / WebDriverWait per candidate screen.
+        SCREENS = ScreenClassifier({
+            "session_expired": [("content-desc", "~", "session has expired")],
+            "enter_pin":       [("content-desc", "=", "Enter PIN")],
+        })
+        screen = SCREENS.classify(driver)               # "session_expired" / "enter_pin" / None
+        screen = WAIT.until("app_screen", lambda: SCREENS.classify(driver), timeout=120)
+    Signatures: name → list of (attribute, "=" exact / "~" contains, text), any of them matches.
+    Order of the names is the priority when several match (popups first).
+    Elements with displayed="false" are ignored.
+    """
+
+    def __init__(self, screens):
+        self.names = list(screens)
+        self.rules = [(name, attribute, op == "=", text) for name, signatures in screens.items() for attribute, op, text in signatures]
+        self.attributes = {attribute for _, attribute, _, _ in self.rules}
+
+    # Names of all screens matching the XML page source, in priority order (one pass over the tree)
+    def match(self, page_source):
+        try:
+            root = ET.fromstring(page_source.encode("utf-8") if isinstance(page_source, str) else page_source)
+        except ET.ParseError as e:
+            logger.debug("Page source not parsed: %s", e)
+            return []
+
+        found = set()
+        rules = self.rules
+        for element in root.iter():
+            attrib = element.attrib
+            if attrib.get("displayed") == "false":
+                continue
+            for name, attribute, exact, text in rules:
+                if name in found:
+                    continue
+                value = attrib.get(attribute)
+                if value and (value == text if exact else text in value):
+                    found.add(name)
+            if len(found) == len(self.names):
+                break
+        return [name for name in self.names if name in found]
+
+    # Highest priority screen shown on the device (None when no signature matches)
+    def classify(self, driver):
+        matched = self.match(driver.page_source)
+        return matched[0] if matched else None
@@ -0,0 +1,120 @@
+import os
+import sys
+import json
+import time
+import logging
+from pathlib import Path
+
+from common.step_metrics import METRICS
+
+logger = logging.getLogger("SessionState")
+
+# ================== Session State ==================
+
+class SessionState:
+
+    """
+    Authenticated Playwright storage state (cookies + localStorage) of a bank portal in an encrypted file
+    next to the bot (<name>_session.bin), restored after a Chrome restart instead of a full login:
+        SESSION = SessionState(BANK)
+        if not SESSION.restore(CONTEXT, page, "https://portal/", probe=lambda: ... logged-in page shown ...):
+            ... full login ...
+            SESSION.save(CONTEXT)
+        SESSION.clear()         # on logout (the saved state must not bring the session back)
+    restore() adds the cookies, opens url, puts back the localStorage of that origin and runs the probe
+    (a short race "logged in" vs "login form"); a failed probe deletes the file and the bot logs in as usual.
+    Every restore is recorded as step "session_restore", outcome "ok" / "failed" (GET /metrics).
+    Settings: SESSION_STATE_KEY (Fernet key, off when not set; python -c "from cryptography.fernet import Fernet; print(Fernet.generate_key().decode())"),
+    SESSION_STATE_MAX_AGE_SECONDS (older files are not restored, default 3600). Needs the cryptography package.
+    """
+
+    KEY = os.getenv("SESSION_STATE_KEY", "")
+    MAX_AGE = int(os.getenv("SESSION_STATE_MAX_AGE_SECONDS", "3600"))
+
+    def __init__(self, name, state_dir=None):
+        self.name = name
+        state_dir = state_dir or os.path.dirname(os.path.abspath(getattr(sys.modules["__main__"], "__file__", "") or "."))
+        self.path = Path(state_dir) / f"{name}_session.bin"
+        self.fernet = self._fernet()
+
+    # Fernet of SESSION_STATE_KEY, None (disabled) without a key or without the cryptography package
+    def _fernet(self):
+        if not self.KEY:
+            return None
+        try:
+            from cryptography.fernet import Fernet
+            return Fernet(self.KEY.encode())
+        except ImportError:
+            logger.warning("SESSION_STATE_KEY is set but the cryptography package is missing, session state disabled")
+        except ValueError:
+            logger.warning("SESSION_STATE_KEY is not a valid Fernet key, session state disabled")
+        return None
+
+    @property
+    def enabled(self):
+        return self.fernet is not None
+
+    # ================== Save / Load ==================
+
+    # Snapshot the storage state of the logged-in context
+    def save(self, context):
+        if not self.enabled:
+            return
+        try:
+            token = self.fernet.encrypt(json.dumps(context.storage_state()).encode("utf-8"))
+            tmp = self.path.with_suffix(".tmp")
+            tmp.write_bytes(token)
+            os.chmod(tmp, 0o600)
+            os.replace(tmp, self.path)
+            logger.info("Session state of %s saved", self.name)
+        except Exception as e:
+            logger.warning("Session state of %s not saved: %s", self.name, e)
+
+    # Storage state of the file, None when missing / too old / not readable with this key
+    def load(self):
+        if not self.enabled or not self.path.exists():
+            return None
+        try:
+            return json.loads(self.fernet.decrypt(self.path.read_bytes(), ttl=self.MAX_AGE))
+        except Exception as e:
+            logger.info("Session state of %s not usable (%s), full login", self.name, type(e).__name__)
+            self.clear()
+            return None
+
+    def clear(self):
+        try:
+            self.path.unlink()
+        except FileNotFoundError:
+            pass
+
+    # ================== Restore ==================
+
+    # Put the saved state back into the context, open url and check it with probe(): True = logged in
+    def restore(self, context, page, url, probe):
+        state = self.load()
+        if state is None:
+            return False
+
+        started = time.time()
+        try:
+            context.add_cookies(state.get("cookies", []))
+            page.goto(url, wait_until="domcontentloaded")
+
+            # localStorage of this origin (set on the page, then reload so the portal reads it at start)
+            origin = page.evaluate("location.origin")
+            items = next((item.get("localStorage", []) for item in state.get("origins", []) if item.get("origin") == origin), [])
+            if items:
+                page.evaluate("items => items.forEach(item => localStorage.setItem(item.name, item.value))", items)
+                page.reload(wait_until="domcontentloaded")
+
+            restored = bool(probe())
+        except Exception as e:
+            logger.warning("Session state of %s not restored: %s", self.name, e)
+            restored = False
+
+        METRICS.observe(self.name, "session_restore", "ok" if restored else "failed", time.time() - started)
+        if restored:
+            logger.info("Session of %s restored in %.1fs, login skipped", self.name, time.time() - started)
+        else:
+            self.clear()
+        return restored
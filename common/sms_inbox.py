@@ -0,0 +1,100 @@
+import os
+import re
+import time
+import logging
+import subprocess
+
+logger = logging.getLogger("SmsInbox")
+
+# ================== SMS Inbox ==================
+
+class SmsInboxError(RuntimeError):
+    pass
+
+
+class SmsInbox:
+
+    """
+    OTP SMS read from the phone's SMS content provider over adb shell,
+    instead of scraping every message bubble of the Messages app UI:
+        content query --uri content://sms/inbox --where "date>... AND address LIKE '%sender%'"
+    One shell round trip returns only the messages of the time window (newest first),
+    however long the conversation is. The ref / OTP regex of each bot stays the same.
+        inbox = SmsInbox(SmsInbox.appium_shell(driver), sender=os.getenv("SMS_SENDER"))
+        for text in inbox.texts(since=JOBS.running_since(time.time())):
+            ...
+    shell: callable(args list) → output text (Appium "mobile: shell" needs --allow-insecure uiautomator2:adb_shell).
+    Settings: SMS_SOURCE=ui (use the Messages app UI), SMS_CLOCK_SKEW_SECONDS (phone vs PC clock, default 60).
+    """
+
+    ENABLED = os.getenv("SMS_SOURCE", "provider") != "ui"
+    CLOCK_SKEW = float(os.getenv("SMS_CLOCK_SKEW_SECONDS", "60"))
+    POLL = 0.5                  # seconds between two queries while waiting for the SMS
+
+    ROW = re.compile(r"_id=(\d+), address=(.*?), date=(\d+), body=(.*)", re.DOTALL)
+
+    def __init__(self, shell, sender=None):
+        self.shell = shell
+        # Only letters / digits / spaces / + in the LIKE pattern (it goes through the device shell)
+        self.sender = re.sub(r"[^A-Za-z0-9 +]", "", sender or "") or None
+
+    # ================== Shells ==================
+
+    # adb shell through the Appium UiAutomator2 driver
+    @staticmethod
+    def appium_shell(driver):
+        return lambda args: driver.execute_script("mobile: shell", {"command": args[0], "args": args[1:]})
+
+    # adb shell through an Airtest device
+    @staticmethod
+    def airtest_shell(device):
+        return lambda args: device.adb.shell(args)
+
+    # adb shell of a device serial (adb on PATH), e.g. the OTP broker server of a phone
+    @staticmethod
+    def adb_shell(serial=None):
+        device = ["-s", serial] if serial else []
+        return lambda args: subprocess.run(["adb", *device, "shell", *args], capture_output=True, text=True, timeout=15).stdout
+
+    # ================== Query ==================
+
+    # Messages received after since (epoch seconds), newest first: [{"id", "address", "date", "body"}]
+    def messages(self, since):
+        since_ms = int((since - self.CLOCK_SKEW) * 1000)
+        where = f"date>{since_ms}"
+        if self.sender:
+            where += f" AND address LIKE '%{self.sender}%'"
+
+        # adb joins the args into one device shell command line: quote the ones with spaces / > / %
+        output = self.shell([
+            "content", "query",
+            "--uri", "content://sms/inbox",
+            "--projection", "_id:address:date:body",
+            "--where", f'"{where}"',
+            "--sort", '"date DESC"',
+        ]) or ""
+
+        # "Row: ..." lines, "No result found." or an error (Permission Denial, unknown URI, ...)
+        text = output.strip()
+        if text and not text.startswith("Row:") and not text.startswith("No result"):
+            raise SmsInboxError(text.splitlines()[0])
+        return self.parse(output)
+
+    # Bodies only, newest first (what the bots' regex reads)
+    def texts(self, since):
+        return [message["body"].strip() for message in self.messages(since) if message["body"].strip()]
+
+    # "Row: 0 _id=1, address=..., date=..., body=..." lines (a body may span lines)
+    @classmethod
+    def parse(cls, output):
+        messages = []
+        for row in re.split(r"(?m)^Row: \d+ ", output)[1:]:
+            match = cls.ROW.match(row.rstrip("\r\n"))
+            if match:
+                messages.append({
+                    "id": int(match.group(1)),
+                    "address": match.group(2),
+                    "date": int(match.group(3)) / 1000,
+                    "body": match.group(4),
+                })
+        return messages
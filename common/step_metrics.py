@@ -0,0 +1,115 @@
+import time
+import logging
+import functools
+from bisect import bisect_left
+from threading import Lock
+
+logger = logging.getLogger("StepMetrics")
+
+# ================== Histogram Buckets ==================
+
+# Step durations in seconds: a click is ~50 ms, an app approval or an OTP SMS can take minutes
+BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+
+# ================== Step Metrics ==================
+
+class StepMetrics:
+
+    """
+    Latency histograms per (bank, step, outcome), outcome = "ok" or the exception type.
+    Fed by step() / timed() around the payout steps, read by /metrics (Prometheus text format).
+    One observe = a bisect and a few adds under a lock (a few microseconds).
+    """
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = tuple(buckets)
+        self.lock = Lock()
+        self.series = {}        # (bank, step, outcome) → [bucket counts..., +Inf count, sum]
+
+    # Add one duration (seconds)
+    def observe(self, bank, step, outcome, seconds):
+        key = (bank, step, outcome)
+        index = bisect_left(self.buckets, seconds)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += seconds
+
+    # Count / total seconds per (bank, step), slowest first, for logs and quick checks
+    def summary(self):
+        with self.lock:
+            items = [(key, sum(series[:-1]), series[-1]) for key, series in self.series.items()]
+        totals = {}
+        for (bank, step, _), count, total in items:
+            count_sum, time_sum = totals.get((bank, step), (0, 0.0))
+            totals[(bank, step)] = (count_sum + count, time_sum + total)
+        return sorted(((bank, step, count, total) for (bank, step), (count, total) in totals.items()), key=lambda x: -x[3])
+
+    # Prometheus text exposition format
+    def render(self):
+        with self.lock:
+            items = sorted((key, list(series)) for key, series in self.series.items())
+
+        lines = [
+            "# HELP payout_step_seconds Duration of one payout step",
+            "# TYPE payout_step_seconds histogram",
+        ]
+        for (bank, step, outcome), series in items:
+            labels = f'bank="{_escape(bank)}",step="{_escape(step)}",outcome="{_escape(outcome)}"'
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f'payout_step_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            cumulative += series[len(self.buckets)]
+            lines.append(f'payout_step_seconds_bucket{{{labels},le="+Inf"}} {cumulative}')
+            lines.append(f"payout_step_seconds_sum{{{labels}}} {series[-1]:.6f}")
+            lines.append(f"payout_step_seconds_count{{{labels}}} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# Metrics of this process
+METRICS = StepMetrics()
+
+# ================== Step Timing API ==================
+
+class step:
+
+    """
+    Time one named step:
+        with step("scb_company_web", "click_submit"):
+            page.locator(...).click()
+    An exception is recorded with its type as outcome and raised again.
+    """
+
+    __slots__ = ("bank", "name", "started")
+
+    def __init__(self, bank, name):
+        self.bank = bank
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        METRICS.observe(self.bank, self.name, "ok" if exc_type is None else exc_type.__name__, time.perf_counter() - self.started)
+        return False
+
+
+# Decorator: time every call of a function as one step (default name = function name)
+def timed(bank, name=None):
+    def decorator(func):
+        step_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with step(bank, step_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,181 @@
+import os
+import time
+import logging
+
+from common.step_metrics import METRICS
+
+logger = logging.getLogger("WaitEngine")
+
+# ================== Deadline Overrides ==================
+
+# WAIT_DEADLINES="value_date_ready=3,ktb_company_web.otp_ref_ready=8" (seconds, name or bank.name)
+def _load_overrides():
+    overrides = {}
+    for item in os.getenv("WAIT_DEADLINES", "").split(","):
+        if "=" in item:
+            name, seconds = item.split("=", 1)
+            try:
+                overrides[name.strip()] = float(seconds)
+            except ValueError:
+                logger.warning("WAIT_DEADLINES: bad value for %s", name)
+    return overrides
+
+# ================== Wait Engine ==================
+
+class WaitEngine:
+
+    """
+    Replace fixed sleeps with a named readiness condition and a deadline:
+        WAIT.visible("value_date_ready", page.locator("..."), timeout=5)
+        WAIT.element("confirm_ready", driver, AppiumBy.ACCESSIBILITY_ID, "Confirm", timeout=10, clickable=True)
+        WAIT.until("pin_pad_ready", lambda: driver.find_elements(...), timeout=5)
+        WAIT.first("login_page", {"logout_popup": page.locator("..."), "username": page.locator("...")}, timeout=60)
+    Returns as soon as the condition holds. Every wait is recorded in the step histograms
+    as step "wait_<name>", outcome "ok" / "timeout" (first(): the state seen / "none") (GET /metrics),
+    so the deadlines can be tuned from real data.
+    On deadline the flow goes on like after the old sleep (required=True raises TimeoutError instead).
+    """
+
+    POLL = float(os.getenv("WAIT_POLL_SECONDS", "0.05"))
+    OVERRIDES = _load_overrides()
+
+    def __init__(self, bank):
+        self.bank = bank
+
+    # Deadline of a wait: WAIT_DEADLINES override or the default of the call
+    def deadline(self, name, default):
+        return self.OVERRIDES.get(f"{self.bank}.{name}", self.OVERRIDES.get(name, default))
+
+    # ================== Generic ==================
+
+    # Poll condition() until it returns something true or the deadline passes
+    def until(self, name, condition, timeout, required=False, poll=None):
+        timeout = self.deadline(name, timeout)
+        poll = poll or self.POLL
+        started = time.perf_counter()
+        end = started + timeout
+
+        while True:
+            try:
+                value = condition()
+            except Exception:
+                value = None            # stale element / page navigating: not ready yet
+            if value:
+                outcome = "ok"
+                break
+            if time.perf_counter() >= end:
+                outcome = "timeout"
+                break
+            time.sleep(poll)
+
+        elapsed = time.perf_counter() - started
+        METRICS.observe(self.bank, f"wait_{name}", outcome, elapsed)
+
+        if outcome == "timeout":
+            if required:
+                raise TimeoutError(f"Wait '{name}' not ready after {timeout}s")
+            logger.info("Wait %s: not ready after %.1fs, continue", name, elapsed)
+        else:
+            logger.debug("Wait %s: ready in %.0f ms", name, elapsed * 1000)
+        return value
+
+    # ================== Playwright ==================
+
+    # Locator visible
+    def visible(self, name, locator, timeout, required=False):
+        return self.until(name, lambda: locator.first.is_visible(), timeout, required)
+
+    # Locator gone (spinner, backdrop, dialog)
+    def hidden(self, name, locator, timeout, required=False):
+        return self.until(name, lambda: locator.first.is_hidden(), timeout, required)
+
+    # Locator visible and enabled (button after form validation)
+    def enabled(self, name, locator, timeout, required=False):
+        return self.until(name, lambda: locator.first.is_visible() and locator.first.is_enabled(), timeout, required)
+
+    # Locator visible and not moving any more (dropdown / dialog animation done)
+    def stable(self, name, locator, timeout, required=False):
+        last = {"box": None}
+
+        def settled():
+            box = locator.first.bounding_box() if locator.first.is_visible() else None
+            same = box is not None and box == last["box"]
+            last["box"] = box
+            return same
+
+        return self.until(name, settled, timeout, required)
+
+    # Input holds the expected value (Angular / masked inputs reformat after fill)
+    def value(self, name, locator, expected, timeout, required=False):
+        return self.until(name, lambda: locator.first.input_value() != "" and (expected is None or locator.first.input_value() == expected), timeout, required)
+
+    # ================== State Race ==================
+
+    # Wait for the first of several page states {"name": locator} to be visible, return its name (None on deadline, outcome "none").
+    # One browser-side wait for all of them (locator.or_), no sequential probe timeouts;
+    # when several are visible the first name in states wins (list popups before the normal page).
+    def first(self, name, states, timeout, required=False):
+        timeout = self.deadline(name, timeout)
+        started = time.perf_counter()
+        end = started + timeout
+
+        any_state = None
+        for locator in states.values():
+            any_state = locator if any_state is None else any_state.or_(locator)
+
+        # timeout=0 checks once (popup probe of a poll loop)
+        state = None
+        while True:
+            try:
+                any_state.locator("visible=true").first.wait_for(state="visible", timeout=max((end - time.perf_counter()) * 1000, 1))
+            except Exception as e:
+                if type(e).__name__ != "TimeoutError":      # Playwright TimeoutError, without importing Playwright here
+                    raise
+                break
+            # Element may be gone again (re-render): keep waiting
+            state = next((key for key, locator in states.items() if locator.locator("visible=true").count()), None)
+            if state is not None or time.perf_counter() >= end:
+                break
+
+        elapsed = time.perf_counter() - started
+        METRICS.observe(self.bank, f"wait_{name}", state or "none", elapsed)
+
+        if state is None:
+            if required:
+                raise TimeoutError(f"Wait '{name}': none of {list(states)} after {timeout}s")
+            logger.debug("Wait %s: none of %s after %.1fs", name, list(states), elapsed)
+        else:
+            logger.debug("Wait %s: %s in %.0f ms", name, state, elapsed * 1000)
+        return state
+
+    # ================== Appium ==================
+
+    # Element displayed (and enabled when clickable=True), returns the element
+    def element(self, name, driver, by, value, timeout, clickable=False, required=False):
+        def ready():
+            for element in driver.find_elements(by, value):
+                if element.is_displayed() and (not clickable or element.is_enabled()):
+                    return element
+            return None
+
+        return self.until(name, ready, timeout, required)
+
+    # Element not moving any more (slide-in / scroll animation done), returns the element
+    def settled(self, name, element, timeout, required=False):
+        last = {"rect": None}
+
+        def done():
+            rect = element.rect if element.is_displayed() else None
+            same = rect is not None and rect == last["rect"]
+            last["rect"] = rect
+            return element if same else None
+
+        return self.until(name, done, timeout, required)
+
+    # Element gone
+    def gone(self, name, driver, by, value, timeout, required=False):
+        return self.until(name, lambda: not any(e.is_displayed() for e in driver.find_elements(by, value)), timeout, required)
+
+    # Keyboard closed after typing
+    def keyboard_hidden(self, name, driver, timeout, required=False):
+        return self.until(name, lambda: not driver.is_keyboard_shown(), timeout, required)
@@ -0,0 +1,467 @@
+import os
+import sys
+import json
+import time
+import uuid
+import sqlite3
+import logging
+import requests
+import threading
+from pathlib import Path
+from threading import Lock
+from collections import deque
+
+# Repo root on the path when run as a script (python common/worker_pool.py ...)
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")))
+from common.job_journal import SECRET_FIELDS
+
+logger = logging.getLogger("WorkerPool")
+
+# ================== Worker Settings ==================
+
+class WorkerSettings:
+
+    """
+    One payout bot process = one worker, owning one tuple of
+    (Chrome profile, CDP port, Android device serial, Appium port, Flask port).
+    Values come from the environment (or the bot .env), read when used so load_dotenv() in the bot applies:
+    WORKER_NAME, CHROME_PROFILE, CDP_PORT, DEVICE_SERIAL, APPIUM_PORT, APPIUM_SYSTEM_PORT, FLASK_PORT
+    Nothing set = the old single worker (CDP 9222, Appium 8021, the only attached phone).
+    """
+
+    @property
+    def name(self):
+        return os.getenv("WORKER_NAME") or f"worker-{self.cdp_port}-{self.appium_port}"
+
+    @property
+    def chrome_profile(self):
+        return os.getenv("CHROME_PROFILE") or None
+
+    @property
+    def cdp_port(self):
+        return int(os.getenv("CDP_PORT", "9222"))
+
+    @property
+    def cdp_url(self):
+        return f"http://localhost:{self.cdp_port}"
+
+    @property
+    def device_serial(self):
+        return os.getenv("DEVICE_SERIAL") or None
+
+    @property
+    def appium_port(self):
+        return int(os.getenv("APPIUM_PORT", "8021"))
+
+    @property
+    def appium_url(self):
+        return f"http://127.0.0.1:{self.appium_port}"
+
+    # UiAutomator2 server port on the PC, must differ per device when several phones share one PC
+    @property
+    def system_port(self):
+        return int(os.getenv("APPIUM_SYSTEM_PORT", "8200"))
+
+    # Flask port of this worker (default = the bot's usual port)
+    def flask_port(self, default):
+        return int(os.getenv("FLASK_PORT") or default)
+
+    # Pin the Appium session to this worker's phone
+    def apply_device(self, options):
+        if self.device_serial:
+            options.udid = self.device_serial
+            options.set_capability("appium:systemPort", self.system_port)
+        return options
+
+
+# Settings of this process
+WORKER = WorkerSettings()
+
+# ================== Scheduler ==================
+
+class PoolWorker:
+
+    def __init__(self, config):
+        self.name = config["name"]
+        self.bank = config["bank"]                              # job API name, e.g. "kbank_company_web"
+        self.url = config["url"].rstrip("/")                    # e.g. http://127.0.0.1:5004/kbank_company_web
+        self.account_field = config.get("account_field", "username")
+        self.accounts = {str(x) for x in config.get("accounts", [])}   # empty = any account
+        self.job = None                                         # scheduler job running on this worker
+        self.remote_id = None                                   # job id on the worker
+        self.down_until = 0
+        self.completed = 0
+
+    # True if this worker can run a payout of this account
+    def holds(self, data):
+        return not self.accounts or str(data.get(self.account_field)) in self.accounts
+
+    def idle(self):
+        return self.job is None and time.time() >= self.down_until
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "bank": self.bank,
+            "url": self.url,
+            "accounts": sorted(self.accounts),
+            "busy": self.job.id if self.job else None,
+            "down": time.time() < self.down_until,
+            "completed": self.completed,
+        }
+
+
+class PoolJob:
+
+    def __init__(self, bank, data):
+        self.id = uuid.uuid4().hex
+        self.bank = bank
+        self.data = dict(data)
+        self.callback_url = self.data.pop("callbackUrl", None)
+        self.transaction_id = str(data.get("transactionId", "unknown"))
+        self.status = "queued"
+        self.worker = None
+        self.remote_id = None
+        self.result = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self.done = threading.Event()
+
+    # Job read back from the scheduler store
+    @classmethod
+    def from_row(cls, row):
+        job = cls(row["bank"], json.loads(row["payload"]))
+        job.id = row["job_id"]
+        job.callback_url = row["callback_url"]
+        job.transaction_id = row["transaction_id"]
+        job.status = row["status"]
+        job.worker = row["worker"]
+        job.remote_id = row["remote_id"]
+        job.result = json.loads(row["result"]) if row["result"] else None
+        job.created_at = row["created_at"]
+        job.finished_at = row["finished_at"]
+        if job.finished_at:
+            job.done.set()
+        return job
+
+    def to_dict(self):
+        return {
+            "jobId": self.id,
+            "bank": self.bank,
+            "transactionId": self.transaction_id,
+            "status": self.status,
+            "worker": self.worker,
+            "result": self.result,
+            "createdAt": self.created_at,
+            "finishedAt": self.finished_at,
+        }
+
+
+class SchedulerStore:
+
+    """
+    Pool jobs on disk (SQLite WAL), so a restarted scheduler keeps its queue and the jobs it forwarded.
+    One row per job, written when queued, when forwarded to a worker (worker + remote job id) and when finished.
+    Secrets are left out of the payload like in the job journal (JOURNAL_KEEP_SECRETS=1 keeps them):
+    a queued job restored without them cannot be forwarded and fails with "send again".
+    """
+
+    KEEP_SECRETS = os.getenv("JOURNAL_KEEP_SECRETS", "0") == "1"
+
+    def __init__(self, db_path):
+        self.db_path = Path(db_path)
+        self.lock = Lock()
+
+        self.conn = sqlite3.connect(str(self.db_path), timeout=30, check_same_thread=False, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=FULL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS pool_jobs (
+                job_id          TEXT PRIMARY KEY,
+                bank            TEXT NOT NULL,
+                transaction_id  TEXT NOT NULL,
+                payload         TEXT NOT NULL,
+                complete        INTEGER NOT NULL,
+                callback_url    TEXT,
+                status          TEXT NOT NULL,
+                worker          TEXT,
+                remote_id       TEXT,
+                result          TEXT,
+                created_at      REAL NOT NULL,
+                finished_at     REAL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_pool_jobs_status ON pool_jobs(status, created_at)")
+
+    # New job (status "queued")
+    def record(self, job):
+        complete = self.KEEP_SECRETS or not any(key in job.data for key in SECRET_FIELDS)
+        stored = job.data if complete else {k: v for k, v in job.data.items() if k not in SECRET_FIELDS}
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO pool_jobs VALUES (?, ?, ?, ?, ?, ?, 'queued', NULL, NULL, NULL, ?, NULL)",
+                (job.id, job.bank, job.transaction_id, json.dumps(stored), int(complete), job.callback_url, job.created_at),
+            )
+
+    # Job status / worker / result changed
+    def update(self, job):
+        with self.lock:
+            self.conn.execute(
+                "UPDATE pool_jobs SET status = ?, worker = ?, remote_id = ?, result = ?, finished_at = ? WHERE job_id = ?",
+                (job.status, job.worker, job.remote_id, json.dumps(job.result) if job.result is not None else None, job.finished_at, job.id),
+            )
+
+    # Jobs not finished (queued or running) plus the last `keep` finished ones, oldest first
+    def load(self, keep):
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT * FROM pool_jobs WHERE finished_at IS NULL "
+                "UNION ALL SELECT * FROM (SELECT * FROM pool_jobs WHERE finished_at IS NOT NULL ORDER BY finished_at DESC LIMIT ?) "
+                "ORDER BY created_at",
+                (keep,),
+            ).fetchall()
+        return [(PoolJob.from_row(row), bool(row["complete"])) for row in rows]
+
+    # Drop finished jobs beyond the last `keep`
+    def trim(self, keep):
+        with self.lock:
+            self.conn.execute(
+                "DELETE FROM pool_jobs WHERE finished_at IS NOT NULL AND job_id NOT IN "
+                "(SELECT job_id FROM pool_jobs WHERE finished_at IS NOT NULL ORDER BY finished_at DESC LIMIT ?)",
+                (keep,),
+            )
+
+
+class PayoutScheduler:
+
+    """
+    Route each payout to an idle worker of the right bank that holds the account.
+    Jobs wait in a FIFO per bank until such a worker is free, so throughput grows with the phones attached.
+    Workers are the bot processes (job API of common/job_api.py), listed in workers.json:
+    [{"name": "kbank-1", "bank": "kbank_company_web", "url": "http://127.0.0.1:5004/kbank_company_web", "accounts": ["user1"]}]
+    Queue and forwarded jobs are kept in a SchedulerStore (db_path, default payout_scheduler.db next to workers.json):
+    after a restart queued jobs are dispatched again and running ones polled on the worker they were sent to.
+    A job forwarded just before a crash is sent again, the worker answers it with the job it already has.
+    """
+
+    POLL_SECONDS = 1.0
+    DOWN_SECONDS = 30
+    REQUEST_TIMEOUT = (3.05, 10)
+    KEEP_FINISHED = 1000
+
+    def __init__(self, workers, db_path="payout_scheduler.db"):
+        self.workers = [PoolWorker(w) for w in workers]
+        self.pending = deque()
+        self.jobs = {}
+        self.lock = Lock()
+        self.wakeup = threading.Event()
+        self.session = requests.Session()
+        self.store = SchedulerStore(db_path)
+
+        self._recover()
+        threading.Thread(target=self._run, name="payout-scheduler", daemon=True).start()
+
+    # Load the jobs of the store: queued back in the FIFO, running back on their worker
+    def _recover(self):
+        by_name = {w.name: w for w in self.workers}
+        for job, complete in self.store.load(self.KEEP_FINISHED):
+            self.jobs[job.id] = job
+            if job.done.is_set():
+                continue
+
+            if job.status == "queued":
+                if complete:
+                    self.pending.append(job)
+                else:
+                    self._finish(job, None, "failed", {"success": False, "transactionId": job.transaction_id, "message": "Scheduler restarted before dispatch, send again"})
+                continue
+
+            worker = by_name.get(job.worker)
+            if worker is None or worker.job is not None or not job.remote_id:
+                # worker gone from workers.json: its own journal reconciles the payout
+                self._finish(job, worker, "unknown", None)
+                continue
+            worker.job = job
+            worker.remote_id = job.remote_id
+
+        pending = len(self.pending)
+        running = sum(1 for w in self.workers if w.job)
+        if pending or running:
+            logger.info("Scheduler recovered %s queued and %s running jobs", pending, running)
+
+    # ================== Submit ==================
+
+    def submit(self, bank, data):
+        job = PoolJob(bank, data)
+        self.store.record(job)
+        with self.lock:
+            self.jobs[job.id] = job
+            self.pending.append(job)
+            self._trim()
+        self.wakeup.set()
+        logger.info("Pool job %s queued. bank=%s txn_id=%s pending=%s", job.id, bank, job.transaction_id, len(self.pending))
+        return job
+
+    def _trim(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.done.is_set()]
+        for job_id in finished[:max(0, len(finished) - self.KEEP_FINISHED)]:
+            del self.jobs[job_id]
+        if len(finished) > self.KEEP_FINISHED:
+            self.store.trim(self.KEEP_FINISHED)
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def stats(self):
+        with self.lock:
+            pending = {}
+            for job in self.pending:
+                pending[job.bank] = pending.get(job.bank, 0) + 1
+            return {"pending": pending, "workers": [w.to_dict() for w in self.workers]}
+
+    # ================== Loop ==================
+
+    def _run(self):
+        while True:
+            try:
+                self._dispatch()
+                self._poll()
+            except Exception:
+                logger.exception("Scheduler loop error")
+            self.wakeup.wait(self.POLL_SECONDS)
+            self.wakeup.clear()
+
+    # Give every pending job (FIFO) to an idle worker holding its account
+    def _dispatch(self):
+        with self.lock:
+            waiting = list(self.pending)
+
+        for job in waiting:
+            worker = next((w for w in self.workers if w.bank == job.bank and w.idle() and w.holds(job.data)), None)
+            if worker is None:
+                continue
+            if self._forward(job, worker):
+                with self.lock:
+                    self.pending.remove(job)
+
+    # Send the job to the worker's job API
+    def _forward(self, job, worker):
+        try:
+            response = self.session.post(f"{worker.url}/jobs", json=job.data, timeout=self.REQUEST_TIMEOUT)
+        except Exception as e:
+            logger.warning("Worker %s unreachable, down for %ss: %s", worker.name, self.DOWN_SECONDS, e)
+            worker.down_until = time.time() + self.DOWN_SECONDS
+            return False
+
+        # Invalid payload: the job fails, no other worker would accept it
+        if response.status_code == 400:
+            self._finish(job, worker, "failed", response.json())
+            return True
+
+        # Answered from the worker's idempotency store: already paid (200) or running elsewhere / interrupted (409)
+        if response.status_code in (200, 409):
+            remote = response.json()
+            self._finish(job, worker, remote["status"], remote.get("result") or remote.get("error"))
+            return True
+
+        if response.status_code != 202:
+            logger.warning("Worker %s refused job %s (HTTP %s)", worker.name, job.id, response.status_code)
+            worker.down_until = time.time() + self.DOWN_SECONDS
+            return False
+
+        worker.job = job
+        worker.remote_id = response.json()["jobId"]
+        job.status = "running"
+        job.worker = worker.name
+        job.remote_id = worker.remote_id
+        self.store.update(job)
+        logger.info("Pool job %s → %s (remote %s)", job.id, worker.name, worker.remote_id)
+        return True
+
+    # Check the jobs running on the workers
+    def _poll(self):
+        for worker in self.workers:
+            job = worker.job
+            if job is None:
+                continue
+            try:
+                response = self.session.get(f"{worker.url}/jobs/{worker.remote_id}", timeout=self.REQUEST_TIMEOUT)
+                if response.status_code == 404:
+                    # worker restarted and forgot the job, its journal reconciles it
+                    self._finish(job, worker, "unknown", None)
+                    continue
+                remote = response.json()
+            except Exception as e:
+                logger.debug("Worker %s status failed: %s", worker.name, e)
+                continue
+
+            if remote["status"] in ("succeeded", "failed", "conflict"):
+                self._finish(job, worker, remote["status"], remote.get("result") or remote.get("error"))
+
+    def _finish(self, job, worker, status, result):
+        with self.lock:
+            job.status = status
+            job.result = result
+            job.finished_at = time.time()
+            if worker is not None and worker.job is job:
+                worker.job = None
+                worker.remote_id = None
+                worker.completed += 1
+        self.store.update(job)
+        job.done.set()
+        self.wakeup.set()
+        logger.info("Pool job %s %s on %s. txn_id=%s", job.id, status, worker.name if worker else job.worker, job.transaction_id)
+
+        if job.callback_url:
+            try:
+                self.session.post(job.callback_url, json=job.to_dict(), timeout=self.REQUEST_TIMEOUT)
+            except Exception as e:
+                logger.warning("Pool job %s callback failed: %s", job.id, e)
+
+# ================== Scheduler Server ==================
+# python common/worker_pool.py workers.json [port]
+
+def create_app(scheduler):
+    from flask import Flask, request, jsonify
+
+    app = Flask(__name__)
+
+    @app.route("/payout/<bank>/jobs", methods=["POST"])
+    def post_job(bank):
+        data = request.get_json(silent=True)
+        if not data or not isinstance(data, dict):
+            return jsonify({"success": False, "message": "Invalid JSON"}), 400
+        if not any(w.bank == bank and w.holds(data) for w in scheduler.workers):
+            return jsonify({"success": False, "message": f"No worker for {bank} holds this account"}), 404
+        job = scheduler.submit(bank, data)
+        return jsonify(job.to_dict()), 202
+
+    @app.route("/payout/jobs/<job_id>", methods=["GET"])
+    def job_status(job_id):
+        job = scheduler.get(job_id)
+        if job is None:
+            return jsonify({"success": False, "message": "Unknown job"}), 404
+        return jsonify(job.to_dict())
+
+    @app.route("/payout/workers", methods=["GET"])
+    def workers():
+        return jsonify(scheduler.stats())
+
+    return app
+
+
+if __name__ == "__main__":
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s | %(levelname)s | %(message)s")
+
+    config_file = sys.argv[1] if len(sys.argv) > 1 else "workers.json"
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else 5200
+
+    with open(config_file, "r", encoding="utf-8") as f:
+        workers = json.load(f)
+    scheduler = PayoutScheduler(workers, os.path.join(os.path.dirname(os.path.abspath(config_file)), "payout_scheduler.db"))
+
+    logger.info("Payout scheduler started with %s workers on port %s", len(scheduler.workers), port)
+    create_app(scheduler).run(host="0.0.0.0", port=port, debug=False, threaded=True, use_reloader=False)